@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the decoding of the base64 gzip payloads (SCPI results and centralservice.log).
+
+Compares the previous decoding (base64.b64decode + gzip.decompress + str.splitlines) with the
+shared helper of rs_mrt_dau_utilities._decode, on small and large payloads.
+
+usage: python benchmarks/bench_decode.py
+"""
+
+import base64
+import gzip
+import json
+import timeit
+
+from rs_mrt_dau_utilities._decode import decode_base64_gzip, split_json_lines
+
+
+def make_payload(n_lines: int) -> str:
+    lines = [
+        json.dumps(
+            {
+                "hash": 1250852322484709 + i,
+                "meas": [
+                    {
+                        "timestamp": {"secs": 1633072800, "nanos": 123456789},
+                        "meas_id": "1",
+                        "origin": "Upc",
+                    }
+                ],
+            }
+        )
+        for i in range(n_lines)
+    ]
+    return base64.b64encode(gzip.compress("\n".join(lines).encode("utf-8"))).decode(
+        "ascii"
+    )
+
+
+def decode_previous(encoded: str) -> list[str]:
+    return gzip.decompress(base64.b64decode(encoded)).decode("utf-8").splitlines()
+
+
+def decode_shared(encoded: str) -> list[str]:
+    return split_json_lines(decode_base64_gzip(encoded))
+
+
+def main() -> None:
+    for name, n_lines, number in [("small", 1, 100000), ("large", 20000, 50)]:
+        encoded = make_payload(n_lines)
+        assert decode_previous(encoded) == decode_shared(encoded)
+        previous = min(timeit.repeat(lambda: decode_previous(encoded), number=number))
+        shared = min(timeit.repeat(lambda: decode_shared(encoded), number=number))
+        print(
+            f"{name:>5} payload ({len(encoded)} bytes): "
+            f"previous {previous / number * 1e6:9.1f} us, "
+            f"shared {shared / number * 1e6:9.1f} us, "
+            f"speedup x{previous / shared:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+import pytest
+
+# Scale of the synthetic data, selected with --dau-scale
+SCALES = {
+    "small": {
+        "ipanalysis": {"flows": 20, "duration_s": 10, "reports_per_s": 1},
+        "delay": {"segments": 2, "hashes_per_segment": 2_000, "meas_ids": 2},
+    },
+    "medium": {
+        "ipanalysis": {"flows": 100, "duration_s": 60, "reports_per_s": 2},
+        "delay": {"segments": 4, "hashes_per_segment": 25_000, "meas_ids": 2},
+    },
+    "large": {
+        "ipanalysis": {"flows": 500, "duration_s": 300, "reports_per_s": 4},
+        "delay": {"segments": 8, "hashes_per_segment": 100_000, "meas_ids": 4},
+    },
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--dau-scale",
+        choices=sorted(SCALES),
+        default="small",
+        help="scale of the synthetic DAU data used by the benchmarks",
+    )
+
+
+@pytest.fixture(scope="session")
+def scale(request) -> dict:
+    return SCALES[request.config.getoption("--dau-scale")]
+
+
+def _rss() -> int | None:
+    # current resident set size of the process (Linux only)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class PeakRss:
+    """
+    Samples the resident set size of the process in a thread, to measure the peak memory of a run,
+    including the memory allocated by Polars outside of the Python heap.
+
+    Attributes:
+        increase (int): The peak RSS during the run minus the RSS before it, in bytes (None if the RSS
+            cannot be read on this platform).
+    """
+
+    def __init__(self, interval_s: float = 0.001):
+        self.interval_s = interval_s
+        self.increase = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._start = self._peak = _rss()
+        if self._start is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, _rss() or 0)
+        self.increase = self._peak - self._start
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self._peak = max(self._peak, _rss() or 0)
+            time.sleep(self.interval_s)
+
+
+@pytest.fixture
+def report_throughput(benchmark):
+    """
+    Runs the function once while sampling the RSS, then benchmarks it and stores the throughput
+    (messages/s, MB/s) and the peak memory in the benchmark extra_info.
+    """
+
+    def run(function, *args, messages=None, nbytes=None, setup=None, rounds=5):
+        call_args = setup() if setup is not None else args
+        with PeakRss() as peak:
+            function(*call_args)
+
+        if setup is not None:
+            result = benchmark.pedantic(
+                function, setup=lambda: (setup(), {}), rounds=rounds
+            )
+        else:
+            result = benchmark.pedantic(function, args=args, rounds=rounds)
+
+        if peak.increase is not None:
+            benchmark.extra_info["peak_memory_mb"] = round(peak.increase / 1e6, 3)
+        if benchmark.stats is None:
+            # --benchmark-disable: the function ran once, without timing
+            return result
+        mean = benchmark.stats.stats.mean
+        if messages is not None:
+            benchmark.extra_info["messages"] = messages
+            benchmark.extra_info["messages_per_s"] = round(messages / mean)
+        if nbytes is not None:
+            benchmark.extra_info["mb"] = round(nbytes / 1e6, 3)
+            benchmark.extra_info["mb_per_s"] = round(nbytes / 1e6 / mean, 3)
+        return result
+
+    return run
@@ -0,0 +1,320 @@
+"""
+Deterministic generators of synthetic DAU data for the benchmarks:
+
+- SCPI results of FETCh:DATA:MEASurement:IPANalysis:RESult?
+- centralservice.log files containing delay measurements
+
+The same arguments (including the seed) always produce the same data.
+"""
+
+import base64
+import datetime
+import gzip
+import json
+import random
+
+DEFAULT_ORIGINS = ("Ims", "Upc", "Gnb", "Ue")
+
+_APPLICATIONS = (
+    ("YouTube", "QUIC", "www.youtube.com"),
+    ("Netflix", "TLS", "www.netflix.com"),
+    ("WhatsApp", "RTP", "web.whatsapp.com"),
+    ("Google", "HTTP", "www.google.com"),
+    ("Iperf", "TCP", "iperf.example.com"),
+)
+_SSL_VERSIONS = ("TLS1.2", "TLS1.3")
+
+
+def _timestamp(time_ns: int) -> dict:
+    return {"secs": time_ns // 1_000_000_000, "nanos": time_ns % 1_000_000_000}
+
+
+def _endpoint(rng: random.Random, port: int) -> dict:
+    return {
+        "ip": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        "flags": {
+            "V4": {
+                "is_loopback": False,
+                "is_unspecified": False,
+                "is_multicast": False,
+            }
+        },
+        "geo": None,
+        "port": port,
+    }
+
+
+def _flow_stat(rng: random.Random, flow_id: int, counters: dict, tcp: bool) -> dict:
+    # cumulative counters since the start of the flow
+    for direction in ("src_dst", "dst_src"):
+        packets = rng.randrange(1, 200)
+        counters["packet_count_" + direction] += packets
+        counters["bytes_" + direction] += packets * rng.randrange(52, 1500)
+    ip = {
+        "packet_size_src_dst": {"min": 52, "max": 1500, "avg": rng.randrange(52, 1500)},
+        "packet_size_dst_src": {"min": 52, "max": 1500, "avg": rng.randrange(52, 1500)},
+        "throughput_src_dst": {
+            "bps_min": rng.randrange(10_000),
+            "bps_max": rng.randrange(10_000, 10_000_000),
+            "bps_avg": rng.randrange(10_000, 1_000_000),
+        },
+        "throughput_dst_src": {
+            "bps_min": rng.randrange(10_000),
+            "bps_max": rng.randrange(10_000, 10_000_000),
+            "bps_avg": rng.randrange(10_000, 1_000_000),
+        },
+        "throughput_interval_bps_src_dst": rng.randrange(10_000_000),
+        "throughput_interval_bps_dst_src": rng.randrange(10_000_000),
+        "interval_duration_ms_src_dst": 1000,
+        "interval_duration_ms_dst_src": 1000,
+        **counters,
+    }
+    tcp_stat = None
+    if tcp:
+        tcp_stat = {
+            "window_scale_src_dst": 8,
+            "window_scale_dst_src": 10,
+            "max_segment_size": 1412,
+            "round_trip_time_src_dst": {
+                "ms_min": 12,
+                "ms_max": rng.randrange(13, 100),
+                "ms_avg": 13,
+                "ms_cur": rng.randrange(12, 100),
+            },
+            "fast_retransmissions_packet_count_src_dst": rng.randrange(3),
+            "fast_retransmissions_packet_count_dst_src": rng.randrange(3),
+        }
+    return {
+        "flow_id": flow_id,
+        "ip": ip,
+        "tcp": tcp_stat,
+        "rtp": None,
+        "amr": None,
+        "evs": None,
+        "is_high_speed": False,
+    }
+
+
+def generate_ipanalysis_sequences(
+    flows: int = 10,
+    duration_s: int = 10,
+    reports_per_s: int = 1,
+    start_time: int = 1_721_052_473,
+    seed: int = 0,
+) -> list[tuple[str, list[dict]]]:
+    """
+    Generates the IP analysis messages of a capture, grouped in one sequence per second.
+
+    Every flow starts in the first half of the capture with a FLOW_STARTED, UPDATE_CLASSIFICATION,
+    UPDATE_FQDN and UPDATE_SSL message, is part of every REPORT while active, and ends with a FLOW_CLOSED.
+
+    Args:
+        flows (int): The number of flows.
+        duration_s (int): The duration of the capture in seconds (one sequence per second).
+        reports_per_s (int): The number of REPORT messages per second.
+        start_time (int): The UTC start time of the capture (seconds since epoch).
+        seed (int): The seed of the random generator.
+
+    Returns:
+        list: A list of (time, messages) tuples, time being formatted as in the SCPI result.
+    """
+    rng = random.Random(seed)
+    starts = sorted(rng.randrange(max(1, duration_s // 2)) for _ in range(flows))
+    ends = [rng.randrange(start + 1, duration_s + 1) for start in starts]
+    counters = {
+        flow_id: {
+            "packet_count_src_dst": 0,
+            "packet_count_dst_src": 0,
+            "bytes_src_dst": 0,
+            "bytes_dst_src": 0,
+        }
+        for flow_id in range(flows)
+    }
+    is_tcp = [rng.random() < 0.5 for _ in range(flows)]
+
+    sequences = []
+    for second in range(duration_s):
+        second_ns = (start_time + second) * 1_000_000_000
+        messages = []
+        for flow_id in range(flows):
+            if starts[flow_id] != second:
+                continue
+            time = _timestamp(second_ns + rng.randrange(1_000_000))
+            application, protocol, fqdn = rng.choice(_APPLICATIONS)
+            messages.append(
+                {
+                    "FLOW_STARTED": {
+                        "time": time,
+                        "flow_id": flow_id,
+                        "source": _endpoint(rng, rng.randrange(1024, 65536)),
+                        "destination": _endpoint(rng, 443),
+                    }
+                }
+            )
+            messages.append(
+                {
+                    "UPDATE_CLASSIFICATION": {
+                        "time": time,
+                        "flow_id": flow_id,
+                        "classification": {
+                            "application": application,
+                            "protocol": protocol,
+                            "service": "Streaming",
+                        },
+                    }
+                }
+            )
+            messages.append(
+                {"UPDATE_FQDN": {"time": time, "flow_id": flow_id, "fqdn": fqdn}}
+            )
+            messages.append(
+                {
+                    "UPDATE_SSL": {
+                        "time": time,
+                        "flow_id": flow_id,
+                        "ssl": {"version": rng.choice(_SSL_VERSIONS), "sni": fqdn},
+                    }
+                }
+            )
+        for report in range(reports_per_s):
+            report_ns = second_ns + report * 1_000_000_000 // reports_per_s
+            active = [
+                flow_id
+                for flow_id in range(flows)
+                if starts[flow_id] <= second < ends[flow_id]
+            ]
+            messages.append(
+                {
+                    "REPORT": {
+                        "flows_stat": [
+                            _flow_stat(rng, flow_id, counters[flow_id], is_tcp[flow_id])
+                            for flow_id in active
+                        ],
+                        "time": _timestamp(report_ns),
+                    }
+                }
+            )
+        for flow_id in range(flows):
+            if ends[flow_id] == second + 1:
+                messages.append(
+                    {
+                        "FLOW_CLOSED": {
+                            "time": _timestamp(second_ns + 999_000_000),
+                            "flow_id": flow_id,
+                        }
+                    }
+                )
+        time_str = datetime.datetime.fromtimestamp(
+            start_time + second, tz=datetime.timezone.utc
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        sequences.append((time_str, messages))
+    return sequences
+
+
+def encode_scpi_result(sequences: list[tuple[str, list[dict]]]) -> bytes:
+    """
+    Encodes sequences of messages as a SCPI result of FETCh:DATA:MEASurement:IPANalysis:RESult?
+
+    Args:
+        sequences (list): A list of (time, messages) tuples.
+
+    Returns:
+        bytes: The SCPI result.
+    """
+    parts = []
+    for time, messages in sequences:
+        json_block = "\n".join(json.dumps(message) for message in messages)
+        block = base64.b64encode(gzip.compress(json_block.encode("utf-8"), mtime=0))
+        length = str(len(block))
+        parts.append(f'"{time}",#{len(length)}{length}'.encode("ascii") + block + b",")
+    return b"".join(parts)
+
+
+def generate_ipanalysis_scpi_result(
+    flows: int = 10,
+    duration_s: int = 10,
+    reports_per_s: int = 1,
+    seed: int = 0,
+) -> bytes:
+    """
+    Generates a SCPI result of FETCh:DATA:MEASurement:IPANalysis:RESult? (see generate_ipanalysis_sequences).
+    """
+    return encode_scpi_result(
+        generate_ipanalysis_sequences(
+            flows=flows, duration_s=duration_s, reports_per_s=reports_per_s, seed=seed
+        )
+    )
+
+
+def generate_centralservice_log(
+    segments: int = 1,
+    hashes_per_segment: int = 1000,
+    origins: tuple[str, ...] = DEFAULT_ORIGINS,
+    meas_ids: int = 1,
+    hashes_per_line: int = 10,
+    start_time: int = 1_748_433_393,
+    seed: int = 0,
+) -> str:
+    """
+    Generates the content of a centralservice.log file with delay measurements.
+
+    Every segment is a Start/Stop pair. Every hash traverses the given origins in order
+    ("Upc" measurements carry the meas_id, the other ones have no meas_id).
+
+    Args:
+        segments (int): The number of Start/Stop segments.
+        hashes_per_segment (int): The number of packets (hashes) per segment.
+        origins (tuple): The origins traversed by every packet, in order.
+        meas_ids (int): The number of meas_id per segment.
+        hashes_per_line (int): The number of hashes compressed in one log line.
+        start_time (int): The UTC start time of the log (seconds since epoch).
+        seed (int): The seed of the random generator.
+
+    Returns:
+        str: The content of the log file.
+    """
+    rng = random.Random(seed)
+    lines = []
+    time_ns = start_time * 1_000_000_000
+
+    def log_time(ns: int) -> str:
+        return datetime.datetime.fromtimestamp(
+            ns / 1_000_000_000, tz=datetime.timezone.utc
+        ).isoformat()
+
+    for _ in range(segments):
+        lines.append(
+            f"{log_time(time_ns)}  INFO centralservice::delay_meas_core: Start msg from FSW received"
+        )
+        time_ns += 1_000_000
+        records = []
+        for _ in range(hashes_per_segment):
+            meas_id = str(rng.randrange(1, meas_ids + 1))
+            packet_ns = time_ns
+            meas = []
+            for origin in origins:
+                packet_ns += rng.randrange(10_000, 100_000)
+                item = {"timestamp": _timestamp(packet_ns), "origin": origin}
+                if origin == "Upc":
+                    item["meas_id"] = meas_id
+                meas.append(item)
+            records.append(json.dumps({"hash": rng.getrandbits(63), "meas": meas}))
+            time_ns += rng.randrange(100_000, 1_000_000)
+            if len(records) == hashes_per_line:
+                lines.append(_data_line(log_time(time_ns), records))
+                records = []
+        if records:
+            lines.append(_data_line(log_time(time_ns), records))
+        time_ns += 1_000_000
+        lines.append(
+            f"{log_time(time_ns)}  INFO centralservice::delay_meas_core: Stop msg from FSW received"
+        )
+        time_ns += 1_000_000_000
+    return "\n".join(lines) + "\n"
+
+
+def _data_line(time: str, records: list[str]) -> str:
+    data = base64.b64encode(
+        gzip.compress("\n".join(records).encode("utf-8"), mtime=0)
+    ).decode("ascii")
+    return f"{time}  INFO centralservice::delay_meas_core: mime=application/json, data={data}"
@@ -0,0 +1,78 @@
+import io
+
+import polars as pl
+import pytest
+from generators import generate_centralservice_log, generate_ipanalysis_scpi_result
+
+from rs_mrt_dau_utilities.delay_meas.dev import delay_parse_log
+from rs_mrt_dau_utilities.ip_analysis.ndjson import ipanalysis_read_scpi_result
+
+# Memory and group_by speed of the low-cardinality columns (origin and meas_id of the delay measurement,
+# application, protocol and SSL version of the IP analysis) stored as String or Categorical.
+# The memory is the size of the Arrow buffers of the columns (uncompressed IPC), as estimated_size
+# underestimates the String view columns.
+
+
+@pytest.fixture(scope="module")
+def log_file(scale, tmp_path_factory):
+    path = tmp_path_factory.mktemp("categorical") / "centralservice.log"
+    path.write_text(generate_centralservice_log(**scale["delay"]))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def scpi_result(scale):
+    return generate_ipanalysis_scpi_result(**scale["ipanalysis"])
+
+
+def buffers_mb(df: pl.DataFrame) -> float:
+    buffer = io.BytesIO()
+    df.write_ipc(buffer, compression="uncompressed")
+    return round(buffer.tell() / 1e6, 3)
+
+
+@pytest.mark.parametrize("categorical", [False, True], ids=["string", "categorical"])
+def test_delay_group_by_origin(benchmark, log_file, categorical):
+    hash_df = delay_parse_log(log_file, categorical=categorical)["hash"]
+
+    def group_by_origin(df):
+        return df.group_by("meas_id", "origin").agg(
+            pl.len(),
+            pl.col("timestamp").min().alias("first"),
+            pl.col("timestamp").max().alias("last"),
+        )
+
+    result = benchmark.pedantic(group_by_origin, args=(hash_df,), rounds=10)
+    benchmark.extra_info["columns_mb"] = buffers_mb(hash_df.select("meas_id", "origin"))
+    if benchmark.stats is not None:
+        benchmark.extra_info["rows_per_s"] = round(
+            hash_df.height / benchmark.stats.stats.mean
+        )
+    assert not result.is_empty()
+
+
+@pytest.mark.parametrize("categorical", [False, True], ids=["string", "categorical"])
+def test_ipanalysis_group_by_application(benchmark, scpi_result, categorical):
+    dfs = ipanalysis_read_scpi_result(scpi_result, categorical=categorical)
+    # every report labelled with the application, protocol and SSL version of its flow
+    labels = ["classification_application", "classification_protocol", "ssl_version"]
+    report = (
+        dfs["report"]
+        .join(dfs["upd_classification"].drop("time"), on="flow_id", how="left")
+        .join(dfs["upd_ssl"].drop("time"), on="flow_id", how="left")
+    )
+
+    def group_by_application(df):
+        return df.group_by(labels).agg(
+            pl.len(),
+            pl.col("ip_bytes_src_dst").sum(),
+            pl.col("ip_bytes_dst_src").sum(),
+        )
+
+    result = benchmark.pedantic(group_by_application, args=(report,), rounds=10)
+    benchmark.extra_info["columns_mb"] = buffers_mb(report.select(labels))
+    if benchmark.stats is not None:
+        benchmark.extra_info["rows_per_s"] = round(
+            report.height / benchmark.stats.stats.mean
+        )
+    assert not result.is_empty()
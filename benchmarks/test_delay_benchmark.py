@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+from generators import generate_centralservice_log
+
+from rs_mrt_dau_utilities.delay_meas.dev import (
+    delay_get_segment,
+    delay_get_start_stop_segment,
+    delay_parse_log,
+)
+
+
+@pytest.fixture(scope="module")
+def log_file(scale, tmp_path_factory):
+    path = tmp_path_factory.mktemp("delay") / "centralservice.log"
+    path.write_text(generate_centralservice_log(**scale["delay"]))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def parsed_log(log_file):
+    return delay_parse_log(log_file)
+
+
+@pytest.fixture(scope="module")
+def segments(parsed_log):
+    return delay_get_start_stop_segment(parsed_log["command"], parsed_log["hash"])
+
+
+@pytest.mark.parametrize("json_backend", ["stdlib", "orjson", "msgspec"])
+def test_delay_parse_log(report_throughput, log_file, scale, json_backend):
+    if json_backend != "stdlib":
+        pytest.importorskip(json_backend)
+    with open(log_file, "rb") as f:
+        nbytes = len(f.read())
+    result = report_throughput(
+        lambda path: delay_parse_log(path, json_backend=json_backend),
+        log_file,
+        messages=scale["delay"]["segments"] * scale["delay"]["hashes_per_segment"],
+        nbytes=nbytes,
+    )
+    assert not result["hash"].is_empty()
+
+
+def test_delay_get_start_stop_segment(report_throughput, parsed_log, scale):
+    result = report_throughput(
+        delay_get_start_stop_segment,
+        parsed_log["command"],
+        parsed_log["hash"],
+        messages=parsed_log["hash"].height,
+    )
+    assert len(result) == scale["delay"]["segments"]
+
+
+@pytest.mark.parametrize("max_gap", [None, 1], ids=["hash", "packet"])
+@pytest.mark.parametrize("layout", ["wide", "long"])
+def test_delay_get_segment(report_throughput, segments, layout, max_gap):
+    if max_gap is not None:
+        max_gap = datetime.timedelta(seconds=max_gap)
+    result = report_throughput(
+        lambda s: delay_get_segment(s, layout=layout, max_gap=max_gap),
+        segments,
+        messages=sum(segment.height for segment in segments),
+    )
+    assert result
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["rs_mrt_dau_utilities.delay_meas", "rs_mrt_dau_utilities.ip_analysis"],
+)
+def test_import_time(benchmark, module):
+    # a fresh interpreter per round: the start-up time of the batch workers and CLI jobs
+    benchmark.pedantic(
+        subprocess.run,
+        args=([sys.executable, "-c", f"import {module}"],),
+        kwargs={"check": True},
+        rounds=5,
+    )
@@ -0,0 +1,120 @@
+import pytest
+from generators import encode_scpi_result, generate_ipanalysis_sequences
+
+from rs_mrt_dau_utilities.ip_analysis.ip_analysis import (
+    ipanalysis_init_dataframes,
+    ipanalysis_parse_scpi_result,
+    ipanalysis_update_dataframes,
+)
+from rs_mrt_dau_utilities.ip_analysis.archive import (
+    ScpiArchiveWriter,
+    ipanalysis_replay,
+)
+from rs_mrt_dau_utilities.ip_analysis.ndjson import ipanalysis_read_scpi_result
+
+
+@pytest.fixture(scope="module")
+def sequences(scale):
+    return generate_ipanalysis_sequences(**scale["ipanalysis"])
+
+
+@pytest.fixture(scope="module")
+def scpi_result(sequences):
+    return encode_scpi_result(sequences)
+
+
+def count_messages(sequences):
+    return sum(len(messages) for _, messages in sequences)
+
+
+@pytest.mark.parametrize("json_backend", ["stdlib", "orjson", "msgspec"])
+def test_ipanalysis_parse_scpi_result(
+    report_throughput, sequences, scpi_result, json_backend
+):
+    if json_backend != "stdlib":
+        pytest.importorskip(json_backend)
+    result = report_throughput(
+        lambda data: ipanalysis_parse_scpi_result(data, json_backend=json_backend),
+        scpi_result,
+        messages=count_messages(sequences),
+        nbytes=len(scpi_result),
+    )
+    assert len(result) == len(sequences)
+
+
+def test_ipanalysis_parse_scpi_result_str(report_throughput, sequences, scpi_result):
+    scpi_result_str = scpi_result.decode("ascii")
+    report_throughput(
+        ipanalysis_parse_scpi_result,
+        scpi_result_str,
+        messages=count_messages(sequences),
+        nbytes=len(scpi_result),
+    )
+
+
+def test_ipanalysis_update_dataframes(report_throughput, scpi_result):
+    parsed_sequences = ipanalysis_parse_scpi_result(scpi_result)
+    messages = [m for sequence in parsed_sequences for m in sequence["json_messages"]]
+
+    def update_all(list_of_dfs):
+        for message in messages:
+            ipanalysis_update_dataframes(list_of_dfs, message)
+        return list_of_dfs
+
+    result = report_throughput(
+        update_all,
+        messages=len(messages),
+        setup=lambda: (ipanalysis_init_dataframes(),),
+        rounds=3,
+    )
+    assert not result["report"].is_empty()
+
+
+@pytest.mark.parametrize("nested", [True, False], ids=["nested", "flat"])
+def test_ipanalysis_read_scpi_result(report_throughput, sequences, scpi_result, nested):
+    result = report_throughput(
+        lambda data: ipanalysis_read_scpi_result(data, nested=nested),
+        scpi_result,
+        messages=count_messages(sequences),
+        nbytes=len(scpi_result),
+    )
+    assert not result["report"].is_empty()
+
+
+def test_ipanalysis_read_scpi_result_columns(report_throughput, sequences, scpi_result):
+    # only the byte and packet counters of the reports
+    columns = {"report": ["ip_bytes_*", "ip_packet_count_*"]}
+    result = report_throughput(
+        lambda data: ipanalysis_read_scpi_result(data, nested=False, columns=columns),
+        scpi_result,
+        messages=count_messages(sequences),
+        nbytes=len(scpi_result),
+    )
+    assert not result["report"].is_empty()
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory, sequences):
+    # one recorded poll per 10 sequences
+    path = tmp_path_factory.mktemp("archive") / "capture.scpiarc"
+    with ScpiArchiveWriter(path) as writer:
+        for i in range(0, len(sequences), 10):
+            writer.write(encode_scpi_result(sequences[i : i + 10]), instrument="cmx1")
+    return path
+
+
+def test_ipanalysis_replay(report_throughput, sequences, archive):
+    # offline replay of recorded polls through the native reader
+    def replay(path):
+        return sum(
+            parsed["report"].height
+            for _, parsed in ipanalysis_replay(path, parser=ipanalysis_read_scpi_result)
+        )
+
+    rows = report_throughput(
+        replay,
+        archive,
+        messages=count_messages(sequences),
+        nbytes=archive.stat().st_size,
+    )
+    assert rows > 0
@@ -0,0 +1,21 @@
+from collections.abc import Sequence
+
+import polars as pl
+
+# Low-cardinality String columns (origin, command, application, protocol...) are stored as Categorical:
+# every value is stored once and the rows only hold a small integer code.
+# The categories are global in Polars, so the columns of different frames can be joined, concatenated
+# and grouped without re-encoding.
+
+
+def encode_categorical(df: pl.DataFrame, columns: Sequence[str]) -> pl.DataFrame:
+    """
+    Casts the String columns of df which are listed in columns to Categorical (the other ones are left as is).
+    """
+    schema = df.schema
+    encoded = [
+        pl.col(column).cast(pl.Categorical)
+        for column in columns
+        if schema.get(column) == pl.String
+    ]
+    return df.with_columns(encoded) if encoded else df
@@ -0,0 +1,76 @@
+import binascii
+import zlib
+
+# Shared decoding of the base64 gzip payloads found in the SCPI results and in the centralservice.log file.
+# gzip.decompress parses the gzip header in Python and creates several intermediate objects for every
+# payload; for the many small payloads of the DAU, zlib with the gzip window (wbits=31) is faster.
+# see benchmarks/bench_decode.py
+
+_GZIP_WBITS = 31
+
+BytesLike = bytes | bytearray | memoryview
+
+
+def gunzip(data: BytesLike) -> bytes:
+    """
+    Decompresses gzip data, possibly made of several gzip members.
+
+    Args:
+        data (bytes-like): The gzip compressed data.
+
+    Returns:
+        bytes: The decompressed data.
+    """
+    if not data:
+        return b""
+    decompressor = zlib.decompressobj(wbits=_GZIP_WBITS)
+    result = decompressor.decompress(data)
+    if not decompressor.eof:
+        raise EOFError(
+            "Compressed file ended before the end-of-stream marker was reached"
+        )
+    if not decompressor.unused_data:
+        return result
+    # concatenated gzip members
+    parts = [result]
+    unused_data = decompressor.unused_data
+    while unused_data:
+        decompressor = zlib.decompressobj(wbits=_GZIP_WBITS)
+        parts.append(decompressor.decompress(unused_data))
+        if not decompressor.eof:
+            raise EOFError(
+                "Compressed file ended before the end-of-stream marker was reached"
+            )
+        unused_data = decompressor.unused_data
+    return b"".join(parts)
+
+
+def decode_base64_gzip(encoded: str | BytesLike) -> bytes:
+    """
+    Decodes a base64 block containing gzip data.
+    Characters outside of the base64 alphabet (quotes, commas, newlines) are ignored.
+
+    Args:
+        encoded (str | bytes-like): The base64 block (str must be ASCII).
+
+    Returns:
+        bytes: The decompressed data.
+    """
+    return gunzip(binascii.a2b_base64(encoded))
+
+
+def split_json_lines(data: bytes) -> list[str]:
+    """
+    Splits decompressed newline-delimited JSON into its lines.
+
+    The block is decoded to text once: the stdlib JSON parser is faster on str than on
+    bytes, which it decodes again for every line.
+
+    Args:
+        data (bytes): The newline-delimited JSON data (UTF-8).
+
+    Returns:
+        list: The JSON lines.
+    """
+    text = data.decode("utf-8").strip()
+    return text.split("\n") if text else []
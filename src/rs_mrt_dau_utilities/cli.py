@@ -0,0 +1,409 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import sys
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+
+import polars as pl
+
+from .delay_meas.dev import delay_group_log_files
+from .quarantine import PARSE_ERRORS
+
+# Command line tool for the batch processing of many log files and SCPI dumps.
+# examples of use:
+#   dau-utils delay extract "logs/**/centralservice.log*" -o results --format parquet
+#   dau-utils delay summary "logs/**/centralservice.log*" -o summary.csv
+#   dau-utils ipanalysis convert "captures/*.scpi" -o dataset
+#   dau-utils plot "logs/**/centralservice.log*" -o plots
+# The files are processed in a process pool (--jobs, one process per CPU by default). The rotations of a
+# log (centralservice.log.1, .2.gz...) are processed together with the log, so that a segment can span a rotation.
+# A file that cannot be processed is reported and does not stop the others; the exit code is then 1.
+
+_DELAY_FORMATS = ("parquet", "csv")
+_IPANALYSIS_FORMATS = ("parquet", "ipc", "csv")
+
+# the errors of a file reported as a failed file, the other files are still processed
+_FILE_ERRORS = (*PARSE_ERRORS, OSError, RuntimeError, pl.exceptions.PolarsError)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """
+    Entry point of the dau-utils command.
+
+    Args:
+        argv (Sequence): The command line arguments (sys.argv[1:] by default).
+
+    Returns:
+        int: The exit code, 0 when all the files were processed successfully.
+    """
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    files = expand_globs(args.inputs)
+    if not files:
+        parser.error(f"no file matches {' '.join(args.inputs)}")
+    return args.handler(args, files)
+
+
+def expand_globs(patterns: Sequence[str]) -> list[Path]:
+    """
+    Expands glob patterns ("**" matches any number of directories) into a sorted list of files.
+    A pattern without a match is kept as is when it is an existing file name.
+
+    Args:
+        patterns (Sequence): The glob patterns or file names.
+
+    Returns:
+        list: The files, without duplicates.
+    """
+    files: dict[Path, None] = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        for match in matches:
+            if os.path.isfile(match):
+                files[Path(match)] = None
+    return list(files)
+
+
+def _output_names(files: list[Path]) -> list[str]:
+    """
+    Returns a name per input file used for the outputs: the file name without extension
+    when it is unique, else the path relative to the common directory (e.g. rotated logs
+    named centralservice.log in one directory per drive test).
+    """
+    stems = [file.stem for file in files]
+    if len(set(stems)) == len(stems):
+        return stems
+    paths = [os.path.abspath(file) for file in files]
+    common = os.path.commonpath(paths)
+    return [
+        os.path.relpath(path, common).replace(os.sep, "_").replace(".", "_")
+        for path in paths
+    ]
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="dau-utils",
+        description="Batch processing of Rohde & Schwarz MRT DAU log files and SCPI results.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser: argparse.ArgumentParser, errors: str) -> None:
+        subparser.add_argument(
+            "inputs", nargs="+", help="files or glob patterns (quote them)"
+        )
+        subparser.add_argument(
+            "--errors",
+            choices=("raise", "skip"),
+            default=errors,
+            help=f"malformed lines or messages fail the file or are skipped (default: {errors})",
+        )
+        subparser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="number of worker processes (default: number of CPUs)",
+        )
+        subparser.add_argument(
+            "-q", "--quiet", action="store_true", help="do not report the progress"
+        )
+
+    delay = commands.add_parser(
+        "delay", help="delay measurements from centralservice.log files"
+    )
+    delay_commands = delay.add_subparsers(dest="delay_command", required=True)
+
+    extract = delay_commands.add_parser(
+        "extract", help="write the delay dataframes of every segment and meas_id"
+    )
+    add_common(extract, errors="raise")
+    extract.add_argument("-o", "--output", required=True, help="output directory")
+    extract.add_argument("--format", choices=_DELAY_FORMATS, default="parquet")
+    extract.add_argument("--layout", choices=("wide", "long"), default="wide")
+    extract.set_defaults(handler=_run_delay_extract)
+
+    summary = delay_commands.add_parser(
+        "summary", help="delay statistics per file, segment and meas_id"
+    )
+    add_common(summary, errors="raise")
+    summary.add_argument(
+        "-o", "--output", help="output file (.parquet or .csv), printed if omitted"
+    )
+    summary.set_defaults(handler=_run_delay_summary)
+
+    ipanalysis = commands.add_parser(
+        "ipanalysis",
+        help="IP analysis results (FETCh:DATA:MEASurement:IPANalysis:RESult?)",
+    )
+    ipanalysis_commands = ipanalysis.add_subparsers(
+        dest="ipanalysis_command", required=True
+    )
+    convert = ipanalysis_commands.add_parser(
+        "convert",
+        help="convert SCPI result dumps or archives (ScpiArchiveWriter) to dataframes",
+    )
+    add_common(convert, errors="skip")
+    convert.add_argument("-o", "--output", required=True, help="output directory")
+    convert.add_argument(
+        "--format",
+        choices=_IPANALYSIS_FORMATS,
+        default="parquet",
+        help="parquet/ipc: partitioned dataset (see scan_ipanalysis), csv: one file per category",
+    )
+    convert.set_defaults(handler=_run_ipanalysis_convert)
+
+    plot = commands.add_parser(
+        "plot", help="plot the delays of centralservice.log files to HTML"
+    )
+    add_common(plot, errors="raise")
+    plot.add_argument("-o", "--output", required=True, help="output directory")
+    plot.set_defaults(handler=_run_plot)
+
+    return parser
+
+
+def _log_sets(files: list[Path]) -> tuple[list[tuple[str, list[str]]], list[str]]:
+    """
+    Groups the log files with their rotations.
+
+    Returns:
+        tuple: The (name of the log, files from the oldest rotation) of every log, and their output names.
+    """
+    log_sets = list(delay_group_log_files(files).items())
+    return log_sets, _output_names([Path(log) for log, _ in log_sets])
+
+
+def _run_delay_extract(args: argparse.Namespace, files: list[Path]) -> int:
+    log_sets, names = _log_sets(files)
+    tasks = [
+        (
+            _delay_extract,
+            (log, log_files, args.output, name, args.format, args.layout, args.errors),
+        )
+        for (log, log_files), name in zip(log_sets, names)
+    ]
+    return _run_tasks(tasks, args.jobs, args.quiet)[1]
+
+
+def _run_delay_summary(args: argparse.Namespace, files: list[Path]) -> int:
+    log_sets, _ = _log_sets(files)
+    tasks = [
+        (_delay_summary, (log, log_files, args.errors)) for log, log_files in log_sets
+    ]
+    results, exit_code = _run_tasks(tasks, args.jobs, args.quiet)
+    frames = [df for df in results if df is not None]
+    # a log without measurement has an empty summary, with only the file and measurement columns
+    summary = pl.concat(frames, how="diagonal_relaxed") if frames else pl.DataFrame()
+    if args.output is None:
+        with pl.Config(tbl_rows=-1, tbl_cols=-1):
+            print(summary)
+    else:
+        _write_frame(summary, Path(args.output))
+    return exit_code
+
+
+def _run_ipanalysis_convert(args: argparse.Namespace, files: list[Path]) -> int:
+    tasks = [
+        (_ipanalysis_convert, (str(file), args.output, name, args.format, args.errors))
+        for file, name in zip(files, _output_names(files))
+    ]
+    return _run_tasks(tasks, args.jobs, args.quiet)[1]
+
+
+def _run_plot(args: argparse.Namespace, files: list[Path]) -> int:
+    log_sets, names = _log_sets(files)
+    tasks = [
+        (_plot, (log, log_files, args.output, name, args.errors))
+        for (log, log_files), name in zip(log_sets, names)
+    ]
+    return _run_tasks(tasks, args.jobs, args.quiet)[1]
+
+
+def _run_tasks(
+    tasks: list[tuple[Callable, tuple]], jobs: int, quiet: bool
+) -> tuple[list, int]:
+    """
+    Runs the tasks in a process pool (in this process when jobs is 1) and reports the progress on stderr.
+    The first argument of every task is the file (or log) reported.
+
+    Returns:
+        tuple: The results in the order of the tasks (None for a failed task) and the exit code.
+    """
+    results: list = [None] * len(tasks)
+    failures = 0
+
+    def report(done: int, index: int, message: str) -> None:
+        if not quiet:
+            print(
+                f"[{done}/{len(tasks)}] {tasks[index][1][0]}: {message}",
+                file=sys.stderr,
+            )
+
+    if jobs <= 1 or len(tasks) == 1:
+        for done, (index, (function, arguments)) in enumerate(enumerate(tasks), 1):
+            try:
+                results[index] = function(*arguments)
+            except _FILE_ERRORS as exc:
+                failures += 1
+                report(done, index, f"failed: {exc!r}")
+            else:
+                report(done, index, _describe(results[index]))
+    else:
+        # polars is multithreaded: forking a process using it may deadlock
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(function, *arguments): index
+                for index, (function, arguments) in enumerate(tasks)
+            }
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except _FILE_ERRORS as exc:
+                    failures += 1
+                    report(done, index, f"failed: {exc!r}")
+                else:
+                    report(done, index, _describe(results[index]))
+
+    if failures and not quiet:
+        print(f"{failures} of {len(tasks)} files failed", file=sys.stderr)
+    return results, 1 if failures else 0
+
+
+def _describe(result: object) -> str:
+    if isinstance(result, pl.DataFrame):
+        return f"{result.height} rows"
+    return str(result)
+
+
+# The workers below run in the pool processes: they import the modules they need
+# and write their outputs themselves, only small results are sent back.
+
+
+def _delay_extract(
+    log: str,
+    log_files: list[str],
+    output: str,
+    name: str,
+    format: str,
+    layout: str,
+    errors: str,
+) -> str:
+    from .delay_meas.delay_meas import extract_delay_from_log
+
+    measurements = extract_delay_from_log(log_files, layout=layout, errors=errors)
+    directory = Path(output) / name
+    rows = 0
+    for key, df in measurements.items():
+        _write_frame(df, directory / f"{key}.{format}")
+        rows += df.height
+    return f"{len(measurements)} results, {rows} packets"
+
+
+def _delay_summary(log: str, log_files: list[str], errors: str) -> pl.DataFrame:
+    from .delay_meas.delay_meas import extract_delay_from_log
+
+    measurements = extract_delay_from_log(log_files, layout="wide", errors=errors)
+    frames = [
+        df.select(
+            pl.lit(log).alias("file"),
+            pl.lit(key).alias("measurement"),
+            pl.len().alias("packets"),
+            pl.col("delay_global_us").min().alias("delay_min_us"),
+            pl.col("delay_global_us").mean().alias("delay_mean_us"),
+            pl.col("delay_global_us").median().alias("delay_median_us"),
+            pl.col("delay_global_us").quantile(0.99).alias("delay_p99_us"),
+            pl.col("delay_global_us").max().alias("delay_max_us"),
+        ).cast({"delay_min_us": pl.Float64, "delay_max_us": pl.Float64})
+        for key, df in measurements.items()
+    ]
+    if not frames:
+        return pl.DataFrame(schema={"file": pl.String, "measurement": pl.String})
+    return pl.concat(frames, how="diagonal_relaxed")
+
+
+def _ipanalysis_convert(
+    scpi_file: str, output: str, name: str, format: str, errors: str
+) -> str:
+    from .ip_analysis.archive import ScpiArchiveReader, is_scpi_archive
+    from .ip_analysis.dedup import IpanalysisDeduplicator
+    from .ip_analysis.ip_analysis import ipanalysis_init_dataframes
+    from .ip_analysis.ndjson import ipanalysis_read_scpi_result
+    from .ip_analysis.storage import ipanalysis_write_dataframes
+
+    def payloads() -> Iterator[tuple[bytes, str]]:
+        if is_scpi_archive(scpi_file):
+            with ScpiArchiveReader(scpi_file) as reader:
+                for record in reader:
+                    yield record.payload, record.instrument
+        else:
+            yield Path(scpi_file).read_bytes(), ""
+
+    # recorded polls: the sequences repeated by consecutive polls of an instrument are skipped
+    dedup: dict[str, IpanalysisDeduplicator] = {}
+    # the messages of every poll are read at once, then the polls are concatenated per category
+    frames: dict[str, list[pl.DataFrame]] = {}
+    for scpi_result, instrument in payloads():
+        poll = ipanalysis_read_scpi_result(
+            scpi_result,
+            nested=False,
+            errors=errors,
+            dedup=dedup.setdefault(instrument, IpanalysisDeduplicator()),
+        )
+        for category, df in poll.items():
+            if not df.is_empty():
+                frames.setdefault(category, []).append(df)
+    list_of_dfs = ipanalysis_init_dataframes()
+    for category, dfs in frames.items():
+        list_of_dfs[category] = pl.concat(dfs, how="diagonal_relaxed")
+    if format == "csv":
+        for category, df in list_of_dfs.items():
+            if not df.is_empty():
+                _write_frame(df, Path(output) / name / f"{category}.csv")
+    else:
+        ipanalysis_write_dataframes(list_of_dfs, output, capture=name, format=format)
+    return f"{sum(df.height for df in list_of_dfs.values())} rows"
+
+
+def _plot(log: str, log_files: list[str], output: str, name: str, errors: str) -> str:
+    from .delay_meas.delay_meas import extract_delay_from_log
+    from .delay_meas.plot import plot_all
+
+    measurements = extract_delay_from_log(log_files, errors=errors)
+    Path(output).mkdir(parents=True, exist_ok=True)
+    for key, df in measurements.items():
+        plot_all(df).save(str(Path(output) / f"{name}_{key}.html"))
+    return f"{len(measurements)} plots"
+
+
+def _write_frame(df: pl.DataFrame, file: Path) -> None:
+    """
+    Writes a dataframe to a Parquet or CSV file depending on the file extension.
+    """
+    file.parent.mkdir(parents=True, exist_ok=True)
+    if file.suffix == ".csv":
+        # CSV has no nested types: store them as JSON strings
+        nested = [name for name, dtype in df.schema.items() if dtype.is_nested()]
+        if nested:
+            df = df.with_columns(
+                pl.Series(name, [json.dumps(value) for value in df[name].to_list()])
+                for name in nested
+            )
+        df.write_csv(file)
+    elif file.suffix == ".parquet":
+        df.write_parquet(file)
+    else:
+        raise ValueError(f"unsupported output file type: {file}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,14 @@
-from .delay_meas import extract_delay_from_log, plot_all
+from .delay_meas import extract_delay_from_log
+from .log_index import DelayLogIndex
 
-__all__ = ["extract_delay_from_log", "plot_all"]
+__all__ = ["DelayLogIndex", "extract_delay_from_log", "plot_all"]
+
+
+def __getattr__(name: str):
+    # plot_all needs Altair, which takes hundreds of milliseconds to import:
+    # load it on first use only (PEP 562)
+    if name == "plot_all":
+        from .plot import plot_all
+
+        return plot_all
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
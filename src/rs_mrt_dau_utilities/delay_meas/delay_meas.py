@@ -1,10 +1,38 @@
-import altair as alt
+import datetime
+from collections.abc import Sequence
+
 import polars as pl
 
-from .dev import delay_get_segment, delay_get_start_stop_segment, delay_parse_log
+from ..json_backend import JsonBackend
+from ..quarantine import Quarantine
+from ..stats import PipelineStats
+from .dev import (
+    LogFiles,
+    delay_get_segment,
+    delay_get_start_stop_segment,
+    delay_parse_log,
+    delay_resolve_log_files,
+)
+from .log_index import DelayLogIndex
 
 
-def extract_delay_from_log(log_file: str) -> dict[str, pl.DataFrame]:
+def extract_delay_from_log(
+    log_file: LogFiles,
+    layout: str = "wide",
+    stats: PipelineStats | None = None,
+    errors: str = "raise",
+    quarantine: Quarantine | None = None,
+    meas_ids: Sequence | None = None,
+    time_range: tuple[datetime.datetime | None, datetime.datetime | None] | None = None,
+    require_origin: str | None = "Upc",
+    max_parallel: int | None = None,
+    categorical: bool = True,
+    json_backend: str | JsonBackend | None = None,
+    index: bool = False,
+    segment: int | None = None,
+    max_gap: datetime.timedelta | None = None,
+    max_workers: int | None = 1,
+) -> dict[str, pl.DataFrame]:
     """
     Extract delay information from the centralservice.log file.
     This file is located in the following directory:
@@ -15,41 +43,84 @@ def extract_delay_from_log(log_file: str) -> dict[str, pl.DataFrame]:
     - "1_2": first segment (start-stop) and second meas_id
     - "2_1": second segment (start-stop) and first meas_id
     - ...
+    log_file may be a list or a glob pattern of rotated log files (including .gz archives), which are merged by timestamp.
+    max_workers sets the number of worker processes parsing the files (None: one per CPU, 1: in this process),
+    see delay_parse_log.
+    With layout="long", every DataFrame has one row per hop: (hash, hop_from, hop_to, delay_us).
+    If stats (PipelineStats) is given, the time spent in every stage of the extraction is recorded.
+    errors ("raise", "skip" or "collect") sets the handling of malformed lines, see delay_parse_log.
+    meas_ids, time_range and require_origin are applied while parsing, see delay_parse_log: only the given
+    meas_ids, and the packets whose first measurement is in time_range, are extracted. The packets which did
+    not reach require_origin ("Upc" by default) have no delay and are dropped. Both are checked per packet
+    (a hash within a segment, split by max_gap), as the measurements of a packet may be logged on several lines.
+    The segments and meas_ids are computed concurrently, at most max_parallel at a time (None: all).
+    With categorical (default), the low-cardinality columns are parsed as Categorical, see delay_parse_log.
+    json_backend selects the JSON decoder of the records ("auto", "msgspec", "orjson" or "stdlib"), see delay_parse_log.
+    With index=True, only the part of the log covering time_range is parsed, found with the sidecar index of the log
+    (see delay_parse_log and DelayLogIndex).
+    segment (1-based) only extracts this segment of a single uncompressed log: the lines of the segment are found
+    with the index of the log, and the keys keep the number of the segment (e.g. "3_1").
+    max_gap splits the measurements of a hash into packets wherever they are more than max_gap apart
+    (identical payloads, e.g. repeated pings, have the same hash), see delay_get_segment.
     """
+    window = None
+    if segment is not None:
+        files = delay_resolve_log_files(log_file)
+        if len(files) != 1 or files[0].endswith(".gz"):
+            raise ValueError("segment requires a single uncompressed log file")
+        segments = DelayLogIndex.open(files[0]).segments()
+        if not 1 <= segment <= len(segments):
+            raise ValueError(
+                f"segment must be between 1 and {len(segments)}, got {segment}"
+            )
+        window = segments[segment - 1]
+
     # Parse the log file to extract delay information
-    parsed_data = delay_parse_log(log_file)
+    parsed_data = delay_parse_log(
+        log_file,
+        stats=stats,
+        errors=errors,
+        quarantine=quarantine,
+        meas_ids=meas_ids,
+        time_range=time_range,
+        require_origin=require_origin,
+        categorical=categorical,
+        json_backend=json_backend,
+        index=index,
+        window=window,
+        max_gap=max_gap,
+        max_workers=max_workers,
+    )
 
     # Get start and stop segments from the command DataFrame
     results_per_segment = delay_get_start_stop_segment(
-        parsed_data["command"], parsed_data["hash"]
+        parsed_data["command"], parsed_data["hash"], stats=stats
     )
+    if segment is not None:
+        results_per_segment = results_per_segment[segment - 1 : segment]
 
     # Get segments of data based on the extracted start and stop times
-    result_per_hash = delay_get_segment(results_per_segment)
+    result_per_hash = delay_get_segment(
+        results_per_segment,
+        layout=layout,
+        stats=stats,
+        max_parallel=max_parallel,
+        max_gap=max_gap,
+    )
+    if segment is not None:
+        # "1_<meas>" -> "<segment>_<meas>"
+        result_per_hash = {
+            f"{segment}_{key.split('_', 1)[1]}": df
+            for key, df in result_per_hash.items()
+        }
 
     return result_per_hash
 
 
-def plot_all(results_one_segment: pl.DataFrame) -> alt.RepeatChart:
-    """
-    Plot all the delays found for this measurement.
-    """
-    items = results_one_segment.columns
-    filtered_items = [item for item in items if item.startswith("delay")]
-
-    chart = (
-        alt.Chart(results_one_segment)
-        .mark_point()
-        .encode(
-            # x='min_time:T',
-            # alt.X(items[1], title='time'),
-            alt.X(alt.repeat("column"), type="temporal", title="time"),
-            alt.Y(alt.repeat("row"), type="quantitative"),
-            # y=r'ip\.throughput_interval_bps_dst_src:Q',
-            # color='flow_id',
-        )
-        .properties(width=1100, height=300)
-        .repeat(row=filtered_items, column=[items[1]])
-        .interactive()
-    )
-    return chart
+def __getattr__(name: str):
+    # plot_all moved to the plot module, which is only imported on first use (Altair is slow to import)
+    if name == "plot_all":
+        from .plot import plot_all
+
+        return plot_all
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,73 +1,630 @@
-import base64
+import binascii
+import concurrent.futures
 import datetime
+import functools
+import glob
 import gzip
-import json
+import io
+import logging
+import multiprocessing
+import os
 import re
+from collections.abc import Callable, Sequence
+from time import perf_counter
+from typing import IO, Any
 
 import polars as pl
 
+from .._categorical import encode_categorical
+from .._decode import gunzip, split_json_lines
+from ..json_backend import JsonBackend, get_json_backend, msgspec_loads
+from ..quarantine import PARSE_ERRORS, Quarantine, check_error_policy, error_stage
+from ..stats import PipelineStats
+from ..time_index import TimeIndex
+from ..timestamps import to_epoch_ns
+from .log_index import DEFAULT_LAG, INDEX_SUFFIX, DelayLogIndex
 
-def delay_parse_log(log_file: str) -> dict[str, pl.DataFrame]:
+_HASH_LINE = re.compile(
+    r"(.*) INFO centralservice::delay_meas_core: mime=.*, data=(.*)"
+)
+_COMMAND_LINE = re.compile(
+    r"(.*)  INFO centralservice::delay_meas_core: (.*) msg from FSW received"
+)
+
+logger = logging.getLogger(__name__)
+
+# one log file, a glob pattern or a list of them (e.g. the rotations of centralservice.log)
+LogFiles = str | os.PathLike | Sequence[str | os.PathLike]
+
+# (start, end) datetimes, either may be None
+TimeRange = tuple[datetime.datetime | None, datetime.datetime | None]
+
+# low-cardinality columns of the hash and command dataframes, stored as Categorical
+DELAY_CATEGORICAL = ("origin", "meas_id", "command")
+
+# the first columns of the hash dataframe, always present (before the timestamp conversion),
+# followed by the other fields of the measurements
+_HASH_SCHEMA = {
+    "timestamp": pl.Int64,
+    "meas_id": pl.String,
+    "origin": pl.String,
+    "hash": pl.UInt64,
+}
+
+
+class _MeasFilter:
+    """
+    Drops the measurements which can never show up in the delays. While parsing, the lines logged
+    outside the time range widened by DEFAULT_LAG are skipped before being decoded (skips_line) and the
+    meas_ids are filtered (__call__). The exact checks are done per packet once the records are merged
+    (filter_packets), as the measurements of a packet may be logged on several lines.
+    """
+
+    def __init__(
+        self,
+        meas_ids: Sequence | None,
+        time_range: tuple[datetime.datetime | None, datetime.datetime | None] | None,
+        require_origin: str | None,
+    ) -> None:
+        self.meas_ids = None if meas_ids is None else {str(m) for m in meas_ids}
+        start, end = time_range if time_range is not None else (None, None)
+        self.start = None if start is None else to_epoch_ns(start)
+        self.end = None if end is None else to_epoch_ns(end)
+        self.require_origin = require_origin
+        # the measurements are logged at most DEFAULT_LAG after they are taken
+        lag_ns = DEFAULT_LAG // datetime.timedelta(microseconds=1) * 1000
+        self.line_start = None if self.start is None else self.start - lag_ns
+        self.line_end = None if self.end is None else self.end + lag_ns
+
+    def skips_line(self, log_time: str) -> bool:
+        """
+        Returns True if a hash line logged at log_time (ISO 8601) has no measurement in the time range.
+        """
+        if self.line_start is None and self.line_end is None:
+            return False
+        try:
+            time_ns = to_epoch_ns(datetime.datetime.fromisoformat(log_time.strip()))
+        except ValueError:
+            # decoded and checked per packet
+            return False
+        return (self.line_start is not None and time_ns < self.line_start) or (
+            self.line_end is not None and time_ns > self.line_end
+        )
+
+    def __call__(self, meas: list[dict]) -> list[dict]:
+        # the measurements without meas_id belong to every meas_id
+        if self.meas_ids is not None:
+            meas = [
+                i
+                for i in meas
+                if i.get("meas_id") is None or str(i["meas_id"]) in self.meas_ids
+            ]
+        return meas
+
+    def filter_packets(
+        self,
+        df: pl.DataFrame,
+        command_df: pl.DataFrame,
+        max_gap: datetime.timedelta | None = None,
+    ) -> pl.DataFrame:
+        """
+        Keeps the packets which reached require_origin and whose first measurement is in the time range
+        (df: the merged measurements). Identical payloads share a hash: a packet is a hash within a
+        Start/Stop segment, split wherever its measurements are more than max_gap apart as in
+        delay_get_segment.
+        """
+        if self.require_origin is None and self.start is None and self.end is None:
+            return df
+        starts = (
+            command_df.filter(pl.col("command") == "Start")
+            .get_column("timestamp")
+            .dt.epoch("ns")
+            .sort()
+            if "command" in command_df.columns
+            else pl.Series(dtype=pl.Int64)
+        )
+        segments = starts.search_sorted(
+            df.get_column("timestamp").dt.epoch("ns"), side="right"
+        )
+        lf, keys = _delay_packets(
+            df.lazy().with_row_index("_row").with_columns(_segment=segments), max_gap
+        )
+        packet = ["_segment", *keys]
+        conditions = []
+        if self.require_origin is not None:
+            conditions.append(
+                (pl.col("origin") == self.require_origin).any().over(packet)
+            )
+        # a packet is kept whole if its first measurement is in the time range
+        first = pl.col("timestamp").min().over(packet).dt.epoch("ns")
+        if self.start is not None:
+            conditions.append(first >= self.start)
+        if self.end is not None:
+            conditions.append(first <= self.end)
+        return lf.filter(conditions).sort("_row").select(df.columns).collect()
+
+
+def _record_decoder(backend: JsonBackend) -> Callable[[str], list[dict]]:
+    """
+    Returns the function decoding a {"hash": ..., "meas": [...]} record into its rows
+    (the measurements with their timestamp in ns and the hash).
+    """
+    if backend.name == "msgspec":
+        return _typed_record_decoder()
+    return _dict_record_decoder(backend.loads)
+
+
+def _dict_record_decoder(loads: Callable[[str], Any]) -> Callable[[str], list[dict]]:
+    def decode(json_line: str) -> list[dict]:
+        data = loads(json_line)
+        hash_value = data["hash"]
+        meas = data["meas"]
+        for i in meas:
+            # Add the two timestamps together
+            i["timestamp"] = (
+                i["timestamp"]["secs"] * 1000000000 + i["timestamp"]["nanos"]
+            )
+            i["hash"] = hash_value
+        return meas
+
+    return decode
+
+
+@functools.cache
+def _typed_record_decoder() -> Callable[[str], list[dict]]:
+    # msgspec decodes the records into typed Structs, without intermediate dictionaries. The measurements
+    # with other fields are decoded as dictionaries instead, so that no field is lost and every backend
+    # returns the same columns
+    import msgspec
+
+    class Timestamp(msgspec.Struct, forbid_unknown_fields=True):
+        secs: int
+        nanos: int
+
+    class Meas(msgspec.Struct, forbid_unknown_fields=True):
+        timestamp: Timestamp
+        origin: str | None = None
+        meas_id: str | int | None = None
+
+    class HashRecord(msgspec.Struct):
+        hash: int
+        meas: list[Meas]
+
+    decoder = msgspec.json.Decoder(HashRecord)
+    decode_dicts = _dict_record_decoder(msgspec_loads(msgspec.json.Decoder()))
+
+    def decode(json_line: str) -> list[dict]:
+        try:
+            record = decoder.decode(json_line)
+        except msgspec.DecodeError:
+            # other fields or types (a malformed record raises json.JSONDecodeError)
+            return decode_dicts(json_line)
+        return [
+            {
+                "timestamp": i.timestamp.secs * 1000000000 + i.timestamp.nanos,
+                "origin": i.origin,
+                "meas_id": i.meas_id,
+                "hash": record.hash,
+            }
+            for i in record.meas
+        ]
+
+    return decode
+
+
+def delay_parse_log(
+    log_file: LogFiles,
+    stats: PipelineStats | None = None,
+    max_workers: int | None = 1,
+    errors: str = "raise",
+    quarantine: Quarantine | None = None,
+    meas_ids: Sequence | None = None,
+    time_range: tuple[datetime.datetime | None, datetime.datetime | None] | None = None,
+    require_origin: str | None = None,
+    categorical: bool = True,
+    json_backend: str | JsonBackend | None = None,
+    index: bool = False,
+    window: TimeRange | None = None,
+    max_gap: datetime.timedelta | None = None,
+) -> dict[str, pl.DataFrame]:
     """
     Parse the centralservice.log file and return a dictionary containing 2 dataframes:
     - hash: DataFrame containing the hash data
     - command: DataFrame containing the command data
+    log_file may also be a glob pattern or a list of files/patterns, e.g. the rotated files of a
+    campaign ("centralservice.log*": centralservice.log, .1, .2.gz...). Gzipped files are decompressed
+    transparently. The files are merged by timestamp, so that a Start/Stop segment can span a rotation.
+    max_workers sets the number of worker processes parsing the files (None: one per CPU); with 1 (default),
+    the files are parsed one after the other in this process. The worker processes are started with "spawn":
+    a script using them must guard its entry point with if __name__ == "__main__".
+    If stats is given, the time spent in every stage (read, regex, base64, gzip, json, frame) is recorded.
+    errors sets the handling of the malformed lines (corrupt base64, gzip or JSON, e.g. truncated by a power cycle):
+    "raise" (default) raises the error, "skip" skips the line and "collect" also adds it to the quarantine.
+    The measurements are filtered while parsing, so that most of the dropped rows are never materialized
+    (the hash lines logged outside time_range, widened by log_index.DEFAULT_LAG, are not even decoded):
+    - meas_ids: only keeps the measurements of these meas_id (and the ones without meas_id)
+    - time_range: (start, end) datetimes, either may be None; only keeps the packets whose first
+      measurement is in the range (bounds included)
+    - require_origin: only keeps the packets with a measurement of this origin (e.g. "Upc")
+    The measurements of a packet may be logged on several lines: time_range and require_origin are checked
+    per packet once the lines are parsed. A packet is a hash within a Start/Stop segment, split by max_gap
+    (see delay_get_segment): identical payloads share a hash.
+    With categorical (default), the origin, meas_id and command columns are Categorical instead of String.
+    json_backend selects the JSON decoder: "auto", "msgspec", "orjson" or "stdlib" (None: the default of
+    set_json_backend, see rs_mrt_dau_utilities.json_backend). With msgspec, the records are decoded into
+    typed Structs. Every backend returns the same columns: timestamp, meas_id, origin, hash, then the other
+    fields of the measurements.
+    window (start, end) only parses the lines logged in this time window (widened by log_index.DEFAULT_LAG),
+    read at their byte offset with the sidecar index of the log (DelayLogIndex, built on first use); the
+    Start/Stop commands of the whole log are still returned. index=True uses time_range as window.
+    Gzipped files are always parsed in full.
     """
-    with open(log_file, "r") as f:
-        lines = f.readlines()
+    check_error_policy(errors, quarantine)
+    if max_gap is not None and max_gap <= datetime.timedelta(0):
+        raise ValueError(f"max_gap must be positive, got {max_gap}")
+    if window is None and index:
+        window = time_range
+    decode_record = _record_decoder(get_json_backend(json_backend))
+    meas_filter = (
+        _MeasFilter(meas_ids, time_range, require_origin)
+        if meas_ids is not None or time_range is not None or require_origin is not None
+        else None
+    )
+    files = delay_resolve_log_files(log_file)
+    if not files:
+        raise FileNotFoundError(f"no log file matches {log_file!r}")
 
-    fl: dict[str, list] = {"hash": [], "command": []}
-    for line in lines:
-        # Extract the relevant information from the log line
-        match_hash = re.search(
-            r"(.*) INFO centralservice::delay_meas_core: mime=.*, data=(.*)", line
-        )
-        if match_hash:
-            timestamp = match_hash.group(1)
-            encoded = match_hash.group(2)
-            decoded = base64.b64decode(encoded)
-            decompress = gzip.decompress(decoded)
-            for line in decompress.decode("utf-8").splitlines():
-                data = json.loads(line)
-                for i in data["meas"]:
-                    # Add the two timestamps together
-                    i["timestamp"] = (
-                        i["timestamp"]["secs"] * 1000000000 + i["timestamp"]["nanos"]
-                    )
-                    i["hash"] = data["hash"]
-                    fl["hash"].append(i)
-        match_cmd = re.search(
-            r"(.*)  INFO centralservice::delay_meas_core: (.*) msg from FSW received",
-            line,
-        )
-        if match_cmd:
-            timestamp = match_cmd.group(1)
-            cmd = match_cmd.group(2)
-            # config = match_cmd.group(3)
-            json_dict = {
-                "timestamp": datetime.datetime.fromisoformat(timestamp),
-                "command": cmd,
-            }
+    if max_workers is not None and max_workers < 1:
+        raise ValueError(f"max_workers must be at least 1, got {max_workers}")
 
-            fl["command"].append(json_dict)
-    # logging.d(fl["command"])
+    if len(files) == 1 or max_workers == 1:
+        parsed = [
+            _log_file_frames(
+                _parse_log_file(
+                    file, stats, errors, quarantine, meas_filter, decode_record, window
+                )
+            )
+            for file in files
+        ]
+    else:
+        # the parsing is CPU-bound Python code: one process per file, each one recording to its own
+        # stats and quarantine, merged afterwards
+        jobs = [
+            (
+                file,
+                stats is not None,
+                errors,
+                quarantine is not None,
+                meas_filter,
+                _picklable_backend(json_backend),
+                window,
+            )
+            for file in files
+        ]
+        # polars is multithreaded: forking a process using it may deadlock
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(max_workers or os.cpu_count() or 1, len(files)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            results = list(executor.map(_parse_log_job, *zip(*jobs)))
+        parsed = [frames for frames, _, _ in results]
+        for _, file_stats, file_quarantine in results:
+            if stats is not None and file_stats is not None:
+                stats.merge(file_stats)
+            if quarantine is not None and file_quarantine is not None:
+                quarantine.merge(file_quarantine)
 
-    # print("hash:", fl["hash"])
-    # Create a DataFrame for the hash data and cast the 'hash' column to UInt64
-    df = pl.DataFrame(fl["hash"], infer_schema_length=None).cast({"hash": pl.UInt64})
+    if stats is not None:
+        t_start = perf_counter()
+
+    if len(parsed) == 1:
+        df, command_df = parsed[0]["hash"], parsed[0]["command"]
+    else:
+        df = pl.concat([p["hash"] for p in parsed], how="diagonal_relaxed")
+        command_df = pl.concat([p["command"] for p in parsed], how="diagonal_relaxed")
 
     # convert the timestamp to datetime with the correct timezone
     df = df.with_columns(
         timestamp=pl.from_epoch("timestamp", time_unit="ns").dt.replace_time_zone("UTC")
     )
+    if meas_filter is not None:
+        df = meas_filter.filter_packets(df, command_df, max_gap)
+    if categorical:
+        df = encode_categorical(df, DELAY_CATEGORICAL)
+        command_df = encode_categorical(command_df, DELAY_CATEGORICAL)
+    if len(files) > 1:
+        # merge the files
+        df = df.sort("timestamp", maintain_order=True)
+        command_df = command_df.sort("timestamp", maintain_order=True)
 
+    if stats is not None:
+        stats.record(
+            "delay_parse_log.frame",
+            perf_counter() - t_start,
+            rows=df.height + command_df.height,
+        )
+
+    return {"hash": df, "command": command_df}
+
+
+def _log_file_frames(fl: dict[str, list]) -> dict[str, pl.DataFrame]:
+    """
+    Builds the hash and command dataframes of the records of a log file (timestamps in ns).
+    """
+    # Create a DataFrame for the hash data and cast the 'hash' column to UInt64
+    if fl["hash"]:
+        df = pl.DataFrame(fl["hash"], infer_schema_length=None).cast(
+            {"hash": pl.UInt64}
+        )
+        # the same columns in the same order with every JSON backend, e.g. when only the measurements
+        # without meas_id are kept
+        fixed = [
+            pl.lit(None, dtype).alias(name)
+            if name not in df.columns
+            else pl.col(name).cast(dtype)
+            if df.schema[name] == pl.Null
+            else pl.col(name)
+            for name, dtype in _HASH_SCHEMA.items()
+        ]
+        df = df.select(*fixed, pl.exclude(list(_HASH_SCHEMA)))
+    else:
+        # e.g. every hash filtered out
+        df = pl.DataFrame(schema=_HASH_SCHEMA)
     return {"hash": df, "command": pl.DataFrame(fl["command"])}
 
 
+def _parse_log_job(
+    log_file: str,
+    collect_stats: bool,
+    errors: str,
+    collect_quarantine: bool,
+    meas_filter: _MeasFilter | None,
+    json_backend: str | JsonBackend | None,
+    window: TimeRange | None,
+) -> tuple[dict[str, pl.DataFrame], PipelineStats | None, Quarantine | None]:
+    """
+    Parses one log file in a worker process of delay_parse_log.
+    """
+    stats = PipelineStats() if collect_stats else None
+    quarantine = Quarantine() if collect_quarantine else None
+    fl = _parse_log_file(
+        log_file,
+        stats,
+        errors,
+        quarantine,
+        meas_filter,
+        _record_decoder(get_json_backend(json_backend)),
+        window,
+    )
+    return _log_file_frames(fl), stats, quarantine
+
+
+def _picklable_backend(json_backend: str | JsonBackend | None) -> str | JsonBackend:
+    # the built-in backends are sent to the worker processes by name, resolved here as the
+    # workers do not share the default of set_json_backend
+    if isinstance(json_backend, JsonBackend):
+        return json_backend
+    return get_json_backend(json_backend).name
+
+
+def delay_resolve_log_files(log_file: LogFiles) -> list[str]:
+    """
+    Return the log files matching a file name, a glob pattern or a list of them,
+    from the oldest rotation to the current file:
+    centralservice.log.2.gz, centralservice.log.2, centralservice.log.1, centralservice.log
+    The sidecar index files of the logs (centralservice.log.idx, see DelayLogIndex) are skipped.
+    """
+    patterns = [log_file] if isinstance(log_file, (str, os.PathLike)) else log_file
+    files: dict[str, None] = {}
+    for pattern in patterns:
+        pattern = os.fspath(pattern)
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            # the index, or the temporary file of an index being saved
+            if not match.endswith((INDEX_SUFFIX, INDEX_SUFFIX + ".tmp")):
+                files[match] = None
+    return sorted(files, key=_rotation_key)
+
+
+def delay_group_log_files(log_file: LogFiles) -> dict[str, list[str]]:
+    """
+    Group log files (names, glob patterns or a list of them) by log: the rotations of a log
+    (centralservice.log.1, centralservice.log.2.gz...) are grouped with the log (centralservice.log).
+    Every group can be passed to delay_parse_log, so that a segment can span a rotation.
+
+    Returns:
+        dict: The files of every log, from the oldest rotation to the current file, with the name of the
+        current log file as key.
+    """
+    groups: dict[str, list[str]] = {}
+    for file in delay_resolve_log_files(log_file):
+        groups.setdefault(_rotation_key(file)[0], []).append(file)
+    return groups
+
+
+def _rotation_key(file: str) -> tuple:
+    # centralservice.log.<n>[.gz]: the higher n, the older the file
+    gzipped = file.endswith(".gz")
+    name = file[:-3] if gzipped else file
+    base, _, suffix = name.rpartition(".")
+    if suffix.isdigit():
+        return (base, -int(suffix), not gzipped)
+    return (name, 0, not gzipped)
+
+
+def _open_log_file(log_file: str) -> IO[str]:
+    # undecodable bytes (e.g. a line truncated by a power cycle) are handled as malformed lines
+    if log_file.endswith(".gz"):
+        return gzip.open(log_file, "rt", errors="replace")
+    return open(log_file, "r", errors="replace")
+
+
+def _parse_log_file(
+    log_file: str,
+    stats: PipelineStats | None,
+    errors: str = "raise",
+    quarantine: Quarantine | None = None,
+    meas_filter: _MeasFilter | None = None,
+    decode_record: Callable[[str], list[dict]] | None = None,
+    window: TimeRange | None = None,
+) -> dict[str, list]:
+    """
+    Parse one log file into lists of hash and command records.
+    """
+    if decode_record is None:
+        decode_record = _record_decoder(get_json_backend())
+    if stats is not None:
+        t_start = perf_counter()
+    # the line numbers of the lines, when only a part of the log is read
+    line_numbers: list[int] | None = None
+    if window is not None and not log_file.endswith(".gz"):
+        lines, line_numbers, bytes_in = _read_log_window(log_file, window)
+    else:
+        with _open_log_file(log_file) as f:
+            lines = f.readlines()
+        bytes_in = os.path.getsize(log_file)
+    if stats is not None:
+        stats.record(
+            "delay_parse_log.read",
+            perf_counter() - t_start,
+            bytes_in=bytes_in,
+            rows=len(lines),
+        )
+        t_regex = t_base64 = t_gzip = t_json = 0.0
+        base64_in = gzip_in = gzip_out = 0
+
+    fl: dict[str, list] = {"hash": [], "command": []}
+    malformed = 0
+    for position, line in enumerate(lines):
+        # a malformed line is handled according to the error policy, then skipped
+        try:
+            if stats is not None:
+                t0 = perf_counter()
+            # Extract the relevant information from the log line
+            match_hash = _HASH_LINE.search(line)
+            if match_hash:
+                if meas_filter is not None and meas_filter.skips_line(
+                    match_hash.group(1)
+                ):
+                    continue
+                encoded = match_hash.group(2)
+                if stats is not None:
+                    t1 = perf_counter()
+                    t_regex += t1 - t0
+                decoded = binascii.a2b_base64(encoded)
+                if stats is not None:
+                    t2 = perf_counter()
+                    t_base64 += t2 - t1
+                    base64_in += len(encoded)
+                decompress = gunzip(decoded)
+                if stats is not None:
+                    t3 = perf_counter()
+                    t_gzip += t3 - t2
+                    gzip_in += len(decoded)
+                    gzip_out += len(decompress)
+                # the rows of a line are only kept if the whole line is valid
+                rows = []
+                for json_line in split_json_lines(decompress):
+                    meas = decode_record(json_line)
+                    if meas_filter is not None:
+                        meas = meas_filter(meas)
+                    rows.extend(meas)
+                fl["hash"].extend(rows)
+                if stats is not None:
+                    t_json += perf_counter() - t3
+                continue
+            match_cmd = _COMMAND_LINE.search(line)
+            if stats is not None:
+                t_regex += perf_counter() - t0
+            if match_cmd:
+                timestamp = match_cmd.group(1)
+                cmd = match_cmd.group(2)
+                # config = match_cmd.group(3)
+                json_dict = {
+                    "timestamp": datetime.datetime.fromisoformat(timestamp),
+                    "command": cmd,
+                }
+
+                fl["command"].append(json_dict)
+        except PARSE_ERRORS as exc:
+            if errors == "raise":
+                raise
+            malformed += 1
+            if quarantine is not None:
+                quarantine.add(
+                    log_file,
+                    position + 1 if line_numbers is None else line_numbers[position],
+                    error_stage(exc),
+                    f"{type(exc).__name__}: {exc}",
+                    line.rstrip("\n"),
+                )
+
+    if malformed:
+        logger.warning("%d malformed lines skipped in %s", malformed, log_file)
+
+    if stats is not None:
+        stats.record("delay_parse_log.regex", t_regex, rows=len(lines))
+        stats.record(
+            "delay_parse_log.base64", t_base64, bytes_in=base64_in, bytes_out=gzip_in
+        )
+        stats.record(
+            "delay_parse_log.gzip", t_gzip, bytes_in=gzip_in, bytes_out=gzip_out
+        )
+        stats.record(
+            "delay_parse_log.json",
+            t_json,
+            bytes_in=gzip_out,
+            rows=len(fl["hash"]),
+            malformed=malformed,
+        )
+
+    return fl
+
+
+def _read_log_window(
+    log_file: str, window: TimeRange
+) -> tuple[list[str], list[int], int]:
+    """
+    Reads the lines of a time window with the index of the log, and the command lines outside the window.
+
+    Returns:
+        tuple: The lines, their line numbers (1-based) and the number of bytes read.
+    """
+    index = DelayLogIndex.open(log_file)
+    offset, end, first_line = index.byte_range(*window)
+    before = [c for c in index.commands if c[0] < offset]
+    after = [c for c in index.commands if c[0] >= end]
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        data = f.read(end - offset)
+        command_lines = []
+        for command in before + after:
+            f.seek(command[0])
+            command_lines.append(f.readline())
+    lines = _decode_lines(b"".join(command_lines[: len(before)]))
+    lines += _decode_lines(data)
+    lines += _decode_lines(b"".join(command_lines[len(before) :]))
+    line_numbers = (
+        [c[1] + 1 for c in before]
+        + list(range(first_line + 1, first_line + 1 + len(lines) - len(command_lines)))
+        + [c[1] + 1 for c in after]
+    )
+    return lines, line_numbers, len(data) + sum(len(line) for line in command_lines)
+
+
+def _decode_lines(data: bytes) -> list[str]:
+    # same decoding as _open_log_file
+    return io.TextIOWrapper(io.BytesIO(data), errors="replace").readlines()
+
+
 def delay_get_start_stop_segment(
-    command_df: pl.DataFrame, hash_df: pl.DataFrame
+    command_df: pl.DataFrame,
+    hash_df: pl.DataFrame,
+    stats: PipelineStats | None = None,
 ) -> list[pl.DataFrame]:
     """ """
+    if stats is not None:
+        t_start = perf_counter()
     # search for the segments start - stop
     start_time = None
     result = []
@@ -85,100 +642,240 @@ def delay_get_start_stop_segment(
     # Create a new DataFrame from the result list
     paired_df = pl.DataFrame(result)
     # print("paired_df:", paired_df)
+    if stats is not None:
+        t_pairing = perf_counter()
+        stats.record(
+            "delay_get_start_stop_segment.pairing",
+            t_pairing - t_start,
+            rows=paired_df.height,
+        )
     results_per_segment = []
-    # Iterate through the DataFrame rows
-    for row in paired_df.iter_rows(named=True):
-        start_time = row["Start"]
-        stop_time = row["Stop"]
-        # Filter the hash DataFrame for the current segment
-        filtered_hash_df = hash_df.filter(
-            pl.col("timestamp").is_between(start_time, stop_time)
+    if not paired_df.is_empty():
+        # sort the hashes once, then every segment is a binary search and a zero-copy slice
+        index = TimeIndex(hash_df, "timestamp")
+        results_per_segment = index.slices(
+            starts=paired_df["Start"], ends=paired_df["Stop"]
+        )
+
+    if stats is not None:
+        stats.record(
+            "delay_get_start_stop_segment.filter",
+            perf_counter() - t_pairing,
+            rows=sum(df.height for df in results_per_segment),
         )
-        # Append the filtered DataFrame to the result list
-        results_per_segment.append(filtered_hash_df)
 
     return results_per_segment
 
 
 def delay_get_segment(
-    result_per_segment: list[pl.DataFrame], all_paths: bool = False
+    result_per_segment: list[pl.DataFrame],
+    all_paths: bool = False,
+    layout: str = "wide",
+    stats: PipelineStats | None = None,
+    max_parallel: int | None = None,
+    max_gap: datetime.timedelta | None = None,
 ) -> dict[str, pl.DataFrame]:
-    """ """
-    result_per_hash = {}
+    """
+    Compute the delays of every hash for each segment and each meas_id.
+
+    Args:
+        result_per_segment (list): The DataFrames returned by delay_get_start_stop_segment.
+        all_paths (bool): Add one column per hop ("delay-<from>-><to>_us") to the wide layout.
+        layout (str): "wide" (default) returns one row per hash and one column per origin
+            and occurrence (e.g. "Upc_1", "Ims_2").
+            "long" returns one row per hop with the columns (hash, hop_from, hop_to, delay_us),
+            which avoids the sparse pivot when packets traverse an origin many times.
+        stats (PipelineStats): If given, the time spent in every stage (group, pivot, delays, long) is recorded.
+        max_parallel (int): The queries of all the segments and meas_ids are executed together with
+            pl.collect_all; max_parallel caps the number of queries running at the same time (None: all).
+        max_gap (timedelta): The maximum time between two consecutive measurements of a packet.
+            Identical payloads (e.g. repeated pings) have the same hash: with max_gap, the measurements of a
+            hash are split into packets wherever they are more than max_gap apart, and a "packet" column
+            (1, 2... per hash) is added after the hash. None (default) groups all the measurements of a hash
+            of the segment together.
+
+    Returns:
+        dict: A dictionary of DataFrames with the keys "<segment>_<meas_id>".
+    """
+    if layout not in ("wide", "long"):
+        raise ValueError(f"layout must be 'wide' or 'long', got {layout!r}")
+    if max_gap is not None and max_gap <= datetime.timedelta(0):
+        raise ValueError(f"max_gap must be positive, got {max_gap}")
+    keys_columns = ["hash"] if max_gap is None else ["hash", "packet"]
+
+    # build the query of every segment and meas_id first, then run them together
+    keys = []
+    queries = []
     segment = 1  # first segment (start-stop) begins with 1
     # group the hash together
     for m in result_per_segment:
-        # Group by 'hash'
-        # only keep the groups that have 'Upc' in the 'origin' column
-        # filtered_groups=m.sort("timestamp").group_by('hash').all().filter(pl.col('origin').list.contains('Upc')) #.head(10)
-
-        # print(filtered_groups)
-        # getting the number of unique meas_id
+        # getting the unique meas_id, in order of appearance
         list_of_meas = pl.Series(
-            m.select(pl.col("meas_id").drop_nulls().unique())
+            m.select(pl.col("meas_id").drop_nulls().unique(maintain_order=True))
         ).to_list()
         # print("list of meas: ", list_of_meas)
 
         for meas in list_of_meas:
-            aaa = (
-                m.lazy()
-                .filter(pl.col("meas_id").is_in([meas]) | pl.col("meas_id").is_null())
-                .sort("timestamp")
-                .group_by("hash")
-                .all()
-                .filter(pl.col("origin").list.contains("Upc"))
-                .explode(
-                    "timestamp", "origin", "meas_id"
-                )  # .group_by('hash','origin').all()
-                .sort("timestamp", "hash", "origin")
-                .with_columns(idx=pl.col("hash").rank("ordinal").over("hash", "origin"))
-                .collect()
-            )
-            eee3 = aaa.pivot(index="hash", on=["origin", "idx"], values="timestamp")
-            iii = (
-                eee3.select(pl.all().exclude("hash"))
-                .rename(lambda cn: cn[2:-1].replace('",', "_"))
-                .insert_column(0, eee3["hash"])
+            keys.append(str(segment) + "_" + str(meas))
+            if layout == "long":
+                queries.append(_delay_segment_long(m, meas, max_gap))
+            else:
+                queries.append(_delay_segment_grouped(m, meas, max_gap))
+        segment += 1
+
+    if stats is not None:
+        t0 = perf_counter()
+    frames = _collect_all(queries, max_parallel)
+    if stats is not None:
+        stats.record(
+            "delay_get_segment.long" if layout == "long" else "delay_get_segment.group",
+            perf_counter() - t0,
+            rows=sum(df.height for df in frames),
+        )
+    if layout == "long":
+        return dict(zip(keys, frames))
+
+    result_per_hash = {}
+    for key, aaa in zip(keys, frames):
+        if stats is not None:
+            t1 = perf_counter()
+        eee3 = aaa.pivot(index=keys_columns, on=["origin", "idx"], values="timestamp")
+        iii = pl.concat(
+            [
+                eee3.select(keys_columns),
+                eee3.select(pl.all().exclude(keys_columns)).rename(
+                    lambda cn: cn[2:-1].replace('",', "_")
+                ),
+            ],
+            how="horizontal",
+        )
+        if stats is not None:
+            t2 = perf_counter()
+            stats.record("delay_get_segment.pivot", t2 - t1, rows=iii.height)
+        column_present = iii.columns
+        column_present = [x for x in column_present if x not in keys_columns]
+        # print(column_present)
+        iii = iii.with_columns(
+            delay_global_us=(
+                pl.col(column_present[-1]) - pl.col(column_present[0])
+            ).dt.total_microseconds()
+        )
+
+        if all_paths:
+            last_column = ""
+            for i in column_present:
+                if last_column == "":
+                    last_column = i
+                else:
+                    iii = iii.with_columns(
+                        (pl.col(i) - pl.col(last_column))
+                        .alias("delay-" + last_column + "->" + i + "_us")
+                        .dt.total_microseconds()
+                    )
+                    last_column = i
+        if stats is not None:
+            stats.record(
+                "delay_get_segment.delays", perf_counter() - t2, rows=iii.height
             )
-            # # remove the group who are not meas or n/a
-            # fil_only_one_meas = m.filter(pl.col("meas_id").is_in([meas]) | pl.col("meas_id").is_null())
-            # #print("fil_only_one_meas:", fil_only_one_meas)
-            # # add a number at the end of every origin, sorted by timestamp
-            # ddd = fil_only_one_meas.sort("timestamp").group_by('hash').all().filter(pl.col('origin').list.contains('Upc'))
-            # eee = ddd.explode("timestamp","origin","meas_id") #.group_by('hash','origin').all()
-            # #print(eee)
-            # eee2 = eee.sort('timestamp','hash','origin').with_columns(
-            #     idx = pl.col('hash').rank("ordinal").over('hash', 'origin')
-            #     #pl.int_range(pl.len()).over(pl.col('origin'))
-            # )
-            # #print(eee2)
-            # eee3 = eee2.pivot(index="hash", on=["origin", "idx"], values="timestamp")
-            # # rename the columns
-            # iii = eee3.select(pl.all().exclude("hash")).rename(
-            #     lambda cn: cn[2:-1].replace("\",", "_")
-            # ).insert_column(0, eee3["hash"])
-            # print(iii)
-            column_present = iii.columns
-            column_present = [x for x in column_present if x != "hash"]
-            # print(column_present)
-            iii = iii.with_columns(
-                delay_global_us=(
-                    pl.col(column_present[-1]) - pl.col(column_present[0])
-                ).dt.total_microseconds()
+        result_per_hash[key] = iii
+    return result_per_hash
+
+
+def _delay_segment_grouped(
+    segment_df: pl.DataFrame, meas, max_gap: datetime.timedelta | None = None
+) -> pl.LazyFrame:
+    """
+    Wide layout of delay_get_segment: the timestamps of every hash (or packet) with the occurrence (idx) of
+    every origin, before the pivot.
+    """
+    lf, keys = _delay_packets(
+        segment_df.lazy()
+        .filter(pl.col("meas_id").is_in([meas]) | pl.col("meas_id").is_null())
+        .sort("timestamp"),
+        max_gap,
+    )
+    # only keep the groups that have 'Upc' in the 'origin' column
+    return (
+        lf.group_by(keys)
+        .all()
+        .filter(pl.col("origin").list.contains("Upc"))
+        .explode("timestamp", "origin", "meas_id")  # .group_by('hash','origin').all()
+        .sort("timestamp", "hash", "origin")
+        .with_columns(idx=pl.col("hash").rank("ordinal").over(*keys, "origin"))
+    )
+
+
+def _delay_packets(
+    lf: pl.LazyFrame, max_gap: datetime.timedelta | None
+) -> tuple[pl.LazyFrame, list[str]]:
+    """
+    Numbers the packets of every hash of a frame sorted by timestamp: a new packet starts when a measurement
+    is more than max_gap after the previous measurement of the hash.
+
+    Returns:
+        tuple: The frame and the columns identifying a packet (only "hash" without max_gap).
+    """
+    if max_gap is None:
+        return lf, ["hash"]
+    # sorted by hash, the packets are numbered with running sums instead of a window per hash
+    new_hash = (pl.col("hash") != pl.col("hash").shift()).fill_null(True)
+    packets = (new_hash | (pl.col("timestamp").diff() > max_gap)).cum_sum()
+    return (
+        lf.sort("hash", "timestamp", maintain_order=True)
+        .with_columns(packet=packets, packet_start=pl.when(new_hash).then(packets))
+        .with_columns(
+            packet=(pl.col("packet") - pl.col("packet_start").forward_fill() + 1).cast(
+                pl.UInt32
             )
+        )
+        .drop("packet_start")
+        .sort("timestamp", maintain_order=True),
+        ["hash", "packet"],
+    )
 
-            if all_paths:
-                last_column = ""
-                for i in column_present:
-                    if last_column == "":
-                        last_column = i
-                    else:
-                        iii = iii.with_columns(
-                            (pl.col(i) - pl.col(last_column))
-                            .alias("delay-" + last_column + "->" + i + "_us")
-                            .dt.total_microseconds()
-                        )
-                        last_column = i
-            result_per_hash[str(segment) + "_" + str(meas)] = iii
-        segment += 1
-    return result_per_hash
+
+def _collect_all(
+    queries: list[pl.LazyFrame], max_parallel: int | None
+) -> list[pl.DataFrame]:
+    """
+    Runs the queries together with collect_all, at most max_parallel at a time.
+    """
+    if max_parallel is None:
+        return pl.collect_all(queries)
+    if max_parallel < 1:
+        raise ValueError(f"max_parallel must be at least 1, got {max_parallel}")
+    frames: list[pl.DataFrame] = []
+    for i in range(0, len(queries), max_parallel):
+        frames.extend(pl.collect_all(queries[i : i + max_parallel]))
+    return frames
+
+
+def _delay_segment_long(
+    segment_df: pl.DataFrame, meas, max_gap: datetime.timedelta | None = None
+) -> pl.LazyFrame:
+    """
+    Long layout of delay_get_segment: one row per hop of a hash (or packet), computed with a window
+    over the hash instead of a pivot.
+    """
+    lf, keys = _delay_packets(
+        segment_df.lazy()
+        .filter(pl.col("meas_id").is_in([meas]) | pl.col("meas_id").is_null())
+        .sort("timestamp"),
+        max_gap,
+    )
+    return (
+        # only keep the hashes that have 'Upc' in the 'origin' column
+        lf.filter((pl.col("origin") == "Upc").any().over(keys))
+        .sort("timestamp", "hash", "origin")
+        .with_columns(idx=pl.col("hash").rank("ordinal").over(*keys, "origin"))
+        .with_columns(hop=pl.format("{}_{}", "origin", "idx"))
+        .select(
+            *keys,
+            hop_from=pl.col("hop").shift().over(keys),
+            hop_to=pl.col("hop"),
+            delay_us=(
+                pl.col("timestamp") - pl.col("timestamp").shift().over(keys)
+            ).dt.total_microseconds(),
+        )
+        .filter(pl.col("hop_from").is_not_null())
+    )
@@ -0,0 +1,244 @@
+import bisect
+import datetime
+import json
+import logging
+import os
+import re
+import zlib
+from pathlib import Path
+
+from ..timestamps import from_epoch_ns, to_epoch_ns
+
+# Sidecar index of a centralservice.log file: byte offsets of sampled log lines and of the
+# Start/Stop commands, to parse only the part of a huge log covering a time window or a segment.
+# example of use:
+#   index = DelayLogIndex.open("centralservice.log")   # loads centralservice.log.idx, or builds it
+#   index.segments()                                     # [(start, stop), ...] log times
+#   delay_parse_log("centralservice.log", time_range=(start, end), index=True)
+#   extract_delay_from_log("centralservice.log", segment=3)
+# The index is built in one pass over the raw lines (no base64, gzip or JSON decoding) and saved next
+# to the log. When the log has grown, only the new lines are indexed; a rotated or rewritten log is
+# indexed again. The log times are assumed to be non-decreasing: the byte range of a time window is
+# widened by a lag on both sides, for the hashes logged some time after their measurement.
+# Gzipped rotations cannot be read from an offset and are not indexed.
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+# a log line is sampled every DEFAULT_EVERY_BYTES bytes: the granularity of the byte ranges
+DEFAULT_EVERY_BYTES = 256 * 1024
+DEFAULT_LAG = datetime.timedelta(seconds=10)
+
+_COMMAND_MARK = b" msg from FSW received"
+_COMMAND_LINE = re.compile(
+    rb"  INFO centralservice::delay_meas_core: (.*) msg from FSW received"
+)
+# the fingerprint of the head of the log detects a rotated or rewritten log
+_HEAD_BYTES = 4096
+
+
+class DelayLogIndex:
+    """
+    Byte-offset index of the log times and of the Start/Stop commands of a centralservice.log file.
+
+    Use DelayLogIndex.open to load the sidecar index file, or build it.
+
+    Args:
+        log_file (str | Path): The (uncompressed) log file.
+        every_bytes (int): The distance in bytes between two sampled log lines.
+
+    Attributes:
+        samples (list): The (offset, line number, log time in ns) of the sampled lines and of the commands.
+        commands (list): The (offset, line number, log time in ns, command) of the commands.
+    """
+
+    def __init__(
+        self, log_file: str | Path, every_bytes: int = DEFAULT_EVERY_BYTES
+    ) -> None:
+        if every_bytes < 1:
+            raise ValueError("every_bytes must be >= 1")
+        self.log_file = Path(log_file)
+        if self.log_file.suffix == ".gz":
+            raise ValueError(f"{log_file} is compressed and cannot be indexed")
+        self.every_bytes = every_bytes
+        self.samples: list[tuple[int, int, int]] = []
+        self.commands: list[tuple[int, int, int, str]] = []
+        # the end of the last indexed line and the number of indexed lines
+        self.scanned = 0
+        self.lines = 0
+        self._head = 0
+
+    @classmethod
+    def open(
+        cls,
+        log_file: str | Path,
+        every_bytes: int = DEFAULT_EVERY_BYTES,
+        save: bool = True,
+    ) -> "DelayLogIndex":
+        """
+        Loads the sidecar index of a log file (<log_file>.idx), indexes the lines added since then,
+        or builds the index if there is none or if it does not match the log.
+
+        Args:
+            log_file (str | Path): The (uncompressed) log file.
+            every_bytes (int): The distance in bytes between two sampled lines of a new index.
+            save (bool): Saves the index when it was built or updated (a read-only directory is only logged).
+
+        Returns:
+            DelayLogIndex: The index, up to date with the log.
+        """
+        index = cls._load(Path(str(log_file) + INDEX_SUFFIX), log_file)
+        if index is None:
+            index = cls(log_file, every_bytes)
+        if index.update() and save:
+            try:
+                index.save()
+            except OSError as exc:
+                logger.warning("index of %s not saved: %r", log_file, exc)
+        return index
+
+    def update(self) -> bool:
+        """
+        Indexes the lines added to the log since the last update (all of them if the log was rotated).
+
+        Returns:
+            bool: True if the index changed.
+        """
+        size = os.path.getsize(self.log_file)
+        reset = bool(self.scanned) and (
+            size < self.scanned or _head_crc(self.log_file, self.scanned) != self._head
+        )
+        if reset:
+            # rotated or rewritten log
+            self.samples, self.commands = [], []
+            self.scanned = self.lines = 0
+        if size == self.scanned:
+            return reset
+        with open(self.log_file, "rb") as f:
+            f.seek(self.scanned)
+            offset, line_number = self.scanned, self.lines
+            next_sample = self.samples[-1][0] + self.every_bytes if self.samples else 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # line being written
+                    break
+                command = None
+                if _COMMAND_MARK in line:
+                    match = _COMMAND_LINE.search(line)
+                    if match is not None:
+                        command = match.group(1).decode("utf-8", "replace")
+                if offset >= next_sample or command is not None:
+                    time_ns = _line_time(line)
+                    if time_ns is not None:
+                        self.samples.append((offset, line_number, time_ns))
+                        if command is not None:
+                            self.commands.append(
+                                (offset, line_number, time_ns, command)
+                            )
+                        if offset >= next_sample:
+                            next_sample = offset + self.every_bytes
+                offset += len(line)
+                line_number += 1
+        changed = reset or offset != self.scanned
+        self.scanned, self.lines = offset, line_number
+        self._head = _head_crc(self.log_file, self.scanned)
+        return changed
+
+    def save(self, path: str | Path | None = None) -> None:
+        """
+        Writes the index to a JSON file (default: <log_file>.idx).
+        """
+        path = Path(str(self.log_file) + INDEX_SUFFIX) if path is None else Path(path)
+        data = {
+            "version": INDEX_VERSION,
+            "every_bytes": self.every_bytes,
+            "scanned": self.scanned,
+            "lines": self.lines,
+            "head": self._head,
+            "samples": self.samples,
+            "commands": self.commands,
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(tmp, path)
+
+    def byte_range(
+        self,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+        lag: datetime.timedelta = DEFAULT_LAG,
+    ) -> tuple[int, int, int]:
+        """
+        Returns the part of the log with all the lines logged between start - lag and end + lag.
+
+        Args:
+            start (datetime): The start of the window (None: the start of the log). Naive datetimes are UTC.
+            end (datetime): The end of the window (None: the end of the indexed log).
+            lag (timedelta): The margin around the window.
+
+        Returns:
+            tuple: The start offset, the end offset and the line number of the first line of the range.
+        """
+        times = [time_ns for _, _, time_ns in self.samples]
+        lag_ns = lag // datetime.timedelta(microseconds=1) * 1000
+        offset, line_number, stop = 0, 0, self.scanned
+        if start is not None:
+            # the last sample logged before the window
+            i = bisect.bisect_left(times, to_epoch_ns(start) - lag_ns) - 1
+            if i >= 0:
+                offset, line_number, _ = self.samples[i]
+        if end is not None:
+            # the first sample logged after the window
+            j = bisect.bisect_right(times, to_epoch_ns(end) + lag_ns)
+            if j < len(self.samples):
+                stop = self.samples[j][0]
+        return offset, max(offset, stop), line_number
+
+    def segments(self) -> list[tuple[datetime.datetime, datetime.datetime]]:
+        """
+        Returns the log times of the Start and Stop commands of every segment, paired as in
+        delay_get_start_stop_segment.
+        """
+        pairs = []
+        start = None
+        for _, _, time_ns, command in self.commands:
+            if command == "Start":
+                start = time_ns
+            elif command == "Stop" and start is not None:
+                pairs.append((from_epoch_ns(start), from_epoch_ns(time_ns)))
+                start = None
+        return pairs
+
+    @classmethod
+    def _load(cls, path: Path, log_file: str | Path) -> "DelayLogIndex | None":
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        index = cls(log_file, data["every_bytes"])
+        index.scanned, index.lines, index._head = (
+            data["scanned"],
+            data["lines"],
+            data["head"],
+        )
+        index.samples = [tuple(sample) for sample in data["samples"]]  # type: ignore[misc]
+        index.commands = [tuple(command) for command in data["commands"]]  # type: ignore[misc]
+        return index
+
+
+def _line_time(line: bytes) -> int | None:
+    # the log lines start with an ISO 8601 time
+    try:
+        return to_epoch_ns(
+            datetime.datetime.fromisoformat(line.split(None, 1)[0].decode("ascii"))
+        )
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return None
+
+
+def _head_crc(log_file: Path, scanned: int) -> int:
+    with open(log_file, "rb") as f:
+        return zlib.crc32(f.read(min(_HEAD_BYTES, scanned)))
@@ -0,0 +1,35 @@
+import altair as alt
+import polars as pl
+
+
+def plot_all(results_one_segment: pl.DataFrame) -> alt.RepeatChart:
+    """
+    Plot all the delays found for this measurement.
+    """
+    items = results_one_segment.columns
+    filtered_items = [item for item in items if item.startswith("delay")]
+    # the first timestamp: the key columns (hash, and packet with max_gap) come first
+    times = [
+        name
+        for name, dtype in results_one_segment.schema.items()
+        if isinstance(dtype, pl.Datetime)
+    ]
+    if not times:
+        raise ValueError("no timestamp column to plot the delays against")
+
+    chart = (
+        alt.Chart(results_one_segment)
+        .mark_point()
+        .encode(
+            # x='min_time:T',
+            # alt.X(items[1], title='time'),
+            alt.X(alt.repeat("column"), type="temporal", title="time"),
+            alt.Y(alt.repeat("row"), type="quantitative"),
+            # y=r'ip\.throughput_interval_bps_dst_src:Q',
+            # color='flow_id',
+        )
+        .properties(width=1100, height=300)
+        .repeat(row=filtered_items, column=times[:1])
+        .interactive()
+    )
+    return chart
@@ -1,15 +1,59 @@
+from .archive import (
+    ScpiArchiveReader,
+    ScpiArchiveWriter,
+    ScpiRecord,
+    ipanalysis_replay,
+)
+from .correlation import ipanalysis_correlate_delays
+from .dedup import IpanalysisDeduplicator
 from .ip_analysis import (
     ipanalysis_init_dataframes,
     ipanalysis_parse_json_result,
     ipanalysis_parse_scpi_result,
     ipanalysis_parse_scpi_schema_result,
+    ipanalysis_split_windows,
     ipanalysis_update_dataframes,
 )
+from .ndjson import (
+    ipanalysis_read_ndjson,
+    ipanalysis_read_scpi_result,
+    ipanalysis_unnest,
+)
+from .ranking import IpanalysisRanking
+from .resample import ipanalysis_counter_delta, ipanalysis_resample_reports
+from .storage import IpanalysisWriter, ipanalysis_write_dataframes, scan_ipanalysis
 
 __all__ = [
+    "IpanalysisDeduplicator",
+    "IpanalysisRanking",
+    "IpanalysisWriter",
+    "ScpiArchiveReader",
+    "ScpiArchiveWriter",
+    "ScpiRecord",
+    "ipanalysis_acquire",
+    "ipanalysis_correlate_delays",
+    "ipanalysis_counter_delta",
     "ipanalysis_init_dataframes",
-    "ipanalysis_update_dataframes",
-    "ipanalysis_parse_scpi_schema_result",
     "ipanalysis_parse_json_result",
     "ipanalysis_parse_scpi_result",
+    "ipanalysis_parse_scpi_schema_result",
+    "ipanalysis_read_ndjson",
+    "ipanalysis_read_scpi_result",
+    "ipanalysis_replay",
+    "ipanalysis_resample_reports",
+    "ipanalysis_split_windows",
+    "ipanalysis_unnest",
+    "ipanalysis_update_dataframes",
+    "ipanalysis_write_dataframes",
+    "scan_ipanalysis",
 ]
+
+
+def __getattr__(name: str):
+    # ipanalysis_acquire needs asyncio, which takes tens of milliseconds to import:
+    # load it on first use only (PEP 562)
+    if name == "ipanalysis_acquire":
+        from .acquisition import ipanalysis_acquire
+
+        return ipanalysis_acquire
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,84 @@
+from collections.abc import Mapping, Sequence
+from fnmatch import fnmatchcase
+
+import polars as pl
+
+# Column projection at ingest: the fields of the messages which are not selected are skipped
+# before being flattened (ipanalysis_update_dataframes) or read (ipanalysis_read_scpi_result).
+# The selection maps the key of a dataframe to the flattened column names or fnmatch patterns to keep, e.g.
+#   {"report": ["flow_id", "ip_bytes_*", "ip_packet_count_*"], "upd_fqdn": ["fqdn"]}
+# A selected nested object keeps all its fields ("source" keeps source_ip, source_port...).
+# The dataframes without selection keep all their columns.
+
+ColumnSelection = Mapping[str, Sequence[str]]
+
+# always kept, to join the dataframes and order the messages
+KEPT_COLUMNS = ("time", "flow_id")
+
+_WILDCARDS = "*?["
+
+
+def check_columns(columns: ColumnSelection | None, keys) -> None:
+    """
+    Raises ValueError if the selection has an unknown dataframe key.
+    """
+    if columns is None:
+        return
+    unknown = set(columns) - set(keys)
+    if unknown:
+        raise ValueError(
+            f"unknown dataframes in columns: {sorted(unknown)}, expected {list(keys)}"
+        )
+
+
+def project_message(obj: dict, patterns: Sequence[str], prefix: str = "") -> dict:
+    """
+    Returns the fields of a message whose flattened name matches one of the patterns.
+    """
+    result = {}
+    for key, value in obj.items():
+        path = prefix + key
+        if _selected(path, patterns, prefix):
+            result[key] = value
+        elif isinstance(value, dict) and _may_contain(path + "_", patterns):
+            projected = project_message(value, patterns, path + "_")
+            if projected:
+                result[key] = projected
+    return result
+
+
+def project_dtype(
+    dtype: pl.Struct, patterns: Sequence[str], prefix: str = ""
+) -> pl.Struct | None:
+    """
+    Returns the Struct type of a message with only the fields whose flattened name matches
+    one of the patterns (None if no field is selected).
+    """
+    fields = {}
+    for field in dtype.fields:
+        path = prefix + field.name
+        if _selected(path, patterns, prefix):
+            fields[field.name] = field.dtype
+        elif isinstance(field.dtype, pl.Struct) and _may_contain(path + "_", patterns):
+            projected = project_dtype(field.dtype, patterns, path + "_")
+            if projected is not None:
+                fields[field.name] = projected
+    return pl.Struct(fields) if fields else None
+
+
+def _selected(path: str, patterns: Sequence[str], prefix: str) -> bool:
+    if not prefix and path in KEPT_COLUMNS:
+        return True
+    return any(fnmatchcase(path, pattern) for pattern in patterns)
+
+
+def _may_contain(prefix: str, patterns: Sequence[str]) -> bool:
+    # a pattern may match a field of the object if its literal start is compatible with the prefix
+    for pattern in patterns:
+        end = min(
+            (i for i, c in enumerate(pattern) if c in _WILDCARDS), default=len(pattern)
+        )
+        literal = pattern[:end]
+        if literal.startswith(prefix) or prefix.startswith(literal):
+            return True
+    return False
@@ -0,0 +1,176 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import logging
+import time
+from collections.abc import Callable, Mapping
+from typing import Any
+
+from .archive import ScpiArchiveWriter
+from .dedup import IpanalysisDeduplicator
+from .ip_analysis import ipanalysis_parse_scpi_result
+
+logger = logging.getLogger(__name__)
+
+IPANALYSIS_RESULT_QUERY = "FETCh:DATA:MEASurement:IPANalysis:RESult?"
+
+# Poll many DAUs concurrently and parse the results in a worker pool.
+# example of use with RsInstrument (blocking transport, run in a thread):
+#   cmxs = {"cmx1": RsInstrument('TCPIP::10.102.20.55::hislip0'), ...}
+#
+#   def transport(instrument, command):
+#       return cmxs[instrument].query(command)
+#
+#   def on_result(instrument, parsed_sequences):
+#       for sequence in parsed_sequences:
+#           for message in sequence['json_messages']:
+#               ipana.ipanalysis_update_dataframes(list_of_dfs[instrument], message)
+#
+#   asyncio.run(ipanalysis_acquire({"cmx1": 1.0, "cmx2": 0.5}, transport, on_result))
+
+
+async def ipanalysis_acquire(
+    instruments: Mapping[str, float],
+    transport: Callable[[str, str], Any],
+    on_result: Callable[[str, list[dict]], Any],
+    command: str = IPANALYSIS_RESULT_QUERY,
+    max_concurrency: int = 8,
+    queue_size: int = 16,
+    parse_workers: int = 2,
+    executor: concurrent.futures.Executor | None = None,
+    parser: Callable[..., list[dict]] = ipanalysis_parse_scpi_result,
+    max_polls: int | None = None,
+    stop_event: asyncio.Event | None = None,
+    dedup: Mapping[str, IpanalysisDeduplicator] | None = None,
+    archive: ScpiArchiveWriter | None = None,
+) -> dict[str, int]:
+    """
+    Polls several instruments concurrently and parses their IP analysis results.
+
+    Every instrument is polled at its own interval. The raw payloads are put in a bounded queue
+    consumed by the parsing workers: when the parsing is slower than the acquisition, the pollers
+    wait for free room in the queue (backpressure) instead of accumulating payloads in memory.
+    A slow instrument only delays its own polls.
+
+    Args:
+        instruments (Mapping): The instrument ids and their polling interval in seconds.
+        transport (Callable): Called as transport(instrument, command) and returns the SCPI response
+            (str or bytes). May be a coroutine function; a blocking function is run in a thread.
+        on_result (Callable): Called as on_result(instrument, parsed_sequences) in the event loop
+            for every parsed payload. May be a coroutine function.
+        command (str): The SCPI query sent to the instruments.
+        max_concurrency (int): The maximum number of transport calls running at the same time.
+        queue_size (int): The maximum number of payloads waiting to be parsed.
+        parse_workers (int): The number of parsing workers.
+        executor (Executor): The executor running the parser (e.g. a ProcessPoolExecutor).
+            By default a thread pool of parse_workers threads is used.
+        parser (Callable): The function parsing a payload, ipanalysis_parse_scpi_result by default.
+        max_polls (int): Stop after this number of polls per instrument (default: no limit).
+        stop_event (asyncio.Event): Stop polling once this event is set.
+        dedup (Mapping): The deduplicator of every instrument, passed to the parser as dedup=..., so that
+            the sequences repeated by consecutive polls are skipped before being decoded.
+            Requires a thread executor (the default): the deduplicators are not shared with other processes.
+        archive (ScpiArchiveWriter): If given, every raw payload is recorded with its instrument and
+            acquisition time, to be replayed later (see ipanalysis_replay).
+
+    Returns:
+        dict: The number of parsed payloads per instrument.
+    """
+    if max_polls is None and stop_event is None:
+        raise ValueError("max_polls or stop_event must be given")
+    if max_concurrency < 1 or queue_size < 1 or parse_workers < 1:
+        raise ValueError("max_concurrency, queue_size and parse_workers must be >= 1")
+    if dedup is not None and not set(instruments) <= set(dedup):
+        raise ValueError("dedup must have a deduplicator for every instrument")
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    parsed_count = {instrument: 0 for instrument in instruments}
+    own_executor = executor is None
+    parse_executor = executor or concurrent.futures.ThreadPoolExecutor(
+        max_workers=parse_workers, thread_name_prefix="ipanalysis-parse"
+    )
+
+    async def query(instrument: str) -> Any:
+        if inspect.iscoroutinefunction(transport):
+            return await transport(instrument, command)
+        return await asyncio.to_thread(transport, instrument, command)
+
+    async def poll(instrument: str, interval: float) -> None:
+        polls = 0
+        next_poll = time.monotonic()
+        while max_polls is None or polls < max_polls:
+            if stop_event is not None and stop_event.is_set():
+                break
+            try:
+                async with semaphore:
+                    payload = await query(instrument)
+            except Exception:
+                logger.exception("Polling instrument %s failed", instrument)
+            else:
+                if archive is not None:
+                    # the file is written in a thread, with the time of the acquisition
+                    await asyncio.to_thread(
+                        archive.write,
+                        payload,
+                        instrument=instrument,
+                        timestamp=time.time_ns(),
+                    )
+                # blocks when the parsing workers are behind
+                await queue.put((instrument, payload))
+            polls += 1
+            next_poll += interval
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                # the instrument is slower than its interval: do not try to catch up
+                next_poll = time.monotonic()
+                delay = 0
+            if stop_event is None:
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                except TimeoutError:
+                    pass
+
+    async def parse() -> None:
+        while True:
+            instrument, payload = await queue.get()
+            try:
+                parse = (
+                    parser
+                    if dedup is None
+                    else functools.partial(parser, dedup=dedup[instrument])
+                )
+                parsed = await loop.run_in_executor(parse_executor, parse, payload)
+                result = on_result(instrument, parsed)
+                if inspect.isawaitable(result):
+                    await result
+                parsed_count[instrument] += 1
+            except Exception:
+                logger.exception(
+                    "Parsing the result of instrument %s failed", instrument
+                )
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(parse()) for _ in range(parse_workers)]
+    try:
+        await asyncio.gather(
+            *(
+                poll(instrument, interval)
+                for instrument, interval in instruments.items()
+            )
+        )
+        # let the workers parse the remaining payloads
+        await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_executor:
+            parse_executor.shutdown(wait=False)
+
+    return parsed_count
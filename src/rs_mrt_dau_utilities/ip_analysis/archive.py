@@ -0,0 +1,356 @@
+import contextlib
+import datetime
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Callable, Collection, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Self
+
+from ..timestamps import from_epoch_ns, to_epoch_ns
+from .ip_analysis import ipanalysis_parse_scpi_result
+
+# Append-only archive of the raw SCPI responses of FETCh:DATA:MEASurement:IPANalysis:RESult?,
+# to replay real acquisitions offline (reproduction of field issues, benchmarks, regression tests).
+# example of use, recording:
+#   with ScpiArchiveWriter("capture.scpiarc") as archive:
+#       archive.write(cmx.query_bin_block(IPANALYSIS_RESULT_QUERY), instrument="cmx1")
+#   # or asyncio.run(ipanalysis_acquire(..., archive=archive))
+# example of use, replaying at the original pacing:
+#   for record, parsed_sequences in ipanalysis_replay("capture.scpiarc", pacing="original"):
+#       ...
+#
+# Layout (little endian):
+#   header   b"RSSCPIA\0", version (uint16)
+#   record   payload length (uint32), CRC-32 of the payload (uint32), acquisition time in ns since
+#            the epoch (int64), instrument id length (uint16), instrument id (UTF-8), payload
+#   footer   optional index, written when the writer is closed: (offset uint64, time int64) per record,
+#            then the index offset (uint64), the number of records (uint64) and b"RSSCPIIX"
+# Every record is flushed when written: an archive whose writer was not closed has no footer and
+# is read sequentially, an incomplete last record is ignored.
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MAGIC = b"RSSCPIA\0"
+ARCHIVE_VERSION = 1
+REPLAY_PACING = ("fast", "original")
+
+_HEADER = struct.Struct("<8sH")
+_RECORD = struct.Struct("<IIqH")
+_INDEX_ENTRY = struct.Struct("<Qq")
+_TRAILER = struct.Struct("<QQ8s")
+_INDEX_MAGIC = b"RSSCPIIX"
+
+
+@dataclass(frozen=True)
+class ScpiRecord:
+    """
+    A raw SCPI response of the archive.
+
+    Attributes:
+        timestamp_ns (int): The acquisition time, in nanoseconds since the epoch (UTC).
+        instrument (str): The id of the instrument.
+        payload (bytes): The raw response, as returned by the transport.
+    """
+
+    timestamp_ns: int
+    instrument: str
+    payload: bytes
+
+    @property
+    def time(self) -> datetime.datetime:
+        """The acquisition time, as a UTC datetime (microsecond resolution)."""
+        return from_epoch_ns(self.timestamp_ns)
+
+
+class ScpiArchiveWriter:
+    """
+    Appends raw SCPI responses to an archive file (created if needed).
+
+    An existing archive is appended to: its index footer is removed and rewritten when the writer
+    is closed. The writer is thread-safe.
+
+    Args:
+        path (str | Path): The archive file.
+        index (bool): Writes the index footer when closed (default), for the random access by time
+            and the record count without scanning the archive.
+    """
+
+    def __init__(self, path: str | Path, index: bool = True) -> None:
+        self.path = Path(path)
+        self.index = index
+        self._lock = threading.Lock()
+        self._entries: list[tuple[int, int]] = []
+        # the file is closed if the archive cannot be opened, and by close() otherwise
+        with contextlib.ExitStack() as stack:
+            self._file: BinaryIO = stack.enter_context(open(self.path, "a+b"))
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() == 0:
+                self._file.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+            else:
+                # continue after the last complete record
+                self._entries, end = _read_entries(self._file)
+                self._file.truncate(end)
+            self._file.flush()
+            stack.pop_all()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def write(
+        self,
+        payload: str | bytes | bytearray | memoryview,
+        instrument: str = "",
+        timestamp: datetime.datetime | int | None = None,
+    ) -> None:
+        """
+        Appends a response to the archive.
+
+        Args:
+            payload (str | bytes | bytearray | memoryview): The raw response (a str is stored in UTF-8).
+            instrument (str): The id of the instrument.
+            timestamp (datetime | int): The acquisition time, as a datetime (naive: UTC) or in ns since
+                the epoch (default: now).
+        """
+        data = payload.encode("utf-8") if isinstance(payload, str) else payload
+        if len(data) > 0xFFFFFFFF:
+            raise ValueError("the payload of a record is limited to 4 GiB")
+        instrument_id = instrument.encode("utf-8")
+        timestamp_ns = _timestamp_ns(timestamp)
+        header = _RECORD.pack(
+            len(data), zlib.crc32(data), timestamp_ns, len(instrument_id)
+        )
+        with self._lock:
+            if self._file.closed:
+                raise ValueError("the archive is closed")
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(header)
+            self._file.write(instrument_id)
+            self._file.write(data)
+            self._file.flush()
+            self._entries.append((offset, timestamp_ns))
+
+    def close(self) -> None:
+        """
+        Writes the index footer (if enabled) and closes the file.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            try:
+                if self.index:
+                    self._file.seek(0, os.SEEK_END)
+                    index_offset = self._file.tell()
+                    self._file.write(
+                        b"".join(_INDEX_ENTRY.pack(*entry) for entry in self._entries)
+                    )
+                    self._file.write(
+                        _TRAILER.pack(index_offset, len(self._entries), _INDEX_MAGIC)
+                    )
+            finally:
+                self._file.close()
+
+
+class ScpiArchiveReader:
+    """
+    Reads the records of an archive written by ScpiArchiveWriter.
+
+    Args:
+        path (str | Path): The archive file.
+        verify (bool): Checks the CRC-32 of every payload (a corrupt record raises ValueError).
+    """
+
+    def __init__(self, path: str | Path, verify: bool = True) -> None:
+        self.path = Path(path)
+        self.verify = verify
+        with contextlib.ExitStack() as stack:
+            self._file: BinaryIO = stack.enter_context(open(self.path, "rb"))
+            self._entries, _ = _read_entries(self._file)
+            stack.pop_all()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[ScpiRecord]:
+        return self.records()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def records(
+        self,
+        instruments: Collection[str] | None = None,
+        start: datetime.datetime | int | None = None,
+        end: datetime.datetime | int | None = None,
+    ) -> Iterator[ScpiRecord]:
+        """
+        Yields the records in the order of the archive.
+
+        Args:
+            instruments (Collection): Only the records of these instruments.
+            start (datetime | int): Only the records acquired at or after this time.
+            end (datetime | int): Only the records acquired before this time.
+        """
+        start_ns = None if start is None else _timestamp_ns(start)
+        end_ns = None if end is None else _timestamp_ns(end)
+        for offset, timestamp_ns in self._entries:
+            if (start_ns is not None and timestamp_ns < start_ns) or (
+                end_ns is not None and timestamp_ns >= end_ns
+            ):
+                continue
+            record = self._read_record(offset, instruments)
+            if record is not None:
+                yield record
+
+    def replay(
+        self,
+        pacing: str = "fast",
+        speed: float = 1.0,
+        instruments: Collection[str] | None = None,
+        start: datetime.datetime | int | None = None,
+        end: datetime.datetime | int | None = None,
+    ) -> Iterator[ScpiRecord]:
+        """
+        Yields the records as fast as possible, or at the pace of the acquisition.
+
+        Args:
+            pacing (str): "fast" (default) or "original": every record is yielded at its acquisition
+                time relative to the first one, divided by speed.
+            speed (float): The replay speed factor of the original pacing (2.0: twice as fast).
+            instruments, start, end: The selection of the records, see records.
+        """
+        if pacing not in REPLAY_PACING:
+            raise ValueError(f"pacing must be one of {REPLAY_PACING}, got {pacing!r}")
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        first_ns = None
+        replay_start = 0.0
+        for record in self.records(instruments, start, end):
+            if pacing == "original":
+                if first_ns is None:
+                    first_ns = record.timestamp_ns
+                    replay_start = time.monotonic()
+                due = replay_start + (record.timestamp_ns - first_ns) / 1e9 / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield record
+
+    def _read_record(
+        self, offset: int, instruments: Collection[str] | None
+    ) -> ScpiRecord | None:
+        self._file.seek(offset)
+        length, crc, timestamp_ns, id_length = _RECORD.unpack(
+            self._file.read(_RECORD.size)
+        )
+        instrument = self._file.read(id_length).decode("utf-8")
+        if instruments is not None and instrument not in instruments:
+            return None
+        payload = self._file.read(length)
+        if self.verify and zlib.crc32(payload) != crc:
+            raise ValueError(f"corrupt record at offset {offset} of {self.path}")
+        return ScpiRecord(timestamp_ns, instrument, payload)
+
+
+def ipanalysis_replay(
+    path: str | Path,
+    parser: Callable[..., Any] = ipanalysis_parse_scpi_result,
+    pacing: str = "fast",
+    speed: float = 1.0,
+    instruments: Collection[str] | None = None,
+    **parser_kwargs: Any,
+) -> Iterator[tuple[ScpiRecord, Any]]:
+    """
+    Replays an archive through a parser, e.g. to benchmark or regression-test it on real acquisitions.
+
+    Args:
+        path (str | Path): The archive file.
+        parser (Callable): The function parsing a payload (ipanalysis_parse_scpi_result by default,
+            or ipanalysis_read_scpi_result...).
+        pacing (str): "fast" (default) or "original", see ScpiArchiveReader.replay.
+        speed (float): The replay speed factor of the original pacing.
+        instruments (Collection): Only the records of these instruments.
+        **parser_kwargs: Passed to the parser (e.g. errors="collect", quarantine=...).
+
+    Yields:
+        tuple: Every record and the result of the parser.
+    """
+    with ScpiArchiveReader(path) as reader:
+        for record in reader.replay(pacing, speed, instruments):
+            yield record, parser(record.payload, **parser_kwargs)
+
+
+def is_scpi_archive(path: str | Path) -> bool:
+    """
+    Returns True if the file starts with the header of an archive.
+    """
+    with open(path, "rb") as file:
+        return file.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def _timestamp_ns(timestamp: datetime.datetime | int | None) -> int:
+    if timestamp is None:
+        return time.time_ns()
+    if isinstance(timestamp, datetime.datetime):
+        return to_epoch_ns(timestamp)
+    return int(timestamp)
+
+
+def _read_entries(file: BinaryIO) -> tuple[list[tuple[int, int]], int]:
+    """
+    Returns the (offset, time) of the records of an archive and the end of the last record,
+    from the index footer, or by scanning the records when the archive has no footer.
+    """
+    file.seek(0)
+    magic, version = _HEADER.unpack(file.read(_HEADER.size).ljust(_HEADER.size, b"\0"))
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError(f"{getattr(file, 'name', file)} is not a SCPI archive")
+    if version > ARCHIVE_VERSION:
+        raise ValueError(f"unsupported SCPI archive version {version}")
+    size = file.seek(0, os.SEEK_END)
+
+    if size >= _HEADER.size + _TRAILER.size:
+        file.seek(size - _TRAILER.size)
+        index_offset, count, index_magic = _TRAILER.unpack(file.read(_TRAILER.size))
+        if (
+            index_magic == _INDEX_MAGIC
+            and index_offset + count * _INDEX_ENTRY.size + _TRAILER.size == size
+        ):
+            file.seek(index_offset)
+            data = file.read(count * _INDEX_ENTRY.size)
+            return list(_INDEX_ENTRY.iter_unpack(data)), index_offset
+
+    entries = []
+    offset = _HEADER.size
+    while offset + _RECORD.size <= size:
+        file.seek(offset)
+        length, _, timestamp_ns, id_length = _RECORD.unpack(file.read(_RECORD.size))
+        end = offset + _RECORD.size + id_length + length
+        if end > size:
+            break
+        entries.append((offset, timestamp_ns))
+        offset = end
+    if offset != size:
+        logger.warning(
+            "incomplete record at offset %d of %s ignored",
+            offset,
+            getattr(file, "name", file),
+        )
+    return entries, offset
@@ -0,0 +1,137 @@
+import datetime
+from collections.abc import Sequence
+
+import polars as pl
+
+from .resample import ipanalysis_resample_reports
+
+# Correlation of the IP analysis throughput with the delay measurement of the same capture.
+# example of use: throughput and one-way delay of every flow per second
+#   delays = extract_delay_from_log("centralservice.log")
+#   correlated = ipanalysis_correlate_delays(list_of_dfs["report"], delays, every="1s")
+#   correlated.select("time", "flow_id", "ip_bytes_src_dst_per_s", "delay_mean_us", "delay_p95_us")
+# The delay measurement only knows the hash of the packets: the delay statistics of an interval are
+# those of all the packets of the interval, unless the delay frames have a flow_id column (e.g. mapped
+# from the hash by the caller), given with flow_id="flow_id".
+
+
+def ipanalysis_correlate_delays(
+    report: pl.DataFrame | pl.LazyFrame,
+    delays: pl.DataFrame | dict[str, pl.DataFrame],
+    every: str | datetime.timedelta = "1s",
+    flow_id: str | None = None,
+    counters: Sequence[str] | None = None,
+    quantiles: Sequence[float] = (0.5, 0.95),
+    top_n: int | None = None,
+) -> pl.DataFrame:
+    """
+    Puts the delay statistics of every interval next to the per-flow throughput of the interval.
+
+    The "report" dataframe is resampled with ipanalysis_resample_reports. Every delay measurement packet
+    is then assigned to its interval with a sorted join_asof on time (and on the flow), and the delays
+    are aggregated per interval in the same query.
+
+    Args:
+        report (DataFrame | LazyFrame): The "report" dataframe of ipanalysis_update_dataframes.
+        delays (DataFrame | dict): The wide layout results of delay_get_segment / extract_delay_from_log
+            (the dictionary, or one of its DataFrames). The time of a packet is its first timestamp.
+        every (str | timedelta): The interval duration, e.g. "100ms" or "1s".
+        flow_id (str): The column of the delay frames with the flow_id of the packets, if any
+            (None: the delays of an interval are shared by all the flows of the interval).
+        counters (Sequence): The counter columns to resample
+            (None: the REPORT_COUNTERS of the dataframe).
+        quantiles (Sequence): The quantiles of the delay, added as "delay_p<percent>_us" columns.
+        top_n (int): If given, only the top_n flows with the most bytes are kept.
+
+    Returns:
+        DataFrame: The columns of ipanalysis_resample_reports, plus delay_packets, delay_mean_us,
+        the quantile columns and delay_max_us (null when no packet was measured in the interval).
+    """
+    series = ipanalysis_resample_reports(
+        report, every=every, counters=counters, top_n=top_n
+    )
+    packets = _delay_packets(delays, flow_id)
+
+    keys = ["time"] if flow_id is None else ["time", "flow_id"]
+    interval_end = (
+        pl.col("time").dt.offset_by(every)
+        if isinstance(every, str)
+        else pl.col("time") + every
+    )
+    # the interval of every packet is the last interval start before the packet
+    intervals = (
+        series.lazy()
+        .select(keys)
+        .unique()
+        .sort("time")
+        .with_columns(interval_end=interval_end)
+    )
+    delay_stats = (
+        packets.sort("packet_time")
+        .join_asof(
+            intervals,
+            left_on="packet_time",
+            right_on="time",
+            by=None if flow_id is None else "flow_id",
+            strategy="backward",
+            # both sides are sorted by time above
+            check_sortedness=False,
+        )
+        .filter(pl.col("packet_time") < pl.col("interval_end"))
+        .group_by(keys)
+        .agg(
+            pl.len().cast(pl.UInt32).alias("delay_packets"),
+            pl.col("delay_us").mean().alias("delay_mean_us"),
+            *(
+                pl.col("delay_us")
+                .quantile(q, interpolation="linear")
+                .alias(f"delay_p{q * 100:g}_us")
+                for q in quantiles
+            ),
+            pl.col("delay_us").max().alias("delay_max_us"),
+        )
+    )
+    return (
+        series.lazy()
+        .join(delay_stats, on=keys, how="left")
+        .sort("time", "flow_id")
+        .collect()
+    )
+
+
+def _delay_packets(
+    delays: pl.DataFrame | dict[str, pl.DataFrame], flow_id: str | None
+) -> pl.LazyFrame:
+    """
+    One row per measured packet: its time (first timestamp), its global delay and its flow_id.
+    """
+    frames = list(delays.values()) if isinstance(delays, dict) else [delays]
+    flow = [] if flow_id is None else [pl.col(flow_id).alias("flow_id")]
+    packets = []
+    for df in frames:
+        timestamps = [
+            name for name, dtype in df.schema.items() if isinstance(dtype, pl.Datetime)
+        ]
+        if not timestamps or "delay_global_us" not in df.columns:
+            raise ValueError(
+                "the delays must have the wide layout of delay_get_segment"
+            )
+        packets.append(
+            df.lazy().select(
+                pl.min_horizontal(timestamps)
+                .dt.convert_time_zone("UTC")
+                .dt.cast_time_unit("ns")
+                .alias("packet_time"),
+                pl.col("delay_global_us").cast(pl.Float64).alias("delay_us"),
+                *flow,
+            )
+        )
+    if not packets:
+        schema: dict[str, pl.DataType] = {
+            "packet_time": pl.Datetime("ns", "UTC"),
+            "delay_us": pl.Float64(),
+        }
+        if flow_id is not None:
+            schema["flow_id"] = pl.Int64()
+        return pl.LazyFrame(schema=schema)
+    return pl.concat(packets, how="diagonal_relaxed")
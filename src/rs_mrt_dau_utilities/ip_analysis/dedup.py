@@ -0,0 +1,84 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+# Skip the SCPI sequences already ingested by an earlier poll of the same instrument.
+# example of use:
+#   dedup = IpanalysisDeduplicator()
+#   while polling:
+#       parsed_sequences = ipanalysis_parse_scpi_result(cmx.query(IPANALYSIS_RESULT_QUERY), dedup=dedup)
+#   print(dedup.skipped, dedup.skipped_bytes)
+# A sequence is identified by its time and a fingerprint of its raw base64 block (length and CRC-32),
+# computed on the encoded bytes: a repeated block is skipped before being decoded and decompressed.
+
+_CRC32 = zlib.crc32
+
+
+class IpanalysisDeduplicator:
+    """
+    Remembers the fingerprints of the SCPI sequences seen so far, to skip the repeated ones.
+
+    Use one deduplicator per instrument. The deduplicator is thread-safe, but is not shared with
+    the workers of a process pool.
+
+    Args:
+        max_sequences (int): The number of fingerprints kept, the oldest ones are forgotten first
+            (None: no limit). It only has to cover the overlap between consecutive polls.
+
+    Attributes:
+        checked (int): The number of sequences checked.
+        skipped (int): The number of repeated sequences skipped.
+        skipped_bytes (int): The size of the raw blocks of the skipped sequences.
+    """
+
+    def __init__(self, max_sequences: int | None = 100000) -> None:
+        if max_sequences is not None and max_sequences < 1:
+            raise ValueError("max_sequences must be >= 1")
+        self.max_sequences = max_sequences
+        self.checked = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self._seen: OrderedDict[tuple[str, int, int], None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def seen(self, time: str, block: bytes | memoryview) -> bool:
+        """
+        Returns True if the sequence was already seen, otherwise remembers it and returns False.
+
+        Args:
+            time (str): The time of the sequence.
+            block (bytes | memoryview): The raw (base64 encoded) block of the sequence.
+        """
+        key = (time, len(block), _CRC32(block))
+        with self._lock:
+            self.checked += 1
+            if key in self._seen:
+                self.skipped += 1
+                self.skipped_bytes += len(block)
+                return True
+            self._seen[key] = None
+            if self.max_sequences is not None and len(self._seen) > self.max_sequences:
+                self._seen.popitem(last=False)
+            return False
+
+    def counters(self) -> dict[str, int]:
+        """
+        Returns the checked, skipped and skipped_bytes counters.
+        """
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skipped_bytes": self.skipped_bytes,
+            }
+
+    def clear(self) -> None:
+        """
+        Forgets the fingerprints and resets the counters (e.g. when a new measurement starts).
+        """
+        with self._lock:
+            self._seen.clear()
+            self.checked = self.skipped = self.skipped_bytes = 0
@@ -1,12 +1,21 @@
-import base64
-import gzip
+import binascii
 import json
 import logging
 import re
+from collections.abc import Iterator
+from time import perf_counter
 
-import fast_json_normalize
 import polars as pl
 
+from .._categorical import encode_categorical
+from .._decode import BytesLike, gunzip, split_json_lines
+from ..json_backend import JsonBackend, get_json_backend
+from ..quarantine import PARSE_ERRORS, Quarantine, check_error_policy, error_stage
+from ..stats import PipelineStats
+from ..time_index import TimeIndex
+from ._projection import ColumnSelection, check_columns, project_message
+from .dedup import IpanalysisDeduplicator
+
 # parse a SCPI result obtained with FETCh:DATA:MEASurement:IPANalysis:RESult?
 # return a list of pattern: ['time', json_messages']
 # example of use: Print the parsed sequences
@@ -19,34 +28,74 @@ import polars as pl
 #    print()
 
 
-def ipanalysis_parse_scpi_result(scpi_result: str) -> list[dict]:
+# SCPI results may be given as str or as raw bytes (bytes, bytearray, memoryview):
+# the bytes are scanned in place and only the slices of the blocks are decoded.
+ScpiResult = str | BytesLike
+
+logger = logging.getLogger(__name__)
+
+# low-cardinality columns of the dataframes, stored as Categorical (the missing ones are ignored)
+IPANALYSIS_CATEGORICAL = (
+    "classification_application",
+    "classification_protocol",
+    "classification_service",
+    "ssl_version",
+    "interface",
+    "network_interface",
+    "source_geo_country",
+    "destination_geo_country",
+)
+
+_SEQUENCE_TIME = re.compile(rb'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})",')
+_BLOCK_LENGTH = re.compile(rb"#\d+")
+_SCHEMA_START = re.compile(rb'\{"\$schema"')
+# separators between a block and the time of the next sequence
+_BLOCK_TRAILER = frozenset(b' ,"\r\n\t')
+
+
+def ipanalysis_parse_scpi_result(
+    scpi_result: ScpiResult,
+    stats: PipelineStats | None = None,
+    errors: str = "skip",
+    quarantine: Quarantine | None = None,
+    dedup: IpanalysisDeduplicator | None = None,
+    json_backend: str | JsonBackend | None = None,
+) -> list[dict]:
     """
     Processes a given SCPI result string by splitting it into sequences based on a time pattern and SCPI block.
 
     Args:
-        scpi_result (str): A string containing the SCPI result data.
+        scpi_result (str | bytes | bytearray | memoryview): The SCPI result data.
+            Raw bytes from the transport are processed without decoding them to str.
+        stats (PipelineStats): If given, the time spent in every stage (regex, base64, gzip, json) is recorded.
+        errors (str): The handling of malformed blocks and messages: "raise", "skip" (default, the number of
+            skipped messages is logged) or "collect" (skipped and added to the quarantine).
+        quarantine (Quarantine): Collects the malformed blocks and messages when errors="collect".
+        dedup (IpanalysisDeduplicator): If given, the sequences already seen by this deduplicator
+            (e.g. in an earlier, overlapping poll) are skipped before being decoded.
+        json_backend (str | JsonBackend): The JSON decoder: "auto", "msgspec", "orjson" or "stdlib"
+            (None: the default of set_json_backend), see rs_mrt_dau_utilities.json_backend.
 
     Returns:
         list: A list of dictionaries, each containing a time and a list of parsed JSON messages.
     """
-    # Split the input into sequences based on the pattern: time, SCPI block
-    sequences = re.split(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})",', scpi_result)[1:]
+    check_error_policy(errors, quarantine)
+    backend = get_json_backend(json_backend)
 
     # Initialize a list to store the parsed sequences
     parsed_sequences = []
 
-    # print(f"split len: {len(sequences)}")
-
-    # Iterate over the sequences in pairs (time, SCPI block)
-    for i in range(0, len(sequences), 2):
-        time = sequences[i]
-        scpi_block_with_len = sequences[i + 1]
-
-        # remove the length of the block data
-        scpi_block = re.split(r"#(\d+)", scpi_block_with_len)[2]
-
-        # print(f"time_json_messages: {time_json_messages}")
-        time_json_messages = ipanalysis_parse_json_result(time, scpi_block)
+    for time, block in _scpi_blocks(
+        scpi_result, "ipanalysis_parse_scpi_result", stats, errors, quarantine, dedup
+    ):
+        time_json_messages = ipanalysis_parse_json_result(
+            time,
+            block,
+            stats=stats,
+            errors=errors,
+            quarantine=quarantine,
+            json_backend=backend,
+        )
 
         # Store the time and parsed JSON messages in the result list
         parsed_sequences.append(time_json_messages)
@@ -54,7 +103,78 @@ def ipanalysis_parse_scpi_result(scpi_result: str) -> list[dict]:
     return parsed_sequences
 
 
-def ipanalysis_parse_json_result(time: str, encoded_json_block: str) -> dict:
+def _scpi_blocks(
+    scpi_result: ScpiResult,
+    stage: str,
+    stats: PipelineStats | None,
+    errors: str,
+    quarantine: Quarantine | None,
+    dedup: IpanalysisDeduplicator | None = None,
+) -> Iterator[tuple[str, memoryview]]:
+    """
+    Yields the time and the base64 block of every sequence of a SCPI result.
+    The sequences without block length are handled according to the error policy,
+    the sequences already seen by dedup are skipped.
+    """
+    if stats is not None:
+        t_start = perf_counter()
+    view = _as_byte_view(scpi_result)
+
+    # Split the input into sequences based on the pattern: time, SCPI block
+    matches = list(_SEQUENCE_TIME.finditer(view))
+    if stats is not None:
+        stats.record(
+            stage + ".regex",
+            perf_counter() - t_start,
+            bytes_in=len(view),
+            rows=len(matches),
+        )
+    for i, match in enumerate(matches):
+        time = match.group(1).decode("ascii")
+        block_end = matches[i + 1].start() if i + 1 < len(matches) else len(view)
+
+        # remove the length of the block data
+        block_length = _BLOCK_LENGTH.search(view, match.end(), block_end)
+        if block_length is None:
+            message = f"SCPI block of the sequence {time} has no length"
+            if errors == "raise":
+                raise ValueError(message)
+            logger.warning("%s: sequence skipped", message)
+            if quarantine is not None:
+                quarantine.add(
+                    time, None, "framing", message, view[match.end() : block_end]
+                )
+            continue
+
+        block = view[block_length.end() : block_end]
+        if dedup is not None:
+            if stats is not None:
+                t0 = perf_counter()
+            # the separators after the block depend on its position in the result
+            end = len(block)
+            while end and block[end - 1] in _BLOCK_TRAILER:
+                end -= 1
+            repeated = dedup.seen(time, block[:end])
+            if stats is not None:
+                stats.record(
+                    stage + ".dedup",
+                    perf_counter() - t0,
+                    bytes_in=len(block),
+                    rows=0 if repeated else 1,
+                )
+            if repeated:
+                continue
+        yield time, block
+
+
+def ipanalysis_parse_json_result(
+    time: str,
+    encoded_json_block: ScpiResult,
+    stats: PipelineStats | None = None,
+    errors: str = "skip",
+    quarantine: Quarantine | None = None,
+    json_backend: str | JsonBackend | None = None,
+) -> dict:
     """
     Processes a base64 block:
     - obtain the binary gzip string
@@ -63,46 +183,126 @@ def ipanalysis_parse_json_result(time: str, encoded_json_block: str) -> dict:
 
     Args:
         time (str): A string representing the time associated with the JSON messages.
-        encoded_json_block (str): A base64 block who is a gzip string containing the JSON messages, separated by newline characters.
+        encoded_json_block (str | bytes | bytearray | memoryview): A base64 block who is a gzip string containing the JSON messages, separated by newline characters.
+        stats (PipelineStats): If given, the time spent in every stage (base64, gzip, json) is recorded.
+        errors (str): The handling of a malformed block or message: "raise", "skip" (default) or "collect".
+        quarantine (Quarantine): Collects the malformed block or messages when errors="collect".
+        json_backend (str | JsonBackend): The JSON decoder (None: the default of set_json_backend).
 
     Returns:
         dict: A dictionary containing the time and a list of parsed JSON messages.
     """
-    decoded_scpi_block = base64.b64decode(encoded_json_block)
-    decompressed_data = gzip.decompress(decoded_scpi_block)
-    # Split the SCPI block into individual JSON messages
-    json_block = decompressed_data.decode("utf-8")
+    check_error_policy(errors, quarantine)
+    loads = get_json_backend(json_backend).loads
+    if stats is not None:
+        t0 = perf_counter()
+    try:
+        decoded_scpi_block = binascii.a2b_base64(encoded_json_block)
+        if stats is not None:
+            t1 = perf_counter()
+        decompressed_data = gunzip(decoded_scpi_block)
+        if stats is not None:
+            t2 = perf_counter()
+        # Split the SCPI block into individual JSON messages
+        json_messages = split_json_lines(decompressed_data)
+    except PARSE_ERRORS as exc:
+        if errors == "raise":
+            raise
+        logger.warning("SCPI block of the sequence %s skipped: %r", time, exc)
+        if quarantine is not None:
+            quarantine.add(
+                time,
+                None,
+                error_stage(exc),
+                f"{type(exc).__name__}: {exc}",
+                encoded_json_block,
+            )
+        if stats is not None:
+            stats.record(
+                "ipanalysis_parse_json_result.base64",
+                perf_counter() - t0,
+                bytes_in=len(encoded_json_block),
+                malformed=1,
+            )
+        return {"time": time, "json_messages": []}
 
-    json_messages = json_block.strip().split("\n")
     # Parse each JSON message
-    parsed_json_messages = []
-    for message in json_messages:
-        try:
-            parsed_json_messages.append(json.loads(message))
-        except json.JSONDecodeError:
-            print(f"\njson.JSONDecodeError: {message}")
-            continue
+    malformed = 0
+    try:
+        parsed_json_messages = [loads(message) for message in json_messages]
+    except json.JSONDecodeError:
+        if errors == "raise":
+            raise
+        # slow path, only taken when the block has a malformed message
+        parsed_json_messages = []
+        for index, message in enumerate(json_messages):
+            try:
+                parsed_json_messages.append(loads(message))
+            except json.JSONDecodeError as exc:
+                malformed += 1
+                if quarantine is not None:
+                    quarantine.add(
+                        time, index, "json", f"JSONDecodeError: {exc}", message
+                    )
+        logger.warning(
+            "%d malformed JSON messages skipped in the sequence %s", malformed, time
+        )
+
+    if stats is not None:
+        stats.record(
+            "ipanalysis_parse_json_result.base64",
+            t1 - t0,
+            bytes_in=len(encoded_json_block),
+            bytes_out=len(decoded_scpi_block),
+        )
+        stats.record(
+            "ipanalysis_parse_json_result.gzip",
+            t2 - t1,
+            bytes_in=len(decoded_scpi_block),
+            bytes_out=len(decompressed_data),
+        )
+        stats.record(
+            "ipanalysis_parse_json_result.json",
+            perf_counter() - t2,
+            bytes_in=len(decompressed_data),
+            rows=len(parsed_json_messages),
+            malformed=malformed,
+        )
 
     # Store the time and parsed JSON messages in the result
     return {"time": time, "json_messages": parsed_json_messages}
 
 
-def ipanalysis_parse_scpi_schema_result(schema_result: str) -> dict | None:
+def _as_byte_view(data: ScpiResult) -> memoryview:
+    """
+    Returns a memoryview of bytes over the given SCPI data, without copying bytes-like objects.
+    """
+    if isinstance(data, str):
+        return memoryview(data.encode("utf-8"))
+    view = memoryview(data)
+    if view.format != "B" or view.ndim != 1:
+        view = view.cast("B")
+    return view
+
+
+def ipanalysis_parse_scpi_schema_result(schema_result: ScpiResult) -> dict | None:
     """
     Parses the SCPI schema result string and extracts the JSON schema.
 
     Args:
-        schema_result (str): A string containing the SCPI schema result.
+        schema_result (str | bytes | bytearray | memoryview): The SCPI schema result.
 
     Returns:
         dict: A dictionary representing the parsed JSON schema, or None if the schema is not found or if there is an error in parsing.
     """
+    view = _as_byte_view(schema_result)
     try:
         # Find the index of '{"$schema"'
-        start_index = schema_result.find('{"$schema"')
-        if start_index != -1:
+        schema_start = _SCHEMA_START.search(view)
+        if schema_start is not None:
+            start_index = schema_start.start()
             # Create a new string starting from '{"$schema"'
-            json_schema_str = schema_result[start_index:].strip()
+            json_schema_str = bytes(view[start_index:]).strip()
             json_schema = json.loads(json_schema_str)
             return json_schema
         else:
@@ -137,7 +337,12 @@ def ipanalysis_init_dataframes() -> dict[str, pl.DataFrame]:
 
 
 def ipanalysis_update_dataframes(
-    list_of_dfs: dict[str, pl.DataFrame], message: dict
+    list_of_dfs: dict[str, pl.DataFrame],
+    message: dict,
+    stats: PipelineStats | None = None,
+    categorical: bool = True,
+    nested: bool = False,
+    columns: ColumnSelection | None = None,
 ) -> dict[str, pl.DataFrame]:
     """
     Updates the dictionary of Polars DataFrames based on the contents of a given message.
@@ -145,10 +350,19 @@ def ipanalysis_update_dataframes(
     Args:
         list_of_dfs (dict): A dictionary containing Polars DataFrames for various categories (ipanalysis_init_dataframes may be used to get the initial values).
         message (dict): A dictionary containing the message data to be processed.
+        stats (PipelineStats): If given, the time spent in every stage (normalize, frame, concat) is recorded.
+        categorical (bool): Stores the low-cardinality String columns (IPANALYSIS_CATEGORICAL: application,
+            protocol, SSL version...) as Categorical.
+        nested (bool): Keeps the nested objects of the message (source, destination, classification, ssl, ip,
+            tcp...) as Struct columns instead of flattening them into "_" separated columns, see ipanalysis_unnest.
+        columns (dict): If given, the columns to keep per dataframe key, as flattened names or fnmatch patterns
+            (e.g. {"report": ["ip_bytes_*", "ip_packet_count_*"]}). The other fields are skipped before
+            being flattened; time and flow_id are always kept.
 
     Returns:
         dict: The updated dictionary of Polars DataFrames.
     """
+    check_columns(columns, list_of_dfs)
     data = message
     msgs = []
     # default
@@ -186,21 +400,77 @@ def ipanalysis_update_dataframes(
         msgs = [data["FLOW_CLOSED"]]
         key = "flow_closed"
 
+    if not nested:
+        # imported on first use: fast_json_normalize loads pandas, which takes hundreds of milliseconds
+        import fast_json_normalize
+
     # normalize the data
     for i in msgs:
+        if stats is not None:
+            t0 = perf_counter()
         # test if 'time' key has not been replaced
         if isinstance(i["time"], dict):
             i["time"] = i["time"]["secs"] * 1000000000 + i["time"]["nanos"]
-        msg_norm = fast_json_normalize.fast_json_normalize(
-            i,
-            separator="_",
-            to_pandas=False,
-            order_to_pandas=False,
-        )
+        if columns is not None and key in columns:
+            i = project_message(i, columns[key])
+        if nested:
+            # the nested objects become Struct columns
+            msg_norm = i
+        else:
+            msg_norm = fast_json_normalize.fast_json_normalize(
+                i,
+                separator="_",
+                to_pandas=False,
+                order_to_pandas=False,
+            )
+        if stats is not None:
+            t1 = perf_counter()
         # convert the time to datetime with the correct timezone
         msg_df = pl.from_dicts([msg_norm]).with_columns(
             time=pl.from_epoch("time", time_unit="ns").dt.replace_time_zone("UTC")
         )
+        if categorical:
+            msg_df = encode_categorical(msg_df, IPANALYSIS_CATEGORICAL)
+        if stats is not None:
+            t2 = perf_counter()
         list_of_dfs[key] = pl.concat([list_of_dfs[key], msg_df], how="diagonal_relaxed")
+        if stats is not None:
+            stats.record("ipanalysis_update_dataframes.normalize", t1 - t0)
+            stats.record("ipanalysis_update_dataframes.frame", t2 - t1, rows=1)
+            stats.record(
+                "ipanalysis_update_dataframes.concat",
+                perf_counter() - t2,
+                rows=list_of_dfs[key].height,
+            )
 
     return list_of_dfs
+
+
+def ipanalysis_split_windows(
+    list_of_dfs: dict[str, pl.DataFrame],
+    windows: list[tuple],
+    closed: str = "both",
+) -> list[dict[str, pl.DataFrame]]:
+    """
+    Splits the IP analysis dataframes into time windows (e.g. one per test case).
+
+    Every dataframe is sorted by time once, then every window is a binary search returning a zero-copy slice.
+
+    Args:
+        list_of_dfs (dict): The dictionary of Polars DataFrames of ipanalysis_update_dataframes.
+        windows (list): The (start, end) tuples of the windows (datetime, None for an open bound).
+        closed (str): The closed bounds of the windows: "both" (default), "left", "right" or "none".
+
+    Returns:
+        list: One dictionary of DataFrames per window, with the same keys as list_of_dfs.
+    """
+    per_window: list[dict[str, pl.DataFrame]] = [{} for _ in windows]
+    for key, df in list_of_dfs.items():
+        if "time" in df.columns:
+            slices = TimeIndex(df, "time").slices(windows, closed=closed)
+        else:
+            # empty dataframe, nothing received for this category
+            slices = [df] * len(windows)
+        for window, df_slice in zip(per_window, slices):
+            window[key] = df_slice
+    return per_window
@@ -0,0 +1,275 @@
+import binascii
+import io
+import logging
+from collections.abc import Sequence
+from pathlib import Path
+from time import perf_counter
+
+import polars as pl
+
+from .._categorical import encode_categorical
+from .._decode import gunzip
+from ..quarantine import PARSE_ERRORS, Quarantine, check_error_policy, error_stage
+from ..stats import PipelineStats
+from ._projection import ColumnSelection, check_columns, project_dtype
+from .dedup import IpanalysisDeduplicator
+from .ip_analysis import (
+    IPANALYSIS_CATEGORICAL,
+    ScpiResult,
+    _scpi_blocks,
+    ipanalysis_init_dataframes,
+)
+
+# Native NDJSON reading of the IP analysis messages, optionally keeping the nested objects as Struct columns.
+# example of use: only flatten the endpoints of the FLOW_STARTED messages
+#   list_of_dfs = ipanalysis_read_scpi_result(scpi_result, nested=True)
+#   flow_started = ipanalysis_unnest(list_of_dfs["flow_started"], ["source", "destination"])
+# The messages of a whole SCPI result are read at once by the Polars JSON reader, instead of being
+# normalized and concatenated one by one: rare fields are fields of a Struct column instead of
+# mostly null top-level columns.
+
+logger = logging.getLogger(__name__)
+
+# message type -> key of the dataframes (same keys as ipanalysis_init_dataframes)
+MESSAGE_KEYS = {
+    "FLOW_STARTED": "flow_started",
+    "REPORT": "report",
+    "UPDATE_CLASSIFICATION": "upd_classification",
+    "UPDATE_NETWORK": "upd_network",
+    "UPDATE_FQDN": "upd_fqdn",
+    "UPDATE_SSL": "upd_ssl",
+    "FLOW_CLOSED": "flow_closed",
+}
+
+
+def ipanalysis_read_scpi_result(
+    scpi_result: ScpiResult,
+    nested: bool = False,
+    categorical: bool = True,
+    stats: PipelineStats | None = None,
+    errors: str = "skip",
+    quarantine: Quarantine | None = None,
+    columns: ColumnSelection | None = None,
+    dedup: IpanalysisDeduplicator | None = None,
+) -> dict[str, pl.DataFrame]:
+    """
+    Builds the IP analysis dataframes of a SCPI result with the native NDJSON reader of Polars.
+
+    This replaces ipanalysis_parse_scpi_result and ipanalysis_update_dataframes: the blocks are decompressed,
+    then all their JSON messages are read at once.
+
+    Args:
+        scpi_result (str | bytes | bytearray | memoryview): The SCPI result data.
+        nested (bool): Keeps the nested objects as Struct columns; False (default) unnests them into
+            "_" separated columns, as ipanalysis_update_dataframes.
+        categorical (bool): Stores the low-cardinality top-level String columns as Categorical.
+        stats (PipelineStats): If given, the time spent in every stage (regex, decode, json, frame) is recorded.
+        errors (str): The handling of malformed blocks: "raise", "skip" (default) or "collect".
+            A block with a malformed message is skipped as a whole.
+        quarantine (Quarantine): Collects the malformed blocks when errors="collect".
+        columns (dict): If given, the columns to keep per dataframe key, as in ipanalysis_update_dataframes.
+            The schema is inferred first, then the messages are read with the selected fields only.
+        dedup (IpanalysisDeduplicator): If given, the sequences already seen are skipped before being decoded,
+            see ipanalysis_parse_scpi_result.
+
+    Returns:
+        dict: The dataframes, with the same keys as ipanalysis_init_dataframes.
+    """
+    check_error_policy(errors, quarantine)
+    check_columns(columns, MESSAGE_KEYS.values())
+    times = []
+    blocks = []
+    for time, block in _scpi_blocks(
+        scpi_result, "ipanalysis_read_scpi_result", stats, errors, quarantine, dedup
+    ):
+        if stats is not None:
+            t0 = perf_counter()
+        try:
+            blocks.append(gunzip(binascii.a2b_base64(block)))
+            times.append(time)
+        except PARSE_ERRORS as exc:
+            if errors == "raise":
+                raise
+            logger.warning("SCPI block of the sequence %s skipped: %r", time, exc)
+            if quarantine is not None:
+                quarantine.add(
+                    time, None, error_stage(exc), f"{type(exc).__name__}: {exc}", block
+                )
+        if stats is not None:
+            stats.record(
+                "ipanalysis_read_scpi_result.decode",
+                perf_counter() - t0,
+                bytes_in=len(block),
+            )
+
+    if stats is not None:
+        t1 = perf_counter()
+    try:
+        raw = _read_ndjson(b"\n".join(blocks), columns)
+    except pl.exceptions.ComputeError:
+        if errors == "raise":
+            raise
+        # slow path, only taken when a block has a malformed message
+        frames = []
+        for time, data in zip(times, blocks):
+            try:
+                frames.append(_read_ndjson(data, columns))
+            except pl.exceptions.ComputeError as exc:
+                logger.warning("SCPI block of the sequence %s skipped: %r", time, exc)
+                if quarantine is not None:
+                    quarantine.add(time, None, "json", f"ComputeError: {exc}", data)
+        raw = pl.concat(frames, how="diagonal_relaxed") if frames else pl.DataFrame()
+    if stats is not None:
+        t2 = perf_counter()
+        stats.record(
+            "ipanalysis_read_scpi_result.json",
+            t2 - t1,
+            bytes_in=sum(len(data) for data in blocks),
+            rows=raw.height,
+        )
+    list_of_dfs = _message_frames(raw, nested, categorical)
+    if stats is not None:
+        stats.record(
+            "ipanalysis_read_scpi_result.frame",
+            perf_counter() - t2,
+            rows=sum(df.height for df in list_of_dfs.values()),
+        )
+    return list_of_dfs
+
+
+def ipanalysis_read_ndjson(
+    source: str | Path | bytes,
+    nested: bool = False,
+    categorical: bool = True,
+    columns: ColumnSelection | None = None,
+) -> dict[str, pl.DataFrame]:
+    """
+    Builds the IP analysis dataframes from JSON lines messages (one message per line, e.g. a decompressed
+    SCPI block or a dump of the messages) with the native NDJSON reader of Polars.
+
+    Args:
+        source (str | Path | bytes): A JSON lines file, or the JSON lines data.
+        nested (bool): Keeps the nested objects as Struct columns, see ipanalysis_read_scpi_result.
+        categorical (bool): Stores the low-cardinality top-level String columns as Categorical.
+        columns (dict): If given, the columns to keep per dataframe key, see ipanalysis_read_scpi_result.
+
+    Returns:
+        dict: The dataframes, with the same keys as ipanalysis_init_dataframes.
+    """
+    check_columns(columns, MESSAGE_KEYS.values())
+    return _message_frames(_read_ndjson(source, columns), nested, categorical)
+
+
+def ipanalysis_unnest(
+    df: pl.DataFrame | pl.LazyFrame,
+    columns: Sequence[str] | None = None,
+    separator: str = "_",
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Unnests Struct columns recursively into "<column><separator><field>" columns
+    (e.g. source -> source_ip, source_port, source_flags_V4_is_loopback...).
+
+    Args:
+        df (DataFrame | LazyFrame): A dataframe with Struct columns (e.g. of ipanalysis_read_scpi_result).
+        columns (Sequence): The Struct columns to unnest (None: all of them).
+        separator (str): The separator between the column and field names.
+
+    Returns:
+        DataFrame | LazyFrame: The dataframe with the Struct columns replaced by their fields.
+    """
+    prefixes = None if columns is None else tuple(f"{c}{separator}" for c in columns)
+    while True:
+        schema = df.collect_schema() if isinstance(df, pl.LazyFrame) else df.schema
+        structs = [
+            name
+            for name, dtype in schema.items()
+            if isinstance(dtype, pl.Struct)
+            and (columns is None or name in columns or name.startswith(prefixes))  # type: ignore[arg-type]
+        ]
+        if not structs:
+            return df
+        df = df.unnest(structs, separator=separator)
+
+
+def _read_ndjson(
+    source: str | Path | bytes, columns: ColumnSelection | None = None
+) -> pl.DataFrame:
+    if isinstance(source, bytes):
+        if not source.strip():
+            return pl.DataFrame()
+        data = source
+        source = io.BytesIO(data)  # type: ignore[assignment]
+    if columns is None:
+        # all the lines are used to infer the schema, so that rare fields are not dropped
+        return pl.read_ndjson(source, infer_schema_length=None)
+    schema = pl.scan_ndjson(source, infer_schema_length=None).collect_schema()
+    if isinstance(source, io.BytesIO):
+        source = io.BytesIO(data)  # type: ignore[assignment]
+    # the fields missing from the schema are skipped by the reader
+    return pl.read_ndjson(source, schema=_project_schema(schema, columns))
+
+
+def _project_schema(
+    schema: pl.Schema, columns: ColumnSelection
+) -> dict[str, pl.DataType]:
+    """
+    Keeps the selected fields in the Struct types of the messages (one top-level column per message type).
+    """
+    projected: dict[str, pl.DataType] = {}
+    for message, dtype in schema.items():
+        key = MESSAGE_KEYS.get(message)
+        if key not in columns or not isinstance(dtype, pl.Struct):
+            projected[message] = dtype
+            continue
+        patterns = columns[key]  # type: ignore[index]
+        if message == "REPORT":
+            # the selection applies to the flows of the report
+            fields = {field.name: field.dtype for field in dtype.fields}
+            flows = fields.get("flows_stat")
+            if isinstance(flows, pl.List) and isinstance(flows.inner, pl.Struct):
+                flow = project_dtype(flows.inner, patterns)
+                if flow is not None:
+                    fields["flows_stat"] = pl.List(flow)
+            projected[message] = pl.Struct(fields)
+        else:
+            message_dtype = project_dtype(dtype, patterns)
+            if message_dtype is not None:
+                projected[message] = message_dtype
+    return projected
+
+
+def _message_frames(
+    raw: pl.DataFrame, nested: bool, categorical: bool
+) -> dict[str, pl.DataFrame]:
+    """
+    Splits the frame of the messages (one Struct column per message type) into one frame per type.
+    """
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message, key in MESSAGE_KEYS.items():
+        if message not in raw.columns:
+            continue
+        df = raw.select(message).filter(pl.col(message).is_not_null()).unnest(message)
+        if message == "REPORT":
+            # one row per flow, with the time of the report
+            df = (
+                df.explode("flows_stat")
+                .filter(pl.col("flows_stat").is_not_null())
+                .unnest("flows_stat")
+                .select(pl.all().exclude("time"), "time")
+            )
+        if "time" in df.columns:
+            df = df.with_columns(time=_epoch_time(pl.col("time")))
+        if not nested:
+            df = ipanalysis_unnest(df)  # type: ignore[assignment]
+        if categorical:
+            df = encode_categorical(df, IPANALYSIS_CATEGORICAL)
+        list_of_dfs[key] = df
+    return list_of_dfs
+
+
+def _epoch_time(time: pl.Expr) -> pl.Expr:
+    # {"secs": ..., "nanos": ...} -> UTC datetime
+    return pl.from_epoch(
+        time.struct.field("secs") * 1000000000 + time.struct.field("nanos"),
+        time_unit="ns",
+    ).dt.replace_time_zone("UTC")
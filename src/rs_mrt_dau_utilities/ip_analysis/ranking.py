@@ -0,0 +1,406 @@
+import datetime
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+
+import polars as pl
+
+from ..timestamps import to_epoch_ns
+from .ndjson import ipanalysis_unnest
+from .resample import ipanalysis_counter_delta
+
+# Ranking of the flows, applications and FQDNs by bytes, packets or duration.
+# The totals are kept per flow while the messages are ingested, so a ranking does not rescan the reports.
+# example of use on a live session:
+#   ranking = IpanalysisRanking(bucket=datetime.timedelta(seconds=10))
+#   for sequence in parsed_sequences:
+#       for message in sequence['json_messages']:
+#           ranking.update(message)
+#   ranking.top(10, by="bytes", group_by="fqdn")
+# example of use after the fact:
+#   ranking = IpanalysisRanking()
+#   ranking.update_dataframes(list_of_dfs)   # or scan_ipanalysis("captures")
+#   ranking.top(10, by="duration")
+
+# counters of the flows_stat (cumulated since the start of the flow) and the matching totals
+_COUNTERS = (
+    "bytes_src_dst",
+    "bytes_dst_src",
+    "packet_count_src_dst",
+    "packet_count_dst_src",
+)
+_TOTALS = ("bytes_src_dst", "bytes_dst_src", "packets_src_dst", "packets_dst_src")
+# the update messages providing the labels of a flow, and the matching dataframes
+_LABEL_MESSAGES = {
+    "UPDATE_CLASSIFICATION": "upd_classification",
+    "UPDATE_FQDN": "upd_fqdn",
+}
+RANK_BY = ("bytes", "packets", "duration")
+
+
+@dataclass
+class _Flow:
+    totals: list[int] = field(default_factory=lambda: [0, 0, 0, 0])
+    counters: list[int] | None = None
+    first_time: int | None = None
+    last_time: int | None = None
+    labels: dict = field(default_factory=dict)
+
+    def touch(self, time: int) -> None:
+        if self.first_time is None or time < self.first_time:
+            self.first_time = time
+        if self.last_time is None or time > self.last_time:
+            self.last_time = time
+
+
+class IpanalysisRanking:
+    """
+    Keeps running per-flow totals of the IP analysis messages and ranks the flows,
+    or the labels of the flows (application, FQDN...), by bytes, packets or duration.
+
+    The labels are the fields of the latest UPDATE_CLASSIFICATION and UPDATE_FQDN messages of
+    every flow, with the same names as the columns of ipanalysis_update_dataframes
+    (e.g. "fqdn", "classification_application").
+
+    Args:
+        bucket (timedelta): If given, the totals are also kept per time bucket of this duration,
+            so that top() can rank the traffic of a time interval (with the bucket resolution).
+        cumulative (bool): True if the counters of the reports are cumulated since the start of the flow.
+    """
+
+    def __init__(
+        self, bucket: datetime.timedelta | None = None, cumulative: bool = True
+    ) -> None:
+        if bucket is not None and bucket <= datetime.timedelta(0):
+            raise ValueError("bucket must be a positive duration")
+        self.bucket_ns = (
+            None
+            if bucket is None
+            else bucket // datetime.timedelta(microseconds=1) * 1000
+        )
+        self.cumulative = cumulative
+        self._flows: dict[int, _Flow] = {}
+        self._buckets: dict[tuple[int, int], list[int]] = {}
+
+    def update(self, message: dict) -> None:
+        """
+        Updates the totals with a parsed JSON message (see ipanalysis_parse_scpi_result).
+        """
+        if "REPORT" in message:
+            report = message["REPORT"]
+            time = _time_ns(report["time"])
+            for stat in report["flows_stat"]:
+                ip = stat.get("ip") or {}
+                self._add_counters(
+                    stat["flow_id"], time, [ip.get(c) or 0 for c in _COUNTERS]
+                )
+            return
+        for key, content in message.items():
+            if key in ("FLOW_STARTED", "FLOW_CLOSED"):
+                flow = self._flow(content["flow_id"])
+                flow.touch(_time_ns(content["time"]))
+            elif key in _LABEL_MESSAGES:
+                flow = self._flow(content["flow_id"])
+                flow.labels.update(
+                    _flatten(
+                        {
+                            name: value
+                            for name, value in content.items()
+                            if name not in ("time", "flow_id")
+                        }
+                    )
+                )
+
+    def update_dataframes(
+        self, list_of_dfs: dict[str, pl.DataFrame] | dict[str, pl.LazyFrame]
+    ) -> None:
+        """
+        Updates the totals with the dataframes of ipanalysis_update_dataframes (or the LazyFrames of
+        scan_ipanalysis). The reports must be more recent than the ones already ingested.
+        The Struct columns of ipanalysis_read_scpi_result(..., nested=True) are unnested.
+
+        Raises:
+            ValueError: If counter columns ("ip_bytes_src_dst", ...) are missing in the "report" dataframe.
+        """
+        if "report" in list_of_dfs:
+            self._add_report_frame(
+                ipanalysis_unnest(list_of_dfs["report"].lazy(), ["ip"]).lazy()
+            )
+        for key in ("flow_started", "flow_closed"):
+            lf = list_of_dfs.get(key)
+            if lf is None or not {"flow_id", "time"} <= set(
+                lf.lazy().collect_schema().names()
+            ):
+                continue
+            times = (
+                lf.lazy()
+                .group_by("flow_id")
+                .agg(
+                    pl.col("time").min().dt.epoch("ns").alias("first"),
+                    pl.col("time").max().dt.epoch("ns").alias("last"),
+                )
+                .collect()
+            )
+            for flow_id, first, last in times.iter_rows():
+                flow = self._flow(flow_id)
+                flow.touch(first)
+                flow.touch(last)
+        for key in _LABEL_MESSAGES.values():
+            lf = list_of_dfs.get(key)
+            if lf is None:
+                continue
+            lf = ipanalysis_unnest(lf.lazy()).lazy()
+            columns = lf.collect_schema().names()
+            labels = [c for c in columns if c not in ("time", "flow_id")]
+            if "flow_id" not in columns or not labels:
+                continue
+            latest = lf.lazy()
+            if "time" in columns:
+                latest = latest.sort("time")
+            latest_labels = (
+                latest.group_by("flow_id", maintain_order=True)
+                .agg(pl.col(labels).drop_nulls().last())
+                .collect()
+            )
+            for row in latest_labels.iter_rows(named=True):
+                flow = self._flow(row.pop("flow_id"))
+                flow.labels.update(
+                    (name, value) for name, value in row.items() if value is not None
+                )
+
+    def flows(
+        self,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> pl.DataFrame:
+        """
+        Returns the totals per flow, with their labels.
+
+        Args:
+            start (datetime): If given, only the traffic from this time is counted (requires a bucket).
+            end (datetime): If given, only the traffic before this time is counted (requires a bucket).
+
+        Returns:
+            DataFrame: One row per flow: flow_id, the labels, bytes_src_dst, bytes_dst_src, bytes,
+            packets_src_dst, packets_dst_src, packets, first_time, last_time, duration_s.
+        """
+        if start is None and end is None:
+            totals = {flow_id: flow.totals for flow_id, flow in self._flows.items()}
+        else:
+            if self.bucket_ns is None:
+                raise ValueError("a time interval requires a ranking with a bucket")
+            first = None if start is None else to_epoch_ns(start) // self.bucket_ns
+            last = None if end is None else -(-to_epoch_ns(end) // self.bucket_ns)
+            totals = {}
+            for (flow_id, index), values in self._buckets.items():
+                if (first is None or index >= first) and (last is None or index < last):
+                    flow_totals = totals.setdefault(flow_id, [0, 0, 0, 0])
+                    for i, value in enumerate(values):
+                        flow_totals[i] += value
+
+        label_names = sorted(
+            {name for flow in self._flows.values() for name in flow.labels}
+        )
+        rows = []
+        for flow_id, flow_totals in totals.items():
+            flow = self._flows[flow_id]
+            rows.append(
+                [
+                    flow_id,
+                    *(flow.labels.get(name) for name in label_names),
+                    *flow_totals,
+                    flow.first_time,
+                    flow.last_time,
+                ]
+            )
+        df = pl.DataFrame(
+            rows,
+            schema={
+                "flow_id": pl.Int64,
+                **{name: None for name in label_names},
+                **{name: pl.Int64 for name in _TOTALS},
+                "first_time": pl.Int64,
+                "last_time": pl.Int64,
+            },
+            orient="row",
+        )
+        return df.select(
+            "flow_id",
+            *label_names,
+            "bytes_src_dst",
+            "bytes_dst_src",
+            (pl.col("bytes_src_dst") + pl.col("bytes_dst_src")).alias("bytes"),
+            "packets_src_dst",
+            "packets_dst_src",
+            (pl.col("packets_src_dst") + pl.col("packets_dst_src")).alias("packets"),
+            *(
+                pl.from_epoch(name, time_unit="ns").dt.replace_time_zone("UTC")
+                for name in ("first_time", "last_time")
+            ),
+            ((pl.col("last_time") - pl.col("first_time")) / 1e9).alias("duration_s"),
+        )
+
+    def top(
+        self,
+        n: int = 10,
+        by: str = "bytes",
+        group_by: str | Sequence[str] | None = None,
+        start: datetime.datetime | None = None,
+        end: datetime.datetime | None = None,
+    ) -> pl.DataFrame:
+        """
+        Returns the top n flows, or labels, by bytes, packets or duration.
+
+        Args:
+            n (int): The number of rows returned.
+            by (str): "bytes", "packets" or "duration" (duration of the flow, summed per label).
+            group_by (str | Sequence): The label(s) to rank instead of the flows, e.g. "fqdn"
+                or "classification_application". The flows without this label are grouped under null.
+            start (datetime): If given, only the traffic from this time is counted (requires a bucket).
+            end (datetime): If given, only the traffic before this time is counted (requires a bucket).
+
+        Returns:
+            DataFrame: The flows (see flows()) or the labels with their totals and number of flows,
+            sorted by decreasing "by".
+        """
+        if by not in RANK_BY:
+            raise ValueError(f"by must be one of {RANK_BY}, got {by!r}")
+        df = self.flows(start, end)
+        if group_by is not None:
+            keys = [group_by] if isinstance(group_by, str) else list(group_by)
+            for key in keys:
+                if key not in df.columns:
+                    df = df.with_columns(pl.lit(None, dtype=pl.String).alias(key))
+            df = df.group_by(keys).agg(
+                pl.col(
+                    "bytes_src_dst",
+                    "bytes_dst_src",
+                    "bytes",
+                    "packets_src_dst",
+                    "packets_dst_src",
+                    "packets",
+                    "duration_s",
+                ).sum(),
+                pl.len().alias("flows"),
+            )
+        column = "duration_s" if by == "duration" else by
+        return df.sort(column, descending=True, nulls_last=True).head(n)
+
+    def reset(self) -> None:
+        """
+        Clears all the totals.
+        """
+        self._flows.clear()
+        self._buckets.clear()
+
+    def _flow(self, flow_id: int) -> _Flow:
+        flow = self._flows.get(flow_id)
+        if flow is None:
+            flow = self._flows[flow_id] = _Flow()
+        return flow
+
+    def _add_counters(self, flow_id: int, time: int, values: list[int]) -> None:
+        flow = self._flow(flow_id)
+        if self.cumulative:
+            previous = flow.counters
+            flow.counters = values
+            if previous is not None:
+                # a counter going back was reset: it counts from zero again
+                values = [v - p if v >= p else v for v, p in zip(values, previous)]
+        flow.touch(time)
+        for i, value in enumerate(values):
+            flow.totals[i] += value
+        if self.bucket_ns is not None:
+            bucket = self._buckets.setdefault(
+                (flow_id, time // self.bucket_ns), [0, 0, 0, 0]
+            )
+            for i, value in enumerate(values):
+                bucket[i] += value
+
+    def _add_report_frame(self, lf: pl.LazyFrame) -> None:
+        columns = lf.collect_schema().names()
+        if "flow_id" not in columns or "time" not in columns:
+            return
+        missing = ["ip_" + c for c in _COUNTERS if "ip_" + c not in columns]
+        if missing:
+            raise ValueError(
+                f"counter columns missing in the report dataframe: {missing}"
+            )
+        counters = [
+            pl.col("ip_" + c).fill_null(0).alias(t) for c, t in zip(_COUNTERS, _TOTALS)
+        ]
+        lf = lf.select(
+            "flow_id", pl.col("time").dt.epoch("ns").alias("time"), *counters
+        ).sort("flow_id", "time")
+        if self.cumulative:
+            # the first report of a flow continues from the counters already ingested
+            previous = pl.DataFrame(
+                [
+                    [flow_id, *flow.counters]
+                    for flow_id, flow in self._flows.items()
+                    if flow.counters is not None
+                ],
+                schema={
+                    "flow_id": pl.Int64,
+                    **{f"previous_{t}": pl.Int64 for t in _TOTALS},
+                },
+                orient="row",
+            )
+            is_first = pl.int_range(pl.len()).over("flow_id") == 0
+            lf = (
+                lf.join(previous.lazy(), on="flow_id", how="left")
+                .with_columns(pl.col(t).alias(f"counter_{t}") for t in _TOTALS)
+                .with_columns(
+                    pl.when(is_first & (pl.col(t) >= pl.col(f"previous_{t}")))
+                    .then(pl.col(t) - pl.col(f"previous_{t}"))
+                    .otherwise(ipanalysis_counter_delta(pl.col(t)).over("flow_id"))
+                    .alias(t)
+                    for t in _TOTALS
+                )
+            )
+        df = lf.collect()
+        if df.is_empty():
+            return
+
+        per_flow = df.group_by("flow_id").agg(
+            pl.col(_TOTALS).sum(),
+            pl.col("time").min().alias("first"),
+            pl.col("time").max().alias("last"),
+            *(
+                [pl.col(f"counter_{t}").last() for t in _TOTALS]
+                if self.cumulative
+                else []
+            ),
+        )
+        for row in per_flow.iter_rows(named=True):
+            flow = self._flow(row["flow_id"])
+            for i, name in enumerate(_TOTALS):
+                flow.totals[i] += row[name]
+            flow.touch(row["first"])
+            flow.touch(row["last"])
+            if self.cumulative:
+                flow.counters = [row[f"counter_{t}"] for t in _TOTALS]
+
+        if self.bucket_ns is not None:
+            per_bucket = df.group_by(
+                "flow_id", (pl.col("time") // self.bucket_ns).alias("bucket")
+            ).agg(pl.col(_TOTALS).sum())
+            for flow_id, index, *values in per_bucket.iter_rows():
+                bucket = self._buckets.setdefault((flow_id, index), [0, 0, 0, 0])
+                for i, value in enumerate(values):
+                    bucket[i] += value
+
+
+def _time_ns(time: dict | int) -> int:
+    # the time is replaced by nanoseconds once the message went through ipanalysis_update_dataframes
+    if isinstance(time, dict):
+        return time["secs"] * 1000000000 + time["nanos"]
+    return time
+
+
+def _flatten(content: dict, prefix: str = ""):
+    # same column names as fast_json_normalize with the "_" separator
+    for name, value in content.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{name}_")
+        else:
+            yield prefix + name, value
@@ -0,0 +1,147 @@
+import datetime
+from collections.abc import Sequence
+
+import polars as pl
+
+from .ndjson import ipanalysis_unnest
+
+# Per-flow time series of the REPORT messages, on equally spaced intervals.
+# example of use: throughput of the 10 biggest flows per 100 ms
+#   series = ipanalysis_resample_reports(list_of_dfs["report"], every="100ms", top_n=10)
+#   series.select("time", "flow_id", "ip_bytes_src_dst_per_s")
+
+# counters of the flows_stat, cumulated since the start of the flow
+REPORT_COUNTERS = (
+    "ip_bytes_src_dst",
+    "ip_bytes_dst_src",
+    "ip_packet_count_src_dst",
+    "ip_packet_count_dst_src",
+)
+
+
+def ipanalysis_resample_reports(
+    report: pl.DataFrame | pl.LazyFrame,
+    every: str | datetime.timedelta = "1s",
+    counters: Sequence[str] | None = None,
+    cumulative: bool = True,
+    top_n: int | None = None,
+    rank_by: Sequence[str] = ("ip_bytes_src_dst", "ip_bytes_dst_src"),
+    fill_gaps: bool = True,
+) -> pl.DataFrame:
+    """
+    Resamples the "report" dataframe into per-flow time series with fixed intervals.
+
+    The counters are turned into the amount of every interval: with cumulative counters
+    (default), the difference between two reports of the same flow is assigned to the interval
+    of the later report (a counter going back, e.g. after a reset, counts from zero again).
+    The amounts are summed per flow and interval with group_by_dynamic.
+
+    Args:
+        report (DataFrame | LazyFrame): The "report" dataframe of ipanalysis_update_dataframes,
+            or a LazyFrame of it (e.g. from scan_ipanalysis).
+        every (str | timedelta): The interval duration, e.g. "100ms" or "1s".
+        counters (Sequence): The counter columns to resample
+            (None: the REPORT_COUNTERS of the dataframe).
+        cumulative (bool): True if the counters are cumulated since the start of the flow,
+            False if they already are per report.
+        top_n (int): If given, only the top_n flows with the largest total of the rank_by counters are kept.
+        rank_by (Sequence): The counters summed to rank the flows (default: bytes in both directions),
+            the ones which are not resampled are ignored.
+        fill_gaps (bool): Adds the intervals without report between the first and last interval of
+            every flow, with 0 for all the counters.
+
+    Returns:
+        DataFrame: One row per flow and interval: time (start of the interval), flow_id, the amount
+        of every counter in the interval and its rate per second ("<counter>_per_s").
+
+    Raises:
+        ValueError: If counters are missing in the dataframe, or if no REPORT_COUNTERS is found.
+    """
+    # the "ip" Struct column of ipanalysis_read_scpi_result(..., nested=True)
+    lf = ipanalysis_unnest(report.lazy(), ["ip"]).lazy()
+    columns = lf.collect_schema().names()
+    if "time" not in columns or "flow_id" not in columns:
+        # no report
+        return pl.DataFrame(
+            schema={"time": pl.Datetime("ns", "UTC"), "flow_id": pl.Int64}
+        )
+    if counters is None:
+        counters = [counter for counter in REPORT_COUNTERS if counter in columns]
+        if not counters:
+            raise ValueError(
+                f"no counter column in the report dataframe, expected some of {REPORT_COUNTERS}"
+            )
+    missing = [counter for counter in counters if counter not in columns]
+    if missing:
+        raise ValueError(f"counter columns missing in the report dataframe: {missing}")
+
+    lf = lf.select("time", "flow_id", *counters).sort("flow_id", "time")
+    if cumulative:
+        lf = lf.with_columns(
+            ipanalysis_counter_delta(pl.col(counter)).over("flow_id").alias(counter)
+            for counter in counters
+        )
+
+    if top_n is not None:
+        ranked = [counter for counter in rank_by if counter in counters]
+        if not ranked:
+            raise ValueError(f"none of the rank_by counters {rank_by} is resampled")
+        top_flows = (
+            lf.group_by("flow_id")
+            .agg(pl.sum_horizontal(pl.col(ranked).sum()).alias("__total"))
+            .sort("__total", "flow_id", descending=[True, False])
+            .head(top_n)
+            .select("flow_id")
+        )
+        lf = lf.join(top_flows, on="flow_id", how="semi")
+
+    df = (
+        lf.group_by_dynamic("time", every=every, group_by="flow_id")
+        .agg(pl.col(counters).sum())
+        .collect()
+    )
+    if fill_gaps and not df.is_empty():
+        df = (
+            df.sort("flow_id", "time")
+            .upsample("time", every=every, group_by="flow_id", maintain_order=True)
+            .with_columns(
+                pl.col("flow_id").forward_fill(), pl.col(counters).fill_null(0)
+            )
+        )
+
+    seconds = _interval_seconds(every)
+    return df.select(
+        "time",
+        "flow_id",
+        *counters,
+        *(
+            (pl.col(counter) / seconds).alias(f"{counter}_per_s")
+            for counter in counters
+        ),
+    ).sort("time", "flow_id")
+
+
+def ipanalysis_counter_delta(counter: pl.Expr) -> pl.Expr:
+    """
+    Converts a cumulated flow counter into the increase since the previous report.
+    Use it over the flows, on reports sorted by time: ipanalysis_counter_delta(pl.col(c)).over("flow_id").
+    The first report of a flow counts from the start of the flow, and a counter going back (restarted
+    flow) counts from its restart.
+
+    Args:
+        counter (pl.Expr): The cumulated counter, e.g. pl.col("ip_bytes_src_dst").
+
+    Returns:
+        pl.Expr: The increase of the counter.
+    """
+    # the first report of a flow counts from the start of the flow
+    delta = counter.diff().fill_null(counter)
+    return pl.when(delta < 0).then(counter).otherwise(delta)
+
+
+def _interval_seconds(every: str | datetime.timedelta) -> float:
+    if isinstance(every, datetime.timedelta):
+        return every.total_seconds()
+    start = datetime.datetime(2000, 1, 1)
+    end = pl.select(pl.lit(start).dt.offset_by(every)).item()
+    return (end - start).total_seconds()
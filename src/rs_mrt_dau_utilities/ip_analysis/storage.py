@@ -0,0 +1,192 @@
+import os
+import uuid
+from pathlib import Path
+from typing import Self
+
+import polars as pl
+
+# Persist the IP analysis dataframes (see ipanalysis_init_dataframes) to a dataset on disk.
+# Layout of the dataset (hive partitioning):
+#   <path>/<category>/capture=<capture>/hour=<YYYY-MM-DDTHH>/part-<uuid>.parquet
+# example of use:
+#   with IpanalysisWriter("captures", capture="drive_test_1") as writer:
+#       for sequence in parsed_sequences:
+#           list_of_dfs = ipana.ipanalysis_init_dataframes()
+#           for message in sequence['json_messages']:
+#               ipana.ipanalysis_update_dataframes(list_of_dfs, message)
+#           writer.append(list_of_dfs)
+#   report = scan_ipanalysis("captures")["report"].filter(...).collect()
+
+_FILE_EXTENSIONS = {"parquet": ".parquet", "ipc": ".arrow"}
+_HIVE_SCHEMA = {"capture": pl.String, "hour": pl.String}
+_NULL_HOUR = "__HIVE_DEFAULT_PARTITION__"
+
+
+class IpanalysisWriter:
+    """
+    Appends the IP analysis dataframes to a Parquet or Arrow IPC dataset partitioned by capture and hour.
+
+    The rows are buffered per category and hour, and written as a new file once a buffer holds
+    row_group_size rows (or on flush/close), so every file is made of full row groups.
+    Existing files are never rewritten: appending to an existing dataset only adds new files.
+
+    Args:
+        path (str | Path): The root directory of the dataset.
+        capture (str): The name of the capture, used as partition value.
+        format (str): "parquet" (default) or "ipc" (Arrow IPC).
+        row_group_size (int): The number of rows buffered per category and hour before writing a file.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        capture: str,
+        format: str = "parquet",
+        row_group_size: int = 65536,
+    ) -> None:
+        if format not in _FILE_EXTENSIONS:
+            raise ValueError(f"format must be 'parquet' or 'ipc', got {format!r}")
+        if not capture or "/" in capture or "\\" in capture or "=" in capture:
+            raise ValueError(f"invalid capture name: {capture!r}")
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be a positive integer")
+        self.path = Path(path)
+        self.capture = capture
+        self.format = format
+        self.row_group_size = row_group_size
+        self._buffers: dict[tuple[str, str], list[pl.DataFrame]] = {}
+        self._buffered_rows: dict[tuple[str, str], int] = {}
+
+    def append(self, list_of_dfs: dict[str, pl.DataFrame]) -> None:
+        """
+        Appends the rows of the given dataframes to the dataset.
+
+        Args:
+            list_of_dfs (dict): A dictionary of DataFrames as returned by ipanalysis_update_dataframes.
+                The frames must only contain the rows not yet appended (e.g. use a fresh
+                ipanalysis_init_dataframes() for every poll).
+        """
+        for category, df in list_of_dfs.items():
+            if df.is_empty():
+                continue
+            for hour, part in _split_per_hour(df).items():
+                key = (category, hour)
+                self._buffers.setdefault(key, []).append(part)
+                self._buffered_rows[key] = self._buffered_rows.get(key, 0) + part.height
+                if self._buffered_rows[key] >= self.row_group_size:
+                    self._write(key)
+
+    def flush(self) -> None:
+        """
+        Writes all the buffered rows to the dataset.
+        """
+        for key in list(self._buffers):
+            self._write(key)
+
+    def close(self) -> None:
+        """
+        Flushes the buffered rows. The writer should not be used afterwards.
+        """
+        self.flush()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _write(self, key: tuple[str, str]) -> None:
+        parts = self._buffers.pop(key, [])
+        self._buffered_rows.pop(key, None)
+        if not parts:
+            return
+        category, hour = key
+        df = pl.concat(parts, how="diagonal_relaxed")
+        directory = self.path / category / f"capture={self.capture}" / f"hour={hour}"
+        directory.mkdir(parents=True, exist_ok=True)
+        file = directory / f"part-{uuid.uuid4().hex}{_FILE_EXTENSIONS[self.format]}"
+        # write to a temporary name first so that a reader never sees a partial file
+        tmp_file = file.with_name("." + file.name)
+        if self.format == "parquet":
+            df.write_parquet(tmp_file, row_group_size=self.row_group_size)
+        else:
+            df.write_ipc(tmp_file)
+        os.replace(tmp_file, file)
+
+
+def ipanalysis_write_dataframes(
+    list_of_dfs: dict[str, pl.DataFrame],
+    path: str | Path,
+    capture: str,
+    format: str = "parquet",
+) -> None:
+    """
+    Appends the IP analysis dataframes to a dataset in a single call (see IpanalysisWriter).
+
+    Args:
+        list_of_dfs (dict): A dictionary of DataFrames as returned by ipanalysis_update_dataframes.
+        path (str | Path): The root directory of the dataset.
+        capture (str): The name of the capture, used as partition value.
+        format (str): "parquet" (default) or "ipc" (Arrow IPC).
+    """
+    with IpanalysisWriter(path, capture, format=format) as writer:
+        writer.append(list_of_dfs)
+
+
+def scan_ipanalysis(path: str | Path) -> dict[str, pl.LazyFrame]:
+    """
+    Lazily scans a dataset written by IpanalysisWriter.
+
+    The returned LazyFrames support predicate and projection pushdown: filtering on the
+    "capture" or "hour" partition columns skips the files of the other partitions, and only
+    the selected columns are read from the remaining files.
+
+    Args:
+        path (str | Path): The root directory of the dataset.
+
+    Returns:
+        dict: A dictionary with one LazyFrame per category found in the dataset.
+    """
+    root = Path(path)
+    result: dict[str, pl.LazyFrame] = {}
+    if not root.is_dir():
+        return result
+    for category_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+        scans = []
+        for file in sorted(category_dir.glob("capture=*/hour=*/part-*")):
+            if file.suffix == _FILE_EXTENSIONS["parquet"]:
+                scans.append(
+                    pl.scan_parquet(
+                        file, hive_partitioning=True, hive_schema=_HIVE_SCHEMA
+                    )
+                )
+            elif file.suffix == _FILE_EXTENSIONS["ipc"]:
+                scans.append(
+                    pl.scan_ipc(file, hive_partitioning=True, hive_schema=_HIVE_SCHEMA)
+                )
+        if scans:
+            # the files may have different columns (e.g. a tcp section only in some reports)
+            result[category_dir.name] = pl.concat(scans, how="diagonal_relaxed")
+    return result
+
+
+def _split_per_hour(df: pl.DataFrame) -> dict[str, pl.DataFrame]:
+    """
+    Splits a dataframe by the hour of its "time" column.
+    """
+    if "time" not in df.columns:
+        return {_NULL_HOUR: df}
+    hours = df.select(
+        pl.col("time")
+        .dt.truncate("1h")
+        .dt.strftime("%Y-%m-%dT%H")
+        .fill_null(_NULL_HOUR)
+    ).to_series()
+    result: dict[str, pl.DataFrame] = {}
+    for (hour,), part in (
+        df.with_columns(hours.alias("__hour"))
+        .partition_by("__hour", as_dict=True, maintain_order=True)
+        .items()
+    ):
+        result[str(hour)] = part.drop("__hour")
+    return result
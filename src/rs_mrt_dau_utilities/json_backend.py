@@ -0,0 +1,109 @@
+import functools
+import importlib.util
+import json
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+# Pluggable JSON decoding of the IP analysis messages and of the delay measurement records.
+# example of use:
+#   set_json_backend("orjson")                     # process-wide default
+#   delay_parse_log("centralservice.log", json_backend="msgspec")  # or per call
+# "auto" (default) uses msgspec, then orjson when installed, and falls back to the stdlib json module.
+# The optional libraries are imported on first use.
+# With msgspec, the delay records are decoded into typed Structs (see delay_meas.dev): the timestamps are
+# not built as intermediate dictionaries. The IP analysis messages are returned to the user as
+# dictionaries, so they are decoded as such by every backend.
+# The decoding errors of every backend are json.JSONDecodeError (or subclasses).
+
+JSON_BACKENDS = ("auto", "msgspec", "orjson", "stdlib")
+
+JsonData = str | bytes
+
+
+@dataclass(frozen=True)
+class JsonBackend:
+    """
+    A JSON decoder.
+
+    Attributes:
+        name (str): The name of the backend ("msgspec", "orjson" or "stdlib").
+        loads (Callable): Decodes a JSON document (str or bytes) into Python objects.
+    """
+
+    name: str
+    loads: Callable[[JsonData], Any]
+
+
+_default = "auto"
+
+
+def set_json_backend(name: str) -> JsonBackend:
+    """
+    Selects the process-wide default JSON backend, used when the functions get json_backend=None.
+
+    Args:
+        name (str): "auto", "msgspec", "orjson" or "stdlib".
+
+    Returns:
+        JsonBackend: The selected backend (raises ImportError if its library is not installed).
+    """
+    global _default
+    backend = get_json_backend(name)
+    _default = name
+    return backend
+
+
+def get_json_backend(name: str | JsonBackend | None = None) -> JsonBackend:
+    """
+    Returns a JSON backend.
+
+    Args:
+        name (str | JsonBackend): "auto", "msgspec", "orjson" or "stdlib" (None: the process-wide default).
+            A JsonBackend is returned as is.
+
+    Returns:
+        JsonBackend: The backend (raises ImportError if its library is not installed).
+    """
+    if isinstance(name, JsonBackend):
+        return name
+    if name is None:
+        name = _default
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"json_backend must be one of {JSON_BACKENDS}, got {name!r}")
+    return _backend(name)
+
+
+@functools.cache
+def _backend(name: str) -> JsonBackend:
+    if name == "auto":
+        name = next(
+            (n for n in ("msgspec", "orjson") if importlib.util.find_spec(n)),
+            "stdlib",
+        )
+    if name == "msgspec":
+        import msgspec
+
+        return JsonBackend(name, msgspec_loads(msgspec.json.Decoder()))
+    if name == "orjson":
+        import orjson
+
+        # orjson.JSONDecodeError is a json.JSONDecodeError
+        return JsonBackend(name, orjson.loads)
+    return JsonBackend(name, json.loads)
+
+
+def msgspec_loads(decoder: Any) -> Callable[[JsonData], Any]:
+    """
+    Wraps a msgspec JSON decoder, raising json.JSONDecodeError on invalid (or invalid typed) documents.
+    """
+    import msgspec
+
+    def loads(data: JsonData) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as exc:
+            doc = data if isinstance(data, str) else data.decode("utf-8", "replace")
+            raise json.JSONDecodeError(str(exc), doc, 0) from exc
+
+    return loads
@@ -0,0 +1,118 @@
+import binascii
+import json
+import zlib
+from dataclasses import astuple, dataclass
+
+import polars as pl
+
+# Error policy of the parsing functions (errors argument):
+#   "raise"   the first malformed record raises its exception
+#   "skip"    malformed records are skipped, their number is logged
+#   "collect" malformed records are skipped and stored in a Quarantine, e.g.
+#       quarantine = Quarantine()
+#       parsed = delay.delay_parse_log("centralservice.log", errors="collect", quarantine=quarantine)
+#       print(quarantine.to_dataframe())
+ERROR_POLICIES = ("raise", "skip", "collect")
+
+# exceptions raised by the decoding of a malformed record
+# (binascii.Error, json.JSONDecodeError and UnicodeDecodeError are ValueError)
+PARSE_ERRORS = (ValueError, KeyError, TypeError, EOFError, zlib.error)
+
+
+@dataclass
+class QuarantinedRecord:
+    """
+    A record which could not be parsed.
+    """
+
+    source: str
+    offset: int | None
+    stage: str
+    error: str
+    record: str
+
+
+class Quarantine:
+    """
+    Collects the malformed records skipped by the parsing functions with errors="collect".
+
+    Every record has:
+    - source: the log file, or the time of the SCPI sequence
+    - offset: the line number (starting at 1) in the log file, or the index of the message in the SCPI block
+      (null when the whole block could not be decoded)
+    - stage: the failing stage (framing, base64, gzip, json, record)
+    - error: the error message
+    - record: the raw record
+    """
+
+    def __init__(self) -> None:
+        self.records: list[QuarantinedRecord] = []
+
+    def add(
+        self,
+        source: str,
+        offset: int | None,
+        stage: str,
+        error: str,
+        record: str | bytes | bytearray | memoryview,
+    ) -> None:
+        """
+        Adds a malformed record.
+        """
+        if not isinstance(record, str):
+            record = bytes(record).decode("utf-8", errors="replace")
+        self.records.append(QuarantinedRecord(source, offset, stage, error, record))
+
+    def merge(self, other: "Quarantine") -> None:
+        """
+        Adds the records collected by another Quarantine (e.g. in another thread).
+        """
+        self.records.extend(other.records)
+
+    def clear(self) -> None:
+        """
+        Removes all the records.
+        """
+        self.records.clear()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def to_dataframe(self) -> pl.DataFrame:
+        """
+        Returns the malformed records as a DataFrame with one row per record.
+        """
+        return pl.DataFrame(
+            [astuple(record) for record in self.records],
+            schema={
+                "source": pl.String,
+                "offset": pl.Int64,
+                "stage": pl.String,
+                "error": pl.String,
+                "record": pl.String,
+            },
+            orient="row",
+        )
+
+
+def check_error_policy(errors: str, quarantine: Quarantine | None) -> None:
+    """
+    Raises ValueError if the error policy is unknown, or if errors="collect" has no quarantine.
+    """
+    if errors not in ERROR_POLICIES:
+        raise ValueError(f"errors must be one of {ERROR_POLICIES}, got {errors!r}")
+    if errors == "collect" and quarantine is None:
+        raise ValueError('errors="collect" requires a quarantine')
+
+
+def error_stage(exc: BaseException) -> str:
+    """
+    Returns the parsing stage which raised the exception.
+    """
+    if isinstance(exc, binascii.Error):
+        return "base64"
+    if isinstance(exc, (zlib.error, EOFError)):
+        return "gzip"
+    if isinstance(exc, (json.JSONDecodeError, UnicodeDecodeError)):
+        return "json"
+    return "record"
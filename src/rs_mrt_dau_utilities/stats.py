@@ -0,0 +1,111 @@
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+
+import polars as pl
+
+# Opt-in instrumentation of the processing functions.
+# example of use:
+#   stats = PipelineStats()
+#   measurements = delay.extract_delay_from_log("centralservice.log", stats=stats)
+#   print(stats.to_dataframe())
+# When no stats object is given (default), the functions only test `stats is not None`
+# at every stage boundary, which keeps the overhead near zero.
+
+
+@dataclass
+class StageStats:
+    """
+    Accumulated statistics of one processing stage.
+    """
+
+    calls: int = 0
+    wall_time_s: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    rows: int = 0
+    malformed: int = 0
+
+
+class PipelineStats:
+    """
+    Collects the wall time, bytes in/out, rows produced and malformed-line counts per processing stage.
+
+    The stages are named "<function>.<stage>", e.g. "delay_parse_log.gzip" or "delay_get_segment.pivot".
+
+    Args:
+        callback (Callable): Optional function called as callback(stage, delta) every time a stage
+            is recorded, delta being a StageStats with the values of this record only.
+    """
+
+    def __init__(self, callback: Callable[[str, StageStats], None] | None = None):
+        self.stages: dict[str, StageStats] = {}
+        self.callback = callback
+
+    def record(
+        self,
+        stage: str,
+        wall_time_s: float,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+        rows: int = 0,
+        malformed: int = 0,
+        calls: int = 1,
+    ) -> None:
+        """
+        Adds a measurement to the statistics of a stage.
+        """
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.calls += calls
+        stats.wall_time_s += wall_time_s
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+        stats.rows += rows
+        stats.malformed += malformed
+        if self.callback is not None:
+            self.callback(
+                stage,
+                StageStats(calls, wall_time_s, bytes_in, bytes_out, rows, malformed),
+            )
+
+    def merge(self, other: "PipelineStats") -> None:
+        """
+        Adds the statistics collected by another PipelineStats (e.g. in another thread).
+        """
+        for stage, stats in other.stages.items():
+            self.record(
+                stage,
+                stats.wall_time_s,
+                bytes_in=stats.bytes_in,
+                bytes_out=stats.bytes_out,
+                rows=stats.rows,
+                malformed=stats.malformed,
+                calls=stats.calls,
+            )
+
+    def reset(self) -> None:
+        """
+        Clears all the collected statistics.
+        """
+        self.stages.clear()
+
+    def to_dataframe(self) -> pl.DataFrame:
+        """
+        Returns the statistics as a DataFrame with one row per stage.
+        """
+        return pl.DataFrame(
+            [{"stage": stage, **asdict(stats)} for stage, stats in self.stages.items()],
+            schema={
+                "stage": pl.String,
+                "calls": pl.Int64,
+                "wall_time_s": pl.Float64,
+                "bytes_in": pl.Int64,
+                "bytes_out": pl.Int64,
+                "rows": pl.Int64,
+                "malformed": pl.Int64,
+            },
+        )
+
+    def __repr__(self) -> str:
+        return f"PipelineStats({self.stages!r})"
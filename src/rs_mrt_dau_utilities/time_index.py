@@ -0,0 +1,125 @@
+from collections.abc import Sequence
+from typing import Any, Literal
+
+import polars as pl
+
+# Sorted time index for the repeated time-window queries on a frame
+# (delay measurement segments, IP analysis test-case windows...).
+# example of use:
+#   index = TimeIndex(list_of_dfs["report"], "time")
+#   first_test = index.slice(start_1, stop_1)
+#   tests = index.slices([(start_1, stop_1), (start_2, stop_2)])
+# The frame is sorted once (nothing is done if it is already sorted), then every query is a
+# binary search returning a zero-copy slice of the sorted frame, instead of a full is_between scan.
+
+_CLOSED = ("both", "left", "right", "none")
+
+
+class TimeIndex:
+    """
+    Sorted index over a time column of a DataFrame, answering range queries by binary search.
+
+    Args:
+        df (DataFrame): The frame to index.
+        column (str): The time column (datetime or integer).
+
+    Attributes:
+        frame (DataFrame): The frame sorted by the time column (rows with a null time at the end).
+    """
+
+    def __init__(self, df: pl.DataFrame, column: str = "time") -> None:
+        times = df.get_column(column)
+        if not times.is_sorted(nulls_last=True):
+            df = df.sort(column, nulls_last=True, maintain_order=True)
+            times = df.get_column(column)
+        self.frame = df
+        self.column = column
+        # the null times (at the end) are never part of a time window
+        self._times = times.head(len(times) - times.null_count()).set_sorted()
+
+    def __len__(self) -> int:
+        return self.frame.height
+
+    def offsets(
+        self, start: Any = None, end: Any = None, closed: str = "both"
+    ) -> tuple[int, int]:
+        """
+        Returns the offset and length of the rows between start and end in the sorted frame.
+
+        Args:
+            start: The start of the window (None: from the first row).
+            end: The end of the window (None: up to the last row with a time).
+            closed (str): The closed bounds of the window, as in Polars is_between:
+                "both" (default), "left", "right" or "none".
+        """
+        first, last = self._search([start], [end], closed)
+        return first[0], max(0, last[0] - first[0])
+
+    def slice(
+        self, start: Any = None, end: Any = None, closed: str = "both"
+    ) -> pl.DataFrame:
+        """
+        Returns the rows between start and end, as a zero-copy slice of the sorted frame.
+        """
+        offset, length = self.offsets(start, end, closed)
+        return self.frame.slice(offset, length)
+
+    def slices(
+        self,
+        windows: Sequence[tuple[Any, Any]] | None = None,
+        closed: str = "both",
+        starts: Sequence | pl.Series | None = None,
+        ends: Sequence | pl.Series | None = None,
+    ) -> list[pl.DataFrame]:
+        """
+        Returns the rows of several windows, searched in one vectorized binary search.
+
+        Args:
+            windows (Sequence): The (start, end) tuples of the windows.
+            closed (str): The closed bounds of the windows (see offsets).
+            starts (Sequence | Series): The starts of the windows, instead of windows.
+            ends (Sequence | Series): The ends of the windows, instead of windows.
+
+        Returns:
+            list: One zero-copy slice of the sorted frame per window.
+        """
+        if windows is not None:
+            starts = [start for start, _ in windows]
+            ends = [end for _, end in windows]
+        if starts is None or ends is None:
+            raise ValueError("windows, or starts and ends, must be given")
+        if len(starts) != len(ends):
+            raise ValueError("starts and ends must have the same length")
+        first, last = self._search(starts, ends, closed)
+        return [
+            self.frame.slice(offset, max(0, stop - offset))
+            for offset, stop in zip(first, last)
+        ]
+
+    def _search(
+        self, starts: Sequence | pl.Series, ends: Sequence | pl.Series, closed: str
+    ) -> tuple[list[int], list[int]]:
+        if closed not in _CLOSED:
+            raise ValueError(f"closed must be one of {_CLOSED}, got {closed!r}")
+        n = len(self._times)
+        start_side: Literal["left", "right"] = (
+            "left" if closed in ("both", "left") else "right"
+        )
+        end_side: Literal["left", "right"] = (
+            "right" if closed in ("both", "right") else "left"
+        )
+        first = self._search_sorted(starts, start_side, default=0)
+        last = self._search_sorted(ends, end_side, default=n)
+        return first, last
+
+    def _search_sorted(
+        self, values: Sequence | pl.Series, side: Literal["left", "right"], default: int
+    ) -> list[int]:
+        values = values if isinstance(values, pl.Series) else pl.Series(values)
+        if values.dtype == pl.Null:
+            return [default] * len(values)
+        found = self._times.search_sorted(values.cast(self._times.dtype), side=side)
+        # a None bound is not limiting
+        return [
+            default if value is None else offset for value, offset in zip(values, found)
+        ]
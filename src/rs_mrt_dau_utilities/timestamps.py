@@ -0,0 +1,38 @@
+import datetime
+
+# Conversions between datetimes and integer timestamps in nanoseconds since the epoch (UTC), the time
+# unit of the delay measurement records, of the IP analysis messages and of the SCPI archives.
+# example of use:
+#   to_epoch_ns(datetime.datetime(2024, 7, 15, 14, 0))   # naive datetimes are UTC
+#   from_epoch_ns(1721052000000000000)
+# The datetimes have a microsecond resolution: the nanoseconds are truncated by from_epoch_ns.
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+
+
+def to_epoch_ns(time: datetime.datetime) -> int:
+    """
+    Converts a datetime into nanoseconds since the epoch.
+
+    Args:
+        time (datetime): The time (naive: UTC).
+
+    Returns:
+        int: The nanoseconds since the epoch.
+    """
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=datetime.UTC)
+    return (time - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def from_epoch_ns(time_ns: int) -> datetime.datetime:
+    """
+    Converts nanoseconds since the epoch into a UTC datetime (microsecond resolution).
+
+    Args:
+        time_ns (int): The nanoseconds since the epoch.
+
+    Returns:
+        datetime: The UTC datetime.
+    """
+    return EPOCH + datetime.timedelta(microseconds=time_ns // 1000)
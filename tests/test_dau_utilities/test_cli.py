@@ -0,0 +1,170 @@
+import base64
+import datetime
+import gzip
+import json
+
+import polars as pl
+import pytest
+
+from rs_mrt_dau_utilities.cli import expand_globs, main
+from rs_mrt_dau_utilities.delay_meas import DelayLogIndex
+from rs_mrt_dau_utilities.ip_analysis import ScpiArchiveWriter, scan_ipanalysis
+
+
+def _write_log(path, secs: int) -> None:
+    meas = [
+        {
+            "timestamp": {"secs": secs, "nanos": 100_000},
+            "origin": "Upc",
+            "meas_id": "1",
+        },
+        {"timestamp": {"secs": secs, "nanos": 900_000}, "origin": "Ims"},
+    ]
+    data = base64.b64encode(
+        gzip.compress(json.dumps({"hash": 1, "meas": meas}).encode("utf-8"))
+    ).decode("ascii")
+    start, now, stop = (
+        datetime.datetime.fromtimestamp(t, tz=datetime.UTC).isoformat()
+        for t in (secs - 1, secs, secs + 1)
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        f"{start}  INFO centralservice::delay_meas_core: Start msg from FSW received\n"
+        f"{now} INFO centralservice::delay_meas_core: mime=application/json, data={data}\n"
+        f"{stop}  INFO centralservice::delay_meas_core: Stop msg from FSW received\n"
+    )
+
+
+def _write_scpi(path) -> None:
+    message = {"FLOW_CLOSED": {"time": {"secs": 1721052473, "nanos": 0}, "flow_id": 7}}
+    block = base64.b64encode(gzip.compress(json.dumps(message).encode("utf-8")))
+    length = str(len(block))
+    path.write_bytes(
+        f'"2024-07-15 14:07:53",#{len(length)}{length}'.encode("ascii") + block
+    )
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    # one centralservice.log per drive test directory
+    _write_log(tmp_path / "logs" / "dt1" / "centralservice.log", 1748433393)
+    _write_log(tmp_path / "logs" / "dt2" / "centralservice.log", 1748433493)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_expand_globs(logs):
+    files = expand_globs(["logs/**/*.log", "logs/dt1/centralservice.log"])
+    assert [file.parent.name for file in files] == ["dt1", "dt2"]
+    assert expand_globs(["logs/*.missing"]) == []
+
+
+def test_delay_extract(logs):
+    exit_code = main(
+        ["delay", "extract", "logs/**/*.log", "-o", "out", "--format", "csv", "-j", "1"]
+    )
+    assert exit_code == 0
+    # same file names in several directories: the directory is part of the output name
+    df = pl.read_csv(logs / "out" / "dt1_centralservice_log" / "1_1.csv")
+    assert df["delay_global_us"].to_list() == [800]
+    assert (logs / "out" / "dt2_centralservice_log" / "1_1.csv").exists()
+
+
+def test_delay_summary_process_pool(logs, capsys):
+    exit_code = main(
+        ["delay", "summary", "logs/**/*.log", "-o", "summary.parquet", "-j", "2"]
+    )
+    assert exit_code == 0
+    summary = pl.read_parquet(logs / "summary.parquet")
+    assert summary["packets"].to_list() == [1, 1]
+    assert summary["delay_max_us"].to_list() == [800.0, 800.0]
+    assert "[2/2]" in capsys.readouterr().err
+
+
+def test_delay_summary_rotated_log(tmp_path, capsys):
+    # the segment starts in the rotation and stops in the current log
+    _write_log(tmp_path / "centralservice.log.1", 1748433393)
+    lines = (tmp_path / "centralservice.log.1").read_text().splitlines(keepends=True)
+    (tmp_path / "centralservice.log.1").write_text("".join(lines[:2]))
+    (tmp_path / "centralservice.log").write_text(lines[2])
+    # the index of the log matches the pattern too
+    DelayLogIndex.open(tmp_path / "centralservice.log")
+
+    exit_code = main(
+        [
+            "delay",
+            "summary",
+            str(tmp_path / "centralservice.log*"),
+            "-o",
+            str(tmp_path / "summary.csv"),
+        ]
+    )
+    assert exit_code == 0
+    assert "centralservice.log.idx" not in capsys.readouterr().err
+    summary = pl.read_csv(tmp_path / "summary.csv")
+    assert summary["file"].to_list() == [str(tmp_path / "centralservice.log")]
+    assert summary["packets"].to_list() == [1]
+
+
+def test_failed_file(logs, capsys):
+    # truncated gzip data
+    (logs / "logs" / "broken.log").write_text(
+        "2021-10-01T07:20:00+00:00 INFO centralservice::delay_meas_core: "
+        "mime=application/json, data=H4sIAAAAAAAA\n"
+    )
+    exit_code = main(
+        ["delay", "summary", "logs/broken.log", "logs/dt1/*.log", "-j", "1"]
+    )
+    assert exit_code == 1
+    assert "failed" in capsys.readouterr().err
+
+
+def test_ipanalysis_convert(tmp_path):
+    _write_scpi(tmp_path / "capture.scpi")
+    exit_code = main(
+        [
+            "ipanalysis",
+            "convert",
+            str(tmp_path / "*.scpi"),
+            "-o",
+            str(tmp_path / "dataset"),
+            "-q",
+        ]
+    )
+    assert exit_code == 0
+    flow_closed = scan_ipanalysis(tmp_path / "dataset")["flow_closed"].collect()
+    assert flow_closed["flow_id"].to_list() == [7]
+    assert flow_closed["capture"].to_list() == ["capture"]
+
+
+def test_ipanalysis_convert_archive(tmp_path):
+    _write_scpi(tmp_path / "capture.scpi")
+    payload = (tmp_path / "capture.scpi").read_bytes()
+    # two overlapping polls returning the same sequence
+    with ScpiArchiveWriter(tmp_path / "polls.scpiarc") as archive:
+        archive.write(payload, instrument="cmx1")
+        archive.write(payload, instrument="cmx1")
+
+    exit_code = main(
+        [
+            "ipanalysis",
+            "convert",
+            str(tmp_path / "polls.scpiarc"),
+            "-o",
+            str(tmp_path / "dataset"),
+            "-q",
+        ]
+    )
+    assert exit_code == 0
+    flow_closed = scan_ipanalysis(tmp_path / "dataset")["flow_closed"].collect()
+    assert flow_closed["flow_id"].to_list() == [7]
+
+
+def test_plot(logs):
+    assert main(["plot", "logs/dt1/*.log", "-o", "plots", "-q"]) == 0
+    assert (logs / "plots" / "centralservice_1_1.html").exists()
+
+
+def test_no_match(tmp_path):
+    with pytest.raises(SystemExit):
+        main(["plot", str(tmp_path / "*.log"), "-o", str(tmp_path)])
@@ -0,0 +1,34 @@
+import base64
+import gzip
+
+import pytest
+
+from rs_mrt_dau_utilities._decode import decode_base64_gzip, gunzip, split_json_lines
+
+
+def test_gunzip():
+    assert gunzip(gzip.compress(b"abc")) == b"abc"
+    assert gunzip(bytearray(gzip.compress(b"abc"))) == b"abc"
+    assert gunzip(b"") == b""
+
+
+def test_gunzip_multiple_members():
+    assert gunzip(gzip.compress(b"abc") + gzip.compress(b"def")) == b"abcdef"
+
+
+def test_gunzip_truncated():
+    with pytest.raises(EOFError):
+        gunzip(gzip.compress(b"abc" * 100)[:-10])
+
+
+def test_decode_base64_gzip():
+    encoded = base64.b64encode(gzip.compress(b'{"a": 1}\n{"b": 2}\n'))
+    # quotes and commas around the block are ignored
+    assert decode_base64_gzip(b'"' + encoded + b'",') == b'{"a": 1}\n{"b": 2}\n'
+    assert decode_base64_gzip(encoded.decode("ascii")) == b'{"a": 1}\n{"b": 2}\n'
+
+
+def test_split_json_lines():
+    assert split_json_lines(b'{"a": 1}\n{"b": 2}\n') == ['{"a": 1}', '{"b": 2}']
+    assert split_json_lines(b"") == []
+    assert split_json_lines(b"\n") == []
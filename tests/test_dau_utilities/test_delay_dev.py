@@ -12,7 +12,11 @@ from rs_mrt_dau_utilities.delay_meas.dev import (
     delay_get_segment,
     delay_get_start_stop_segment,
     delay_parse_log,
+    delay_resolve_log_files,
 )
+from rs_mrt_dau_utilities.delay_meas.delay_meas import extract_delay_from_log
+from rs_mrt_dau_utilities.quarantine import Quarantine
+from rs_mrt_dau_utilities.stats import PipelineStats
 
 
 def test_delay_get_start_stop_segment_basic():
@@ -273,6 +277,137 @@ def test_delay_get_segment_no_upc():
     assert result == {}
 
 
+def test_delay_get_segment_long_layout():
+    # hash 1 traverses Upc twice (retransmission)
+    result_per_segment = [
+        pl.DataFrame(
+            {
+                "timestamp": [
+                    1748433393,
+                    1748433394,
+                    1748433396,
+                    1748433395,
+                    1748433396,
+                    1748433397,
+                ],
+                "hash": [1, 1, 1, 2, 2, 3],
+                "origin": ["Ims", "Upc", "Upc", "Ims", "Upc", "Ims"],
+                "meas_id": [None, 1, 1, None, 1, None],
+            }
+        ).with_columns(
+            timestamp=pl.from_epoch("timestamp", time_unit="s").dt.replace_time_zone(
+                "UTC"
+            )
+        )
+    ]
+
+    result = delay_get_segment(result_per_segment, layout="long")
+
+    expected = pl.DataFrame(
+        {
+            "hash": [1, 1, 2],
+            "hop_from": ["Ims_1", "Upc_1", "Ims_1"],
+            "hop_to": ["Upc_1", "Upc_2", "Upc_1"],
+            "delay_us": [1000000, 2000000, 1000000],
+        }
+    )
+    assert set(result.keys()) == {"1_1"}
+    assert_frame_equal(result["1_1"], expected)
+
+
+def test_delay_get_segment_max_gap():
+    # hash 1 is a ping payload sent every 10 s; the third ping never reached Upc
+    result_per_segment = [
+        pl.DataFrame(
+            {
+                "timestamp": [0, 1, 10, 11, 12, 20, 30, 31],
+                "hash": [1, 1, 1, 1, 2, 1, 1, 1],
+                "origin": ["Ims", "Upc", "Ims", "Upc", "Upc", "Ims", "Ims", "Upc"],
+                "meas_id": [None, 1, None, 1, 1, None, None, 1],
+            }
+        ).with_columns(
+            timestamp=pl.from_epoch("timestamp", time_unit="s").dt.replace_time_zone(
+                "UTC"
+            )
+        )
+    ]
+    max_gap = datetime.timedelta(seconds=2)
+
+    merged = delay_get_segment(result_per_segment)
+    assert merged["1_1"].filter(pl.col("hash") == 1)["delay_global_us"].to_list() == [
+        31000000
+    ]
+
+    result = delay_get_segment(result_per_segment, max_gap=max_gap)
+    expected = pl.DataFrame(
+        {
+            "hash": [1, 1, 2, 1],
+            "packet": [1, 2, 1, 4],
+            "Ims_1": [0, 10, None, 30],
+            "Upc_1": [1, 11, 12, 31],
+        },
+        schema_overrides={"packet": pl.UInt32},
+    ).with_columns(
+        pl.from_epoch(c, time_unit="s").dt.replace_time_zone("UTC")
+        for c in ("Ims_1", "Upc_1")
+    )
+    assert_frame_equal(
+        result["1_1"].drop("delay_global_us"), expected, check_row_order=False
+    )
+    assert result["1_1"]["delay_global_us"].to_list() == [
+        1000000,
+        1000000,
+        None,
+        1000000,
+    ]
+
+    long = delay_get_segment(result_per_segment, layout="long", max_gap=max_gap)
+    assert long["1_1"].columns == ["hash", "packet", "hop_from", "hop_to", "delay_us"]
+    assert long["1_1"]["packet"].to_list() == [1, 2, 4]
+    assert long["1_1"]["delay_us"].to_list() == [1000000] * 3
+
+    with pytest.raises(ValueError):
+        delay_get_segment(result_per_segment, max_gap=datetime.timedelta(0))
+
+    pytest.importorskip("altair")
+    from rs_mrt_dau_utilities.delay_meas.plot import plot_all
+
+    # the time axis is the first timestamp, not the packet column
+    assert plot_all(result["1_1"]).to_dict()["repeat"]["column"] == ["Ims_1"]
+
+
+def test_delay_get_segment_invalid_layout():
+    with pytest.raises(ValueError):
+        delay_get_segment([], layout="diagonal")
+
+
+def test_delay_get_segment_max_parallel(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    lines = []
+    for segment in range(3):
+        secs = 1633072800 + 100 * segment
+        lines.append(_log_line(secs, "Start msg from FSW received"))
+        for n in range(4):
+            lines.append(
+                _hash_line(secs + 1 + n, 10 * segment + n, meas_id=str(n % 2 + 1))
+            )
+        lines.append(_log_line(secs + 50, "Stop msg from FSW received"))
+    log_file.write_text("".join(lines))
+    parsed = delay_parse_log(str(log_file))
+    segments = delay_get_start_stop_segment(parsed["command"], parsed["hash"])
+
+    for layout in ("wide", "long"):
+        expected = delay_get_segment(segments, layout=layout)
+        assert list(expected) == ["1_1", "1_2", "2_1", "2_2", "3_1", "3_2"]
+        result = delay_get_segment(segments, layout=layout, max_parallel=4)
+        assert list(result) == list(expected)
+        for key in expected:
+            assert_frame_equal(result[key], expected[key])
+
+    with pytest.raises(ValueError):
+        delay_get_segment(segments, max_parallel=0)
+
+
 def create_sample_log_file(content: str) -> str:
     """Helper function to create a temporary log file with the given content."""
     temp_file = tempfile.NamedTemporaryFile(delete=False)
@@ -333,7 +468,7 @@ def test_delay_parse_log_basic():
                 "UTC"
             )
         )
-        .cast({"hash": pl.UInt64})
+        .cast({"hash": pl.UInt64, "meas_id": pl.Categorical, "origin": pl.Categorical})
     )
 
     expected_command_df = pl.DataFrame(
@@ -344,7 +479,7 @@ def test_delay_parse_log_basic():
             ],
             "command": ["Start", "Stop"],
         }
-    )
+    ).cast({"command": pl.Categorical})
 
     # Assert the results
     assert_frame_equal(result["command"], expected_command_df)
@@ -421,7 +556,7 @@ def test_delay_parse_log_no_command():
                 "UTC"
             )
         )
-        .cast({"hash": pl.UInt64})
+        .cast({"hash": pl.UInt64, "meas_id": pl.Categorical})
     )
 
     expected_command_df = pl.DataFrame({"timestamp": [], "command": []})
@@ -431,6 +566,342 @@ def test_delay_parse_log_no_command():
     assert_frame_equal(result["hash"], expected_hash_df)
 
 
+def _log_line(secs: int, text: str) -> str:
+    timestamp = datetime.datetime.fromtimestamp(secs, tz=datetime.UTC).isoformat()
+    return f"{timestamp}  INFO centralservice::delay_meas_core: {text}\n"
+
+
+def _hash_line(
+    secs: int, hash: int, meas_id: str = "1", origins: tuple = ("Upc", "Ims")
+) -> str:
+    # the first measurement carries the meas_id
+    meas = [
+        {"timestamp": {"secs": secs, "nanos": 5000 * n}, "origin": origin}
+        for n, origin in enumerate(origins)
+    ]
+    meas[0]["meas_id"] = meas_id
+    meas_data = json.dumps({"hash": hash, "meas": meas})
+    encoded_data = base64.b64encode(gzip.compress(meas_data.encode("utf-8"))).decode(
+        "utf-8"
+    )
+    return _log_line(secs, f"mime=application/json, data={encoded_data}")
+
+
+def test_delay_resolve_log_files(tmp_path):
+    for name in (
+        "centralservice.log",
+        "centralservice.log.1",
+        "centralservice.log.2.gz",
+        "centralservice.log.10.gz",
+    ):
+        (tmp_path / name).write_text("")
+
+    files = delay_resolve_log_files(str(tmp_path / "centralservice.log*"))
+
+    assert [f.rsplit("/", 1)[-1] for f in files] == [
+        "centralservice.log.10.gz",
+        "centralservice.log.2.gz",
+        "centralservice.log.1",
+        "centralservice.log",
+    ]
+
+
+def test_delay_parse_log_rotated_files(tmp_path):
+    # the segment starts in the gzipped rotation and stops in the current file
+    with gzip.open(tmp_path / "centralservice.log.1.gz", "wt") as f:
+        f.write(_log_line(1633072798, "Start msg from FSW received"))
+        f.write(_hash_line(1633072800, 1))
+    (tmp_path / "centralservice.log").write_text(
+        _hash_line(1633072801, 2) + _log_line(1633072805, "Stop msg from FSW received")
+    )
+
+    result = delay_parse_log([tmp_path / "centralservice.log", str(tmp_path / "*.gz")])
+
+    assert result["command"]["command"].to_list() == ["Start", "Stop"]
+    assert result["hash"]["hash"].to_list() == [1, 1, 2, 2]
+    segments = delay_get_start_stop_segment(result["command"], result["hash"])
+    assert len(segments) == 1
+    assert segments[0].height == 4
+
+
+def test_delay_parse_log_worker_processes(tmp_path):
+    with gzip.open(tmp_path / "centralservice.log.1.gz", "wt") as f:
+        f.write(_log_line(1633072798, "Start msg from FSW received"))
+        f.write(_hash_line(1633072800, 1))
+    (tmp_path / "centralservice.log").write_text(
+        _hash_line(1633072801, 2)
+        + _log_line(1633072802, "mime=application/json, data=H4sIAAAAAAAA")
+        + _log_line(1633072805, "Stop msg from FSW received")
+    )
+    files = str(tmp_path / "centralservice.log*")
+
+    quarantine = Quarantine()
+    stats = PipelineStats()
+    result = delay_parse_log(
+        files, max_workers=2, errors="collect", quarantine=quarantine, stats=stats
+    )
+
+    expected = delay_parse_log(files, errors="skip")
+    assert_frame_equal(result["hash"], expected["hash"])
+    assert_frame_equal(result["command"], expected["command"])
+    # the stats and the quarantine of the worker processes are merged
+    assert [record.offset for record in quarantine.records] == [2]
+    assert stats.stages["delay_parse_log.read"].calls == 2
+    with pytest.raises(ValueError):
+        delay_parse_log(files, max_workers=0)
+
+    measurements = extract_delay_from_log(files, max_workers=2, errors="skip")
+    expected_measurements = extract_delay_from_log(files, errors="skip")
+    assert list(measurements) == ["1_1"]
+    assert_frame_equal(measurements["1_1"], expected_measurements["1_1"])
+
+
+def test_delay_parse_log_no_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        delay_parse_log(str(tmp_path / "*.log"))
+
+
+def test_delay_parse_log_error_policy(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _log_line(1633072801, "mime=application/json, data=H4sIAAAAAAAA")
+        + _hash_line(1633072802, 2)
+        # the last line is truncated by a power cycle
+        + _hash_line(1633072803, 3)[:120]
+    )
+
+    with pytest.raises(EOFError):
+        delay_parse_log(str(log_file))
+
+    result = delay_parse_log(str(log_file), errors="skip")
+    assert result["hash"]["hash"].to_list() == [1, 1, 2, 2]
+
+    quarantine = Quarantine()
+    delay_parse_log(str(log_file), errors="collect", quarantine=quarantine)
+    df = quarantine.to_dataframe()
+    assert df["offset"].to_list() == [3, 5]
+    assert df["stage"].to_list() == ["gzip", "base64"]
+    assert df["source"].to_list() == [str(log_file)] * 2
+
+
+def test_delay_parse_log_filters(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _hash_line(1633072801, 2, meas_id="2")
+        # never reached Upc
+        + _hash_line(1633072802, 3, origins=("Ims", "Ims"))
+        + _hash_line(1633072810, 4)
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    result = delay_parse_log(str(log_file), meas_ids=[1])
+    # the Ims measurement of hash 2 has no meas_id
+    assert result["hash"]["hash"].to_list() == [1, 1, 2, 3, 3, 4, 4]
+
+    result = delay_parse_log(str(log_file), meas_ids=[1], require_origin="Upc")
+    assert result["hash"]["hash"].to_list() == [1, 1, 4, 4]
+
+    start = datetime.datetime(2021, 10, 1, 7, 20, 1, tzinfo=datetime.UTC)
+    end = datetime.datetime(2021, 10, 1, 7, 20, 5)
+    result = delay_parse_log(str(log_file), time_range=(start, end))
+    assert result["hash"]["hash"].to_list() == [2, 2, 3, 3]
+    result = delay_parse_log(str(log_file), time_range=(start, None))
+    assert result["hash"]["hash"].to_list() == [2, 2, 3, 3, 4, 4]
+
+    result = delay_parse_log(str(log_file), require_origin="Xyz")
+    assert result["hash"].is_empty()
+    assert result["command"].height == 2
+
+
+@pytest.mark.parametrize("backend", ["orjson", "msgspec"])
+def test_delay_parse_log_json_backend(tmp_path, backend):
+    pytest.importorskip(backend)
+    truncated = base64.b64encode(gzip.compress(b'{"hash": 3, "meas": [')).decode()
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _hash_line(1633072801, 2**64 - 1, meas_id="2")
+        # truncated JSON record
+        + _log_line(1633072802, f"mime=application/json, data={truncated}")
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    quarantine = Quarantine()
+    result = delay_parse_log(
+        str(log_file), errors="collect", quarantine=quarantine, json_backend=backend
+    )
+    expected = delay_parse_log(str(log_file), errors="skip", json_backend="stdlib")
+
+    assert_frame_equal(result["hash"], expected["hash"])
+    assert quarantine.to_dataframe()["stage"].to_list() == ["json"]
+
+
+@pytest.mark.parametrize("backend", ["orjson", "msgspec"])
+def test_delay_parse_log_json_backend_columns(tmp_path, backend):
+    pytest.importorskip(backend)
+    record = {
+        "hash": 3,
+        "meas": [
+            {"origin": "Upc", "timestamp": {"secs": 1633072802, "nanos": 0}},
+            # a field unknown to the typed decoder
+            {"timestamp": {"secs": 1633072802, "nanos": 5000}, "direction": "ul"},
+        ],
+    }
+    data = base64.b64encode(gzip.compress(json.dumps(record).encode())).decode()
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _log_line(1633072802, f"mime=application/json, data={data}")
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    result = delay_parse_log(str(log_file), json_backend=backend)
+    expected = delay_parse_log(str(log_file), json_backend="stdlib")
+
+    assert_frame_equal(result["hash"], expected["hash"])
+    assert result["hash"].columns == [
+        "timestamp",
+        "meas_id",
+        "origin",
+        "hash",
+        "direction",
+    ]
+
+
+def test_delay_parse_log_categorical(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _hash_line(1633072801, 2, meas_id="2")
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    result = delay_parse_log(str(log_file))
+    assert result["hash"].schema["origin"] == pl.Categorical
+    assert result["hash"].schema["meas_id"] == pl.Categorical
+    assert result["command"].schema["command"] == pl.Categorical
+
+    plain = delay_parse_log(str(log_file), categorical=False)
+    assert plain["hash"].schema["origin"] == pl.String
+    assert_frame_equal(result["hash"], plain["hash"], check_dtypes=False)
+
+    # the categories are shared by the frames of different logs
+    other = delay_parse_log(str(log_file))
+    joined = result["hash"].join(other["hash"], on=["hash", "origin"])
+    assert joined.height == 4
+    segments = delay_get_start_stop_segment(result["command"], result["hash"])
+    assert_frame_equal(
+        delay_get_segment(segments)["1_1"],
+        delay_get_segment(
+            delay_get_start_stop_segment(plain["command"], plain["hash"])
+        )["1_1"],
+    )
+
+
+def test_extract_delay_from_log_filters(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        + _hash_line(1633072800, 1)
+        + _hash_line(1633072801, 2, meas_id="2")
+        + _hash_line(1633072802, 3, origins=("Ims", "Ims"))
+        + _hash_line(1633072810, 4)
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    unfiltered = extract_delay_from_log(str(log_file), require_origin=None)
+    # the Upc filter pushed down into the parsing does not change the result
+    filtered = extract_delay_from_log(str(log_file))
+    assert filtered.keys() == unfiltered.keys() == {"1_1", "1_2"}
+    for key in unfiltered:
+        assert_frame_equal(filtered[key], unfiltered[key])
+
+    only_first = extract_delay_from_log(str(log_file), meas_ids=["1"])
+    assert only_first.keys() == {"1_1"}
+    assert_frame_equal(only_first["1_1"], unfiltered["1_1"])
+
+    assert extract_delay_from_log(str(log_file), meas_ids=["3"]) == {}
+
+
+def test_delay_parse_log_time_range_skips_lines(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072700, "Start msg from FSW received")
+        # corrupt, but logged long before the time range: never decoded
+        + _log_line(1633072701, "mime=application/json, data=H4sIAAAAAAAA")
+        + _hash_line(1633072702, 1)
+        + _hash_line(1633072795, 2)
+        + _hash_line(1633072800, 3)
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+    start = datetime.datetime.fromtimestamp(1633072800, tz=datetime.UTC)
+
+    stats = PipelineStats()
+    result = delay_parse_log(str(log_file), time_range=(start, None), stats=stats)
+
+    assert result["hash"]["hash"].to_list() == [3, 3]
+    # hash 2 is logged within DEFAULT_LAG before the range: decoded, then dropped
+    assert stats.stages["delay_parse_log.json"].rows == 4
+
+
+def test_extract_delay_from_log_filters_split_hash(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(1633072798, "Start msg from FSW received")
+        # the measurements of hash 1 are logged on two lines
+        + _hash_line(1633072800, 1, origins=("Ims",))
+        + _hash_line(1633072802, 1, origins=("Upc",))
+        + _hash_line(1633072804, 2, origins=("Ims",))
+        + _log_line(1633072820, "Stop msg from FSW received")
+    )
+
+    result = delay_parse_log(str(log_file), require_origin="Upc")
+    assert result["hash"]["hash"].to_list() == [1, 1]
+    # the first measurement of hash 1 is before the time range
+    start = datetime.datetime(2021, 10, 1, 7, 20, 1, tzinfo=datetime.UTC)
+    result = delay_parse_log(str(log_file), time_range=(start, None))
+    assert result["hash"]["hash"].to_list() == [2]
+
+    filtered = extract_delay_from_log(str(log_file))
+    unfiltered = extract_delay_from_log(str(log_file), require_origin=None)
+    assert_frame_equal(filtered["1_1"], unfiltered["1_1"].filter(pl.col("hash") == 1))
+    # the Ims measurement is kept: 2 s from Ims to Upc
+    assert filtered["1_1"]["delay_global_us"].to_list() == [2000000]
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_extract_delay_from_log_time_range_repeated_hash(tmp_path, index):
+    t0 = 1633072800
+    # the same ping payload every 10 s: all the packets have the hash 42
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        _log_line(t0, "Start msg from FSW received")
+        + "".join(_hash_line(t0 + 1 + 10 * n, 42) for n in range(20))
+        + _log_line(t0 + 300, "Stop msg from FSW received")
+    )
+    start = datetime.datetime.fromtimestamp(t0 + 100, tz=datetime.UTC)
+    time_range = (start, start + datetime.timedelta(seconds=50))
+
+    result = extract_delay_from_log(
+        str(log_file),
+        time_range=time_range,
+        max_gap=datetime.timedelta(seconds=1),
+        index=index,
+    )
+
+    assert result["1_1"]["packet"].to_list() == [1, 2, 3, 4, 5]
+    assert result["1_1"]["Upc_1"].to_list() == [
+        start + datetime.timedelta(seconds=1 + 10 * n) for n in range(5)
+    ]
+
+
 # Run the tests
 if __name__ == "__main__":
     pytest.main()
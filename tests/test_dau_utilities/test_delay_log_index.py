@@ -0,0 +1,153 @@
+import datetime
+
+import pytest
+from polars.testing import assert_frame_equal
+
+from rs_mrt_dau_utilities.delay_meas import DelayLogIndex
+from rs_mrt_dau_utilities.delay_meas.delay_meas import extract_delay_from_log
+from rs_mrt_dau_utilities.delay_meas.dev import (
+    delay_group_log_files,
+    delay_parse_log,
+    delay_resolve_log_files,
+)
+from rs_mrt_dau_utilities.stats import PipelineStats
+
+from .test_delay_dev import _hash_line, _log_line
+
+T0 = 1633072800
+
+
+def _utc(secs: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(secs, tz=datetime.UTC)
+
+
+def _segments_log(count: int = 3, hashes: int = 20) -> str:
+    # one segment per minute, with a hash per second
+    lines = []
+    for s in range(count):
+        start = T0 + 60 * s
+        lines.append(_log_line(start, "Start msg from FSW received"))
+        for n in range(hashes):
+            lines.append(_hash_line(start + 1 + n, 100 * s + n))
+        lines.append(_log_line(start + hashes + 2, "Stop msg from FSW received"))
+    return "".join(lines)
+
+
+def test_delay_log_index_build_and_load(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log())
+
+    index = DelayLogIndex.open(log_file, every_bytes=1024)
+
+    assert index.scanned == log_file.stat().st_size
+    assert index.lines == 66
+    assert [c[3] for c in index.commands] == ["Start", "Stop"] * 3
+    assert index.segments()[1] == (_utc(T0 + 60), _utc(T0 + 82))
+    # the samples are sorted by offset and by time
+    assert index.samples == sorted(index.samples)
+    assert (tmp_path / "centralservice.log.idx").exists()
+
+    loaded = DelayLogIndex.open(log_file)
+    assert loaded.every_bytes == 1024
+    assert loaded.samples == index.samples
+    assert loaded.commands == index.commands
+
+
+def test_delay_log_index_update(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log(count=1))
+    index = DelayLogIndex.open(log_file, every_bytes=1024)
+    assert not index.update()
+
+    # a partially written line is indexed with the next update
+    content = _segments_log(count=2)[len(_segments_log(count=1)) :]
+    with open(log_file, "a") as f:
+        f.write(content[:-10])
+    assert index.update()
+    assert len(index.segments()) == 1
+    with open(log_file, "a") as f:
+        f.write(content[-10:])
+
+    updated = DelayLogIndex.open(log_file)
+    assert len(updated.segments()) == 2
+    assert updated.commands == DelayLogIndex.open(log_file, save=False).commands
+    assert updated.lines == 44
+
+    # rotated log: indexed again
+    log_file.write_text(_segments_log(count=1, hashes=5))
+    rotated = DelayLogIndex.open(log_file)
+    assert rotated.lines == 7
+    assert rotated.segments() == [(_utc(T0), _utc(T0 + 7))]
+
+
+def test_delay_log_index_byte_range(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log())
+    index = DelayLogIndex.open(log_file, every_bytes=256)
+
+    assert index.byte_range() == (0, index.scanned, 0)
+    offset, end, line = index.byte_range(
+        _utc(T0 + 60), _utc(T0 + 82), lag=datetime.timedelta(seconds=1)
+    )
+    assert 0 < offset < end < index.scanned
+    lines = log_file.read_bytes()[offset:end].decode().splitlines()
+    assert lines[0] == log_file.read_text().splitlines()[line]
+    # the range starts before and ends after the window
+    assert _log_line(T0 + 60, "Start msg from FSW received").strip() in lines
+    assert _log_line(T0 + 82, "Stop msg from FSW received").strip() in lines
+    assert len(lines) < 66
+
+
+def test_delay_log_index_compressed(tmp_path):
+    with pytest.raises(ValueError):
+        DelayLogIndex(tmp_path / "centralservice.log.1.gz")
+
+
+def test_delay_parse_log_index(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log())
+    DelayLogIndex.open(log_file, every_bytes=256)
+    time_range = (_utc(T0 + 65), _utc(T0 + 75))
+
+    full = delay_parse_log(str(log_file), time_range=time_range)
+    stats = PipelineStats()
+    indexed = delay_parse_log(
+        str(log_file), time_range=time_range, index=True, stats=stats
+    )
+
+    # all the commands are kept: the segments are numbered as in the full log
+    assert_frame_equal(indexed["command"], full["command"])
+    assert_frame_equal(indexed["hash"], full["hash"])
+    assert indexed["hash"]["hash"].unique().sort().to_list() == list(range(104, 115))
+    assert stats.stages["delay_parse_log.read"].bytes_in < log_file.stat().st_size
+
+
+def test_extract_delay_from_log_segment(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log())
+
+    full = extract_delay_from_log(str(log_file))
+    second = extract_delay_from_log(str(log_file), segment=2)
+
+    assert second.keys() == {"2_1"}
+    assert_frame_equal(second["2_1"], full["2_1"])
+    with pytest.raises(ValueError):
+        extract_delay_from_log(str(log_file), segment=4)
+    (tmp_path / "centralservice.log.1").write_text(_segments_log(count=1))
+    with pytest.raises(ValueError):
+        extract_delay_from_log(str(tmp_path / "centralservice.log*"), segment=1)
+
+
+def test_delay_log_index_not_a_log_file(tmp_path):
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(_segments_log())
+    DelayLogIndex.open(log_file, every_bytes=256)
+    # an index being saved
+    (tmp_path / "centralservice.log.idx.tmp").write_text("{}")
+    pattern = str(tmp_path / "centralservice.log*")
+
+    assert delay_resolve_log_files(pattern) == [str(log_file)]
+    assert delay_group_log_files(pattern) == {str(log_file): [str(log_file)]}
+    assert_frame_equal(
+        delay_parse_log(pattern)["hash"], delay_parse_log(str(log_file))["hash"]
+    )
@@ -6,6 +6,7 @@ import gzip
 import json
 import logging
 
+import polars as pl
 import pytest
 
 # from polars.testing import assert_frame_equal
@@ -18,6 +19,7 @@ from rs_mrt_dau_utilities.ip_analysis.ip_analysis import (
     ipanalysis_parse_scpi_schema_result,
     ipanalysis_update_dataframes,
 )
+from rs_mrt_dau_utilities.quarantine import Quarantine
 
 
 # Helper function to create a base64-encoded gzip string
@@ -51,6 +53,40 @@ def test_valid_scpi_result():
     assert result == expected_result
 
 
+@pytest.mark.parametrize("to_buffer", [bytes, bytearray, memoryview])
+def test_valid_scpi_result_bytes(to_buffer):
+    json_messages = ['{"key": "value"}', '{"key2": "value2"}']
+    encoded_json_block = create_gzip_base64_string(json_messages)
+    scpi_result = (
+        f'"2023-10-01 12:00:00",#{len(encoded_json_block)}{encoded_json_block},'
+        f'"2023-10-01 12:01:00",#{len(encoded_json_block)}{encoded_json_block}'
+    ).encode("ascii")
+
+    result = ipanalysis_parse_scpi_result(to_buffer(scpi_result))
+
+    assert result == [
+        {
+            "time": "2023-10-01 12:00:00",
+            "json_messages": [{"key": "value"}, {"key2": "value2"}],
+        },
+        {
+            "time": "2023-10-01 12:01:00",
+            "json_messages": [{"key": "value"}, {"key2": "value2"}],
+        },
+    ]
+
+
+def test_json_result_multiple_gzip_members():
+    time = "2023-10-01T12:00:00Z"
+    compressed = gzip.compress(b'{"key1": "value1"}\n') + gzip.compress(
+        b'{"key2": "value2"}'
+    )
+
+    result = ipanalysis_parse_json_result(time, base64.b64encode(compressed))
+
+    assert result["json_messages"] == [{"key1": "value1"}, {"key2": "value2"}]
+
+
 def test_empty_scpi_result():
     scpi_result = ""
 
@@ -193,6 +229,62 @@ def test_mixed_valid_and_invalid_json():
     assert result["json_messages"][1] == {"key2": "value2"}
 
 
+@pytest.mark.parametrize("backend", ["stdlib", "orjson", "msgspec"])
+def test_mixed_valid_and_invalid_json_collect(backend):
+    if backend != "stdlib":
+        pytest.importorskip(backend)
+    json_messages = [json.dumps({"key1": "value1"}), "invalid_json_message"]
+    encoded_json_block = create_gzip_base64_string(json_messages)
+    scpi_result = (
+        f'"2023-10-01 12:00:00",#{len(encoded_json_block)}{encoded_json_block}'
+    )
+    quarantine = Quarantine()
+
+    result = ipanalysis_parse_scpi_result(
+        scpi_result, errors="collect", quarantine=quarantine, json_backend=backend
+    )
+
+    assert result[0]["json_messages"] == [{"key1": "value1"}]
+    df = quarantine.to_dataframe()
+    assert df["source"].to_list() == ["2023-10-01 12:00:00"]
+    assert df["offset"].to_list() == [1]
+    assert df["stage"].to_list() == ["json"]
+    assert df["record"].to_list() == ["invalid_json_message"]
+
+    with pytest.raises(json.JSONDecodeError):
+        ipanalysis_parse_scpi_result(scpi_result, errors="raise", json_backend=backend)
+
+
+def test_corrupt_block_skipped(caplog):
+    valid_block = create_gzip_base64_string([json.dumps({"key": "value"})])
+    # a block truncated by the end of the transfer
+    truncated_block = valid_block[:-12]
+    scpi_result = (
+        f'"2023-10-01 12:00:00",#{len(truncated_block)}{truncated_block},'
+        f'"2023-10-01 12:00:01",#{len(valid_block)}{valid_block}'
+    )
+    quarantine = Quarantine()
+
+    with caplog.at_level(logging.WARNING):
+        result = ipanalysis_parse_scpi_result(
+            scpi_result, errors="collect", quarantine=quarantine
+        )
+
+    assert result == [
+        {"time": "2023-10-01 12:00:00", "json_messages": []},
+        {"time": "2023-10-01 12:00:01", "json_messages": [{"key": "value"}]},
+    ]
+    assert quarantine.to_dataframe()["offset"].to_list() == [None]
+    assert "2023-10-01 12:00:00" in caplog.text
+
+
+def test_invalid_error_policy():
+    with pytest.raises(ValueError):
+        ipanalysis_parse_scpi_result("", errors="ignore")
+    with pytest.raises(ValueError):
+        ipanalysis_parse_scpi_result("", errors="collect")
+
+
 # Configure logging to capture log messages during tests
 logging.basicConfig(level=logging.DEBUG)
 
@@ -218,6 +310,14 @@ def test_valid_schema():
     assert result == expected_schema
 
 
+def test_valid_schema_bytes():
+    schema_result = b'#255{"$schema": "http://json-schema.org/draft-07/schema#"}\n'
+
+    result = ipanalysis_parse_scpi_schema_result(schema_result)
+
+    assert result == {"$schema": "http://json-schema.org/draft-07/schema#"}
+
+
 def test_ipanalysis_init_dataframes():
     # Call the function to test
     result = ipanalysis_init_dataframes()
@@ -296,6 +396,33 @@ def test_ipanalysis_update_dataframes_flow_started():
     assert list_of_dfs["flow_started"].width == 15
 
 
+def test_ipanalysis_update_dataframes_categorical():
+    list_of_dfs = ipanalysis_init_dataframes()
+    for flow_id, application in ((1, "YouTube"), (2, "Netflix"), (3, "YouTube")):
+        message = {
+            "UPDATE_CLASSIFICATION": {
+                "time": {"secs": 1633072801, "nanos": flow_id},
+                "flow_id": flow_id,
+                "classification": {"application": application, "protocol": "QUIC"},
+            }
+        }
+        list_of_dfs = ipanalysis_update_dataframes(list_of_dfs, message)
+
+    df = list_of_dfs["upd_classification"]
+    assert df.schema["classification_application"] == pl.Categorical
+    assert df.schema["classification_protocol"] == pl.Categorical
+    assert df["classification_application"].to_list() == [
+        "YouTube",
+        "Netflix",
+        "YouTube",
+    ]
+
+    plain = ipanalysis_update_dataframes(
+        ipanalysis_init_dataframes(), message, categorical=False
+    )
+    assert plain["upd_classification"].schema["classification_application"] == pl.String
+
+
 def test_different_reports_length():
     # Initialize the DataFrames using the ipanalysis_init_dataframes function
     list_of_dfs = ipanalysis_init_dataframes()
@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import gzip
+import json
+import threading
+import time
+
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    IpanalysisDeduplicator,
+    ScpiArchiveWriter,
+    ipanalysis_replay,
+)
+from rs_mrt_dau_utilities.ip_analysis.acquisition import (
+    IPANALYSIS_RESULT_QUERY,
+    ipanalysis_acquire,
+)
+
+
+class FakeScpiResponder:
+    """In-process SCPI responder returning one IP analysis sequence per query."""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.queries = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, instrument, command):
+        assert command == IPANALYSIS_RESULT_QUERY
+        time.sleep(self.delays.get(instrument, 0))
+        with self.lock:
+            count = self.queries.get(instrument, 0) + 1
+            self.queries[instrument] = count
+        message = json.dumps({"instrument": instrument, "count": count})
+        block = base64.b64encode(gzip.compress(message.encode("utf-8"))).decode("utf-8")
+        return f'"2023-10-01 12:00:{count:02d}",#{len(block)}{block}'
+
+
+def test_acquire_multiple_instruments():
+    responder = FakeScpiResponder()
+    results = []
+
+    def on_result(instrument, parsed_sequences):
+        results.append((instrument, parsed_sequences[0]["json_messages"][0]))
+
+    counts = asyncio.run(
+        ipanalysis_acquire(
+            {"cmx1": 0.0, "cmx2": 0.0}, responder, on_result, max_polls=3
+        )
+    )
+
+    assert counts == {"cmx1": 3, "cmx2": 3}
+    assert sorted(results, key=lambda r: (r[0], r[1]["count"])) == [
+        ("cmx1", {"instrument": "cmx1", "count": 1}),
+        ("cmx1", {"instrument": "cmx1", "count": 2}),
+        ("cmx1", {"instrument": "cmx1", "count": 3}),
+        ("cmx2", {"instrument": "cmx2", "count": 1}),
+        ("cmx2", {"instrument": "cmx2", "count": 2}),
+        ("cmx2", {"instrument": "cmx2", "count": 3}),
+    ]
+
+
+def test_acquire_slow_instrument_does_not_stall_others():
+    responder = FakeScpiResponder(delays={"slow": 0.3})
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(
+            ipanalysis_acquire(
+                {"slow": 0.01, "fast": 0.01},
+                responder,
+                lambda instrument, parsed: None,
+                stop_event=stop,
+            )
+        )
+        await asyncio.sleep(0.25)
+        stop.set()
+        return await task
+
+    counts = asyncio.run(run())
+    assert counts["slow"] <= 1
+    assert counts["fast"] >= 5
+
+
+def test_acquire_async_transport_and_backpressure():
+    in_flight = []
+    max_queued = 0
+
+    async def transport(instrument, command):
+        in_flight.append(instrument)
+        return await asyncio.to_thread(FakeScpiResponder(), instrument, command)
+
+    def slow_parser(payload):
+        time.sleep(0.02)
+        return []
+
+    def on_result(instrument, parsed_sequences):
+        nonlocal max_queued
+        max_queued = max(max_queued, len(in_flight))
+        in_flight.pop()
+
+    counts = asyncio.run(
+        ipanalysis_acquire(
+            {"cmx1": 0.0},
+            transport,
+            on_result,
+            queue_size=2,
+            parse_workers=1,
+            parser=slow_parser,
+            max_polls=10,
+        )
+    )
+    assert counts == {"cmx1": 10}
+    # queue_size payloads waiting + one being parsed + one blocked in put
+    assert max_queued <= 4
+
+
+def test_acquire_transport_error_is_logged(caplog):
+    def transport(instrument, command):
+        raise ConnectionError("instrument not reachable")
+
+    counts = asyncio.run(
+        ipanalysis_acquire({"cmx1": 0.0}, transport, lambda i, p: None, max_polls=2)
+    )
+    assert counts == {"cmx1": 0}
+    assert "Polling instrument cmx1 failed" in caplog.text
+
+
+def test_acquire_dedup_overlapping_polls():
+    # every poll returns the same sequence
+    def transport(instrument, command):
+        message = json.dumps({"instrument": instrument})
+        block = base64.b64encode(gzip.compress(message.encode("utf-8"))).decode("utf-8")
+        return f'"2023-10-01 12:00:00",#{len(block)}{block}'
+
+    results = []
+    dedup = {"cmx1": IpanalysisDeduplicator(), "cmx2": IpanalysisDeduplicator()}
+    asyncio.run(
+        ipanalysis_acquire(
+            {"cmx1": 0.0, "cmx2": 0.0},
+            transport,
+            lambda instrument, parsed: results.extend(parsed),
+            max_polls=3,
+            parse_workers=1,
+            dedup=dedup,
+        )
+    )
+
+    # one sequence per instrument, the repeated ones are skipped
+    assert len(results) == 2
+    assert dedup["cmx1"].skipped == dedup["cmx2"].skipped == 2
+
+    with pytest.raises(ValueError):
+        asyncio.run(
+            ipanalysis_acquire(
+                {"cmx3": 0.0}, transport, print, max_polls=1, dedup=dedup
+            )
+        )
+
+
+def test_acquire_archive(tmp_path):
+    responder = FakeScpiResponder()
+    with ScpiArchiveWriter(tmp_path / "capture.scpiarc") as archive:
+        asyncio.run(
+            ipanalysis_acquire(
+                {"cmx1": 0.0},
+                responder,
+                lambda i, p: None,
+                max_polls=2,
+                archive=archive,
+            )
+        )
+
+    replayed = [parsed for _, parsed in ipanalysis_replay(tmp_path / "capture.scpiarc")]
+    assert [parsed[0]["json_messages"][0]["count"] for parsed in replayed] == [1, 2]
+
+
+def test_acquire_archive_off_the_event_loop(tmp_path):
+    class SlowArchive(ScpiArchiveWriter):
+        def write(self, payload, instrument="", timestamp=None):
+            threads.append(threading.current_thread())
+            time.sleep(0.05)
+            super().write(payload, instrument=instrument, timestamp=timestamp)
+
+    threads: list[threading.Thread] = []
+    with SlowArchive(tmp_path / "capture.scpiarc") as archive:
+        asyncio.run(
+            ipanalysis_acquire(
+                {"cmx1": 0.0, "cmx2": 0.0},
+                FakeScpiResponder(),
+                lambda i, p: None,
+                max_polls=2,
+                archive=archive,
+            )
+        )
+
+    # the event loop keeps polling while the archive is written
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
+    assert len(list(ipanalysis_replay(tmp_path / "capture.scpiarc"))) == 4
+
+
+def test_acquire_requires_a_stop_condition():
+    with pytest.raises(ValueError):
+        asyncio.run(ipanalysis_acquire({"cmx1": 1.0}, FakeScpiResponder(), print))
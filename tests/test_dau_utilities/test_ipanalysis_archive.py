@@ -0,0 +1,113 @@
+import base64
+import datetime
+import gzip
+import json
+import time
+
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    ScpiArchiveReader,
+    ScpiArchiveWriter,
+    ScpiRecord,
+    ipanalysis_read_scpi_result,
+    ipanalysis_replay,
+)
+
+START = datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC)
+
+
+def _payload(flow_id: int) -> bytes:
+    message = {
+        "FLOW_CLOSED": {"time": {"secs": 1721052473, "nanos": 0}, "flow_id": flow_id}
+    }
+    block = base64.b64encode(gzip.compress(json.dumps(message).encode("utf-8")))
+    length = str(len(block))
+    return (
+        f'"2024-07-15 14:07:{flow_id:02d}",#{len(length)}{length}'.encode("ascii")
+        + block
+    )
+
+
+def _write(path, count: int, index: bool = True, step_ms: int = 100) -> None:
+    with ScpiArchiveWriter(path, index=index) as archive:
+        for i in range(count):
+            archive.write(
+                _payload(i),
+                instrument=f"cmx{i % 2 + 1}",
+                timestamp=START + datetime.timedelta(milliseconds=step_ms * i),
+            )
+
+
+def test_write_read(tmp_path):
+    path = tmp_path / "capture.scpiarc"
+    _write(path, 4)
+
+    with ScpiArchiveReader(path) as reader:
+        records = list(reader)
+        assert len(reader) == 4
+        assert [r.instrument for r in reader.records(instruments={"cmx2"})] == [
+            "cmx2",
+            "cmx2",
+        ]
+        window = reader.records(
+            start=START + datetime.timedelta(milliseconds=100),
+            end=START + datetime.timedelta(milliseconds=300),
+        )
+        assert [r.payload for r in window] == [_payload(1), _payload(2)]
+
+    assert records[0] == ScpiRecord(int(START.timestamp()) * 10**9, "cmx1", _payload(0))
+    assert records[3].time == START + datetime.timedelta(milliseconds=300)
+
+
+def test_append_and_missing_footer(tmp_path):
+    path = tmp_path / "capture.scpiarc"
+    _write(path, 2)
+    with ScpiArchiveWriter(path) as archive:
+        archive.write("text payload", instrument="cmx1", timestamp=0)
+        assert len(archive) == 3
+
+    # a writer which was not closed (e.g. a crash) leaves an archive without footer
+    _write(tmp_path / "crash.scpiarc", 3, index=False)
+    with open(tmp_path / "crash.scpiarc", "ab") as file:
+        file.write(b"\x10\x00")  # incomplete record
+
+    with ScpiArchiveReader(path) as reader:
+        assert [r.payload for r in reader][2] == b"text payload"
+    with ScpiArchiveReader(tmp_path / "crash.scpiarc") as reader:
+        assert len(reader) == 3
+
+
+def test_corrupt_and_invalid(tmp_path):
+    path = tmp_path / "capture.scpiarc"
+    _write(path, 1)
+    data = bytearray(path.read_bytes())
+    data[40] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with ScpiArchiveReader(path) as reader, pytest.raises(ValueError, match="corrupt"):
+        list(reader)
+
+    (tmp_path / "capture.scpi").write_bytes(_payload(1))
+    with pytest.raises(ValueError, match="not a SCPI archive"):
+        ScpiArchiveReader(tmp_path / "capture.scpi")
+
+
+def test_replay(tmp_path):
+    path = tmp_path / "capture.scpiarc"
+    _write(path, 3)
+
+    replayed = list(ipanalysis_replay(path, parser=ipanalysis_read_scpi_result))
+    assert [parsed["flow_closed"]["flow_id"].to_list() for _, parsed in replayed] == [
+        [0],
+        [1],
+        [2],
+    ]
+
+    with ScpiArchiveReader(path) as reader:
+        t0 = time.monotonic()
+        assert len(list(reader.replay(pacing="original", speed=2.0))) == 3
+        # 200 ms of acquisition replayed at twice the speed
+        assert time.monotonic() - t0 >= 0.09
+        with pytest.raises(ValueError):
+            list(reader.replay(pacing="slow"))
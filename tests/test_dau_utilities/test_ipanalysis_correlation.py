@@ -0,0 +1,88 @@
+import datetime
+
+import polars as pl
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import ipanalysis_correlate_delays
+
+START = datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC)
+
+
+def _time(seconds: float) -> datetime.datetime:
+    return START + datetime.timedelta(seconds=seconds)
+
+
+def _report(rows: list[tuple[float, int, int]]) -> pl.DataFrame:
+    # (seconds since the start, flow_id, cumulative bytes src->dst)
+    return pl.DataFrame(
+        {
+            "flow_id": [flow_id for _, flow_id, _ in rows],
+            "ip_bytes_src_dst": [counter for _, _, counter in rows],
+            "time": [_time(t) for t, _, _ in rows],
+        }
+    ).with_columns(pl.col("time").dt.cast_time_unit("ns"))
+
+
+def _delays(rows: list[tuple[float, int, int]]) -> pl.DataFrame:
+    # wide layout of delay_get_segment: (seconds since the start, delay in us, flow_id)
+    return pl.DataFrame(
+        {
+            "hash": list(range(len(rows))),
+            "Upc_1": [_time(t) for t, _, _ in rows],
+            "Ims_1": [
+                _time(t) + datetime.timedelta(microseconds=d) for t, d, _ in rows
+            ],
+            "delay_global_us": [d for _, d, _ in rows],
+            "flow": [flow for _, _, flow in rows],
+        }
+    ).with_columns(pl.col("Upc_1", "Ims_1").dt.cast_time_unit("ns"))
+
+
+REPORT = _report([(0.5, 1, 100), (1.5, 1, 300), (0.2, 2, 50), (1.2, 2, 80)])
+DELAYS = {
+    "1_1": _delays([(0.1, 100, 1), (0.9, 300, 2)]),
+    "1_2": _delays([(1.0, 50, 1), (1.7, 70, 1), (5.0, 900, 2)]),
+}
+
+
+def test_correlate_delays_per_interval():
+    result = ipanalysis_correlate_delays(
+        REPORT, DELAYS, every="1s", counters=["ip_bytes_src_dst"], quantiles=[0.5]
+    )
+
+    assert result.columns == [
+        "time",
+        "flow_id",
+        "ip_bytes_src_dst",
+        "ip_bytes_src_dst_per_s",
+        "delay_packets",
+        "delay_mean_us",
+        "delay_p50_us",
+        "delay_max_us",
+    ]
+    assert result["time"].to_list() == [_time(0), _time(0), _time(1), _time(1)]
+    assert result["flow_id"].to_list() == [1, 2, 1, 2]
+    assert result["ip_bytes_src_dst"].to_list() == [100, 50, 200, 30]
+    # the packet at 5s has no interval
+    assert result["delay_packets"].to_list() == [2, 2, 2, 2]
+    assert result["delay_mean_us"].to_list() == [200.0, 200.0, 60.0, 60.0]
+    assert result["delay_max_us"].to_list() == [300.0, 300.0, 70.0, 70.0]
+
+
+def test_correlate_delays_per_flow():
+    result = ipanalysis_correlate_delays(
+        REPORT, DELAYS, every=datetime.timedelta(seconds=1), flow_id="flow"
+    )
+
+    assert result["flow_id"].to_list() == [1, 2, 1, 2]
+    assert result["delay_packets"].to_list() == [1, 1, 2, None]
+    assert result["delay_mean_us"].to_list() == [100.0, 300.0, 60.0, None]
+    assert "delay_p95_us" in result.columns
+
+
+def test_correlate_delays_needs_wide_layout():
+    long_df = pl.DataFrame(
+        {"hash": [1], "hop_from": ["Upc_1"], "hop_to": ["Ims_1"], "delay_us": [5]}
+    )
+    with pytest.raises(ValueError):
+        ipanalysis_correlate_delays(REPORT, long_df)
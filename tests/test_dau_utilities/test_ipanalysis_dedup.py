@@ -0,0 +1,108 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    IpanalysisDeduplicator,
+    ipanalysis_parse_scpi_result,
+    ipanalysis_read_scpi_result,
+)
+from rs_mrt_dau_utilities.quarantine import Quarantine
+from rs_mrt_dau_utilities.stats import PipelineStats
+
+
+def _sequence(second: int, block: bytes | None = None) -> bytes:
+    if block is None:
+        message = {
+            "FLOW_STARTED": {
+                "time": {"secs": 1721052473 + second, "nanos": 0},
+                "flow_id": second,
+            }
+        }
+        block = base64.b64encode(gzip.compress(json.dumps(message).encode("utf-8")))
+    length = str(len(block))
+    return (
+        f'"2024-07-15 14:07:{second:02d}",#{len(length)}{length}'.encode("ascii")
+        + block
+    )
+
+
+def _poll(seconds) -> bytes:
+    return b",".join(_sequence(second) for second in seconds)
+
+
+def test_overlapping_polls_are_skipped():
+    dedup = IpanalysisDeduplicator()
+
+    first = ipanalysis_parse_scpi_result(_poll([1, 2, 3]), dedup=dedup)
+    # the last sequence of the first poll is in the middle of the second one
+    second = ipanalysis_parse_scpi_result(_poll([2, 3, 4, 5]), dedup=dedup)
+
+    assert [sequence["time"] for sequence in first] == [
+        "2024-07-15 14:07:01",
+        "2024-07-15 14:07:02",
+        "2024-07-15 14:07:03",
+    ]
+    assert [sequence["time"] for sequence in second] == [
+        "2024-07-15 14:07:04",
+        "2024-07-15 14:07:05",
+    ]
+    assert dedup.counters() == {
+        "checked": 7,
+        "skipped": 2,
+        "skipped_bytes": dedup.skipped_bytes,
+    }
+    assert dedup.skipped_bytes > 0
+    assert len(dedup) == 5
+
+
+def test_repeated_block_is_not_decoded():
+    corrupt = _sequence(1, b"H4sIAAAAAAAA")
+    dedup = IpanalysisDeduplicator()
+    quarantine = Quarantine()
+    stats = PipelineStats()
+
+    for _ in range(3):
+        ipanalysis_parse_scpi_result(
+            corrupt, errors="collect", quarantine=quarantine, dedup=dedup, stats=stats
+        )
+
+    # only the first occurrence reached the gzip decoder
+    assert len(quarantine) == 1
+    assert dedup.skipped == 2
+    assert stats.stages["ipanalysis_parse_scpi_result.dedup"].rows == 1
+
+
+def test_same_time_different_block():
+    dedup = IpanalysisDeduplicator()
+    ipanalysis_parse_scpi_result(_sequence(1), dedup=dedup)
+
+    other = _sequence(1, base64.b64encode(gzip.compress(b'{"FLOW_CLOSED": {}}')))
+    assert len(ipanalysis_parse_scpi_result(other, dedup=dedup)) == 1
+    assert dedup.skipped == 0
+
+
+def test_read_scpi_result_dedup():
+    dedup = IpanalysisDeduplicator()
+
+    first = ipanalysis_read_scpi_result(_poll([1, 2]), dedup=dedup)
+    second = ipanalysis_read_scpi_result(_poll([1, 2, 3]), dedup=dedup)
+
+    assert first["flow_started"]["flow_id"].to_list() == [1, 2]
+    assert second["flow_started"]["flow_id"].to_list() == [3]
+
+
+def test_max_sequences():
+    dedup = IpanalysisDeduplicator(max_sequences=2)
+    ipanalysis_parse_scpi_result(_poll([1, 2, 3]), dedup=dedup)
+
+    # the oldest fingerprint was forgotten
+    assert len(ipanalysis_parse_scpi_result(_poll([1, 3]), dedup=dedup)) == 1
+    dedup.clear()
+    assert dedup.counters()["checked"] == 0
+    assert len(dedup) == 0
+
+    with pytest.raises(ValueError):
+        IpanalysisDeduplicator(max_sequences=0)
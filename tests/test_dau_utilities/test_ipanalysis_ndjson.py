@@ -0,0 +1,275 @@
+import base64
+import datetime
+import gzip
+import json
+
+import polars as pl
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    IpanalysisRanking,
+    ipanalysis_init_dataframes,
+    ipanalysis_read_ndjson,
+    ipanalysis_read_scpi_result,
+    ipanalysis_resample_reports,
+    ipanalysis_unnest,
+    ipanalysis_update_dataframes,
+)
+from rs_mrt_dau_utilities.quarantine import Quarantine
+
+
+def _endpoint(ip: str, geo=None) -> dict:
+    return {"ip": ip, "flags": {"V4": {"is_loopback": False}}, "geo": geo, "port": 443}
+
+
+MESSAGES = [
+    {
+        "FLOW_STARTED": {
+            "time": {"secs": 1721052473, "nanos": 0},
+            "flow_id": 1,
+            "source": _endpoint("10.0.0.1"),
+            "destination": _endpoint("10.0.0.2"),
+        }
+    },
+    {
+        "FLOW_STARTED": {
+            "time": {"secs": 1721052473, "nanos": 500},
+            "flow_id": 2,
+            "source": _endpoint("10.0.0.3", geo={"country": "US"}),
+            "destination": _endpoint("10.0.0.4"),
+        }
+    },
+    {
+        "UPDATE_CLASSIFICATION": {
+            "time": {"secs": 1721052474, "nanos": 0},
+            "flow_id": 1,
+            "classification": {"application": "YouTube", "protocol": "QUIC"},
+        }
+    },
+    {
+        "REPORT": {
+            "flows_stat": [
+                {"flow_id": 1, "ip": {"bytes_src_dst": 10}, "tcp": None},
+                {
+                    "flow_id": 2,
+                    "ip": {"bytes_src_dst": 20},
+                    "tcp": {"max_segment_size": 1412},
+                },
+            ],
+            "time": {"secs": 1721052475, "nanos": 0},
+        }
+    },
+    {"REPORT": {"flows_stat": [], "time": {"secs": 1721052476, "nanos": 0}}},
+]
+
+
+def _block(lines: list[str]) -> bytes:
+    return base64.b64encode(gzip.compress("\n".join(lines).encode("utf-8")))
+
+
+def _scpi(blocks: list[bytes]) -> bytes:
+    parts = []
+    for second, block in enumerate(blocks):
+        length = str(len(block))
+        time = f"2024-07-15 14:07:{53 + second}"
+        parts.append(f'"{time}",#{len(length)}{length}'.encode("ascii") + block + b",")
+    return b"".join(parts)
+
+
+SCPI_RESULT = _scpi(
+    [
+        _block([json.dumps(m) for m in MESSAGES[:2]]),
+        _block([json.dumps(m) for m in MESSAGES[2:]]),
+    ]
+)
+
+
+def test_read_scpi_result_nested():
+    list_of_dfs = ipanalysis_read_scpi_result(SCPI_RESULT, nested=True)
+
+    assert list_of_dfs.keys() == ipanalysis_init_dataframes().keys()
+    flow_started = list_of_dfs["flow_started"]
+    assert flow_started.columns == ["time", "flow_id", "source", "destination"]
+    assert isinstance(flow_started.schema["source"], pl.Struct)
+    assert flow_started["time"].to_list() == [
+        datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC),
+        datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC),
+    ]
+
+    report = list_of_dfs["report"]
+    assert report["flow_id"].to_list() == [1, 2]
+    assert report.columns[-1] == "time"
+    assert report["tcp"].struct.field("max_segment_size").to_list() == [None, 1412]
+
+    classification = list_of_dfs["upd_classification"]
+    assert classification["classification"].struct.field("application").to_list() == [
+        "YouTube"
+    ]
+    assert list_of_dfs["upd_ssl"].is_empty()
+
+
+def test_read_scpi_result_flat_matches_update_dataframes():
+    flat = ipanalysis_read_scpi_result(SCPI_RESULT)
+
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message in json.loads(json.dumps(MESSAGES)):
+        list_of_dfs = ipanalysis_update_dataframes(list_of_dfs, message)
+
+    # the null "geo" of the first flow is a null column of its own when flattened message by message
+    assert set(list_of_dfs["flow_started"].columns) - set(
+        flat["flow_started"].columns
+    ) == {"source_geo"}
+    for key in ("flow_started", "upd_classification"):
+        assert set(flat[key].columns) <= set(list_of_dfs[key].columns)
+        assert flat[key].schema == pl.Schema(
+            {name: list_of_dfs[key].schema[name] for name in flat[key].columns}
+        )
+    assert flat["report"]["ip_bytes_src_dst"].to_list() == [10, 20]
+
+
+def test_unnest():
+    flow_started = ipanalysis_read_scpi_result(SCPI_RESULT, nested=True)["flow_started"]
+
+    source = ipanalysis_unnest(flow_started, ["source"])
+    assert "source_ip" in source.columns
+    assert "source_flags_V4_is_loopback" in source.columns
+    assert source["source_geo_country"].to_list() == [None, "US"]
+    assert isinstance(source.schema["destination"], pl.Struct)
+
+    lazy = ipanalysis_unnest(flow_started.lazy()).collect()
+    assert not any(isinstance(dtype, pl.Struct) for dtype in lazy.dtypes)
+
+
+def test_read_ndjson(tmp_path):
+    path = tmp_path / "messages.ndjson"
+    path.write_text("\n".join(json.dumps(m) for m in MESSAGES))
+
+    list_of_dfs = ipanalysis_read_ndjson(path)
+
+    assert list_of_dfs["flow_started"].height == 2
+    assert list_of_dfs["report"].height == 2
+    assert ipanalysis_read_ndjson(b"")["report"].is_empty()
+
+
+def test_read_scpi_result_malformed_blocks():
+    scpi_result = _scpi(
+        [
+            _block([json.dumps(MESSAGES[0])]),
+            b"H4sIAAAAAAAA",
+            _block([json.dumps(MESSAGES[1]), '{"FLOW_CLOSED": {"time"']),
+        ]
+    )
+
+    with pytest.raises(EOFError):
+        ipanalysis_read_scpi_result(scpi_result, errors="raise")
+
+    quarantine = Quarantine()
+    list_of_dfs = ipanalysis_read_scpi_result(
+        scpi_result, errors="collect", quarantine=quarantine
+    )
+    assert list_of_dfs["flow_started"]["flow_id"].to_list() == [1]
+    assert quarantine.to_dataframe()["stage"].to_list() == ["gzip", "json"]
+
+
+def test_update_dataframes_nested():
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message in json.loads(json.dumps(MESSAGES[:2])):
+        list_of_dfs = ipanalysis_update_dataframes(list_of_dfs, message, nested=True)
+
+    flow_started = list_of_dfs["flow_started"]
+    assert flow_started.width == 4
+    assert flow_started["source"].struct.field("geo").struct.field(
+        "country"
+    ).to_list() == [
+        None,
+        "US",
+    ]
+
+
+COLUMNS = {"flow_started": ["source_ip", "destination"], "report": ["ip_*"]}
+
+
+def test_read_scpi_result_columns():
+    list_of_dfs = ipanalysis_read_scpi_result(
+        SCPI_RESULT, nested=False, columns=COLUMNS
+    )
+
+    assert list_of_dfs["flow_started"].columns == [
+        "time",
+        "flow_id",
+        "source_ip",
+        "destination_ip",
+        "destination_flags_V4_is_loopback",
+        "destination_geo",
+        "destination_port",
+    ]
+    report = list_of_dfs["report"]
+    assert report.columns == ["flow_id", "ip_bytes_src_dst", "time"]
+    assert report["ip_bytes_src_dst"].to_list() == [10, 20]
+    # no selection: all the columns
+    assert "classification_application" in list_of_dfs["upd_classification"].columns
+
+    with pytest.raises(ValueError, match="unknown dataframes"):
+        ipanalysis_read_scpi_result(SCPI_RESULT, columns={"reports": ["ip_*"]})
+
+
+def test_update_dataframes_columns():
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message in json.loads(json.dumps(MESSAGES)):
+        list_of_dfs = ipanalysis_update_dataframes(
+            list_of_dfs, message, columns=COLUMNS
+        )
+    native = ipanalysis_read_scpi_result(SCPI_RESULT, nested=False, columns=COLUMNS)
+
+    assert list_of_dfs["report"].columns == ["flow_id", "ip_bytes_src_dst", "time"]
+    assert set(list_of_dfs["flow_started"].columns) == set(
+        native["flow_started"].columns
+    )
+
+    nested = ipanalysis_update_dataframes(
+        ipanalysis_init_dataframes(),
+        json.loads(json.dumps(MESSAGES[1])),
+        nested=True,
+        columns=COLUMNS,
+    )
+    assert nested["flow_started"]["source"].struct.fields == ["ip"]
+
+
+@pytest.mark.parametrize("nested", [False, True], ids=["flat", "nested"])
+def test_read_scpi_result_resample_and_rank(nested):
+    reports = [
+        {
+            "REPORT": {
+                "flows_stat": [
+                    {
+                        "flow_id": flow_id,
+                        "ip": {
+                            "bytes_src_dst": 1000 * second * flow_id,
+                            "bytes_dst_src": 0,
+                            "packet_count_src_dst": 10 * second * flow_id,
+                            "packet_count_dst_src": 0,
+                        },
+                    }
+                    for flow_id in (1, 2)
+                ],
+                "time": {"secs": 1721052473 + second, "nanos": 0},
+            }
+        }
+        for second in (1, 2)
+    ]
+    list_of_dfs = ipanalysis_read_scpi_result(
+        _scpi([_block([json.dumps(m) for m in reports])]), nested=nested
+    )
+
+    series = ipanalysis_resample_reports(list_of_dfs["report"])
+    assert series.sort("flow_id", "time")["ip_bytes_src_dst"].to_list() == [
+        1000,
+        1000,
+        2000,
+        2000,
+    ]
+    ranking = IpanalysisRanking()
+    ranking.update_dataframes(list_of_dfs)
+    top = ranking.top(by="bytes")
+    assert top["flow_id"].to_list() == [2, 1]
+    assert top["bytes"].to_list() == [4000, 2000]
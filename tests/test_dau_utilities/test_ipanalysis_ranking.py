@@ -0,0 +1,133 @@
+import copy
+import datetime
+
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    IpanalysisRanking,
+    ipanalysis_init_dataframes,
+    ipanalysis_update_dataframes,
+)
+
+START = 1721052473
+
+
+def _time(seconds: float) -> dict:
+    return {"secs": START + int(seconds), "nanos": int(seconds % 1 * 1e9)}
+
+
+def _report(seconds: float, counters: dict[int, int]) -> dict:
+    # counters: cumulative bytes src->dst per flow (packets = bytes / 100)
+    return {
+        "REPORT": {
+            "time": _time(seconds),
+            "flows_stat": [
+                {
+                    "flow_id": flow_id,
+                    "ip": {
+                        "bytes_src_dst": value,
+                        "bytes_dst_src": 0,
+                        "packet_count_src_dst": value // 100,
+                        "packet_count_dst_src": 0,
+                    },
+                }
+                for flow_id, value in counters.items()
+            ],
+        }
+    }
+
+
+MESSAGES = [
+    {"FLOW_STARTED": {"time": _time(0), "flow_id": 1}},
+    {"UPDATE_FQDN": {"time": _time(0), "flow_id": 1, "fqdn": "www.youtube.com"}},
+    {
+        "UPDATE_CLASSIFICATION": {
+            "time": _time(0),
+            "flow_id": 1,
+            "classification": {"application": "YouTube"},
+        }
+    },
+    {"FLOW_STARTED": {"time": _time(0.5), "flow_id": 2}},
+    {"UPDATE_FQDN": {"time": _time(0.5), "flow_id": 2, "fqdn": "www.youtube.com"}},
+    {"FLOW_STARTED": {"time": _time(1), "flow_id": 3}},
+    {"UPDATE_FQDN": {"time": _time(1), "flow_id": 3, "fqdn": "www.google.com"}},
+    _report(1, {1: 1000, 2: 200, 3: 500}),
+    _report(2, {1: 1500, 2: 400, 3: 2500}),
+    _report(3, {1: 1600, 2: 300, 3: 2600}),
+    {"FLOW_CLOSED": {"time": _time(9), "flow_id": 3}},
+]
+
+
+def _frames(messages):
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message in copy.deepcopy(messages):
+        ipanalysis_update_dataframes(list_of_dfs, message)
+    return list_of_dfs
+
+
+def test_ranking_live():
+    ranking = IpanalysisRanking()
+    for message in MESSAGES:
+        ranking.update(message)
+
+    top = ranking.top(2)
+    assert top["flow_id"].to_list() == [3, 1]
+    # flow 2 counter was reset at the last report: 200 + 200 + 300
+    flows = ranking.flows().sort("flow_id")
+    assert flows["bytes"].to_list() == [1600, 700, 2600]
+    assert flows["classification_application"].to_list() == ["YouTube", None, None]
+
+    by_fqdn = ranking.top(by="packets", group_by="fqdn")
+    assert by_fqdn["fqdn"].to_list() == ["www.google.com", "www.youtube.com"]
+    assert by_fqdn["packets"].to_list() == [26, 23]
+    assert by_fqdn["flows"].to_list() == [1, 2]
+
+    assert ranking.top(1, by="duration")["flow_id"].to_list() == [3]
+
+
+def test_ranking_after_the_fact():
+    live = IpanalysisRanking(bucket=datetime.timedelta(seconds=1))
+    for message in MESSAGES:
+        live.update(message)
+    after = IpanalysisRanking(bucket=datetime.timedelta(seconds=1))
+    after.update_dataframes(_frames(MESSAGES))
+
+    assert after.flows().sort("flow_id").equals(live.flows().sort("flow_id"))
+
+
+def test_ranking_history_then_live():
+    ranking = IpanalysisRanking()
+    ranking.update_dataframes(_frames(MESSAGES[:8]))
+    for message in MESSAGES[8:]:
+        ranking.update(message)
+
+    assert ranking.flows().sort("flow_id")["bytes"].to_list() == [1600, 700, 2600]
+
+
+def test_ranking_interval():
+    ranking = IpanalysisRanking(bucket=datetime.timedelta(seconds=1))
+    for message in MESSAGES:
+        ranking.update(message)
+    start = datetime.datetime.fromtimestamp(START + 2, tz=datetime.UTC)
+
+    top = ranking.top(
+        by="bytes", start=start, end=start + datetime.timedelta(seconds=1)
+    )
+
+    assert top["flow_id"].to_list() == [3, 1, 2]
+    assert top["bytes"].to_list() == [2000, 500, 200]
+
+
+def test_ranking_invalid_arguments():
+    with pytest.raises(ValueError):
+        IpanalysisRanking().top(by="flows")
+    with pytest.raises(ValueError):
+        IpanalysisRanking().top(start=datetime.datetime(2024, 7, 15))
+
+
+def test_ranking_missing_counters():
+    list_of_dfs = _frames(MESSAGES)
+    list_of_dfs["report"] = list_of_dfs["report"].drop("ip_packet_count_dst_src")
+
+    with pytest.raises(ValueError, match="ip_packet_count_dst_src"):
+        IpanalysisRanking().update_dataframes(list_of_dfs)
@@ -0,0 +1,95 @@
+import datetime
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from rs_mrt_dau_utilities.ip_analysis import (
+    ipanalysis_counter_delta,
+    ipanalysis_resample_reports,
+)
+
+
+def _report(rows: list[tuple[float, int, int]]) -> pl.DataFrame:
+    # (seconds since the start, flow_id, cumulative bytes src->dst)
+    start = datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC)
+    return pl.DataFrame(
+        {
+            "flow_id": [flow_id for _, flow_id, _ in rows],
+            "ip_bytes_src_dst": [counter for _, _, counter in rows],
+            "time": [start + datetime.timedelta(seconds=t) for t, _, _ in rows],
+        }
+    ).with_columns(pl.col("time").dt.cast_time_unit("ns"))
+
+
+def test_resample_cumulative_counters():
+    report = _report(
+        [
+            (0.2, 1, 100),
+            (0.7, 1, 300),
+            (1.1, 2, 50),
+            (2.4, 1, 1000),
+            # counter reset
+            (3.5, 1, 40),
+        ]
+    )
+
+    result = ipanalysis_resample_reports(report, every="1s")
+
+    start = datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC)
+    expected = pl.DataFrame(
+        {
+            "time": [start + datetime.timedelta(seconds=s) for s in (0, 1, 1, 2, 3)],
+            "flow_id": [1, 1, 2, 1, 1],
+            "ip_bytes_src_dst": [300, 0, 50, 700, 40],
+            "ip_bytes_src_dst_per_s": [300.0, 0.0, 50.0, 700.0, 40.0],
+        }
+    ).with_columns(pl.col("time").dt.cast_time_unit("ns"))
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("every", ["500ms", datetime.timedelta(milliseconds=500)])
+def test_resample_rate(every):
+    report = _report([(0.1, 1, 100), (0.6, 1, 300)])
+
+    result = ipanalysis_resample_reports(report, every=every)
+
+    assert result["ip_bytes_src_dst"].to_list() == [100, 200]
+    assert result["ip_bytes_src_dst_per_s"].to_list() == [200.0, 400.0]
+
+
+def test_resample_top_n():
+    report = _report([(0.1, 1, 100), (0.1, 2, 500), (0.1, 3, 300), (1.1, 1, 1000)])
+
+    result = ipanalysis_resample_reports(report.lazy(), top_n=2, fill_gaps=False)
+
+    assert set(result["flow_id"]) == {1, 2}
+
+
+def test_counter_delta():
+    report = _report([(0.2, 1, 100), (0.4, 2, 50), (0.7, 1, 300), (1.1, 1, 40)])
+
+    result = report.sort("flow_id", "time").with_columns(
+        ipanalysis_counter_delta(pl.col("ip_bytes_src_dst")).over("flow_id")
+    )
+
+    # first report of a flow and counter reset: the counter itself
+    assert result["ip_bytes_src_dst"].to_list() == [100, 200, 40, 50]
+
+
+def test_resample_empty_report():
+    result = ipanalysis_resample_reports(pl.DataFrame())
+
+    assert result.is_empty()
+    assert result.columns == ["time", "flow_id"]
+
+
+def test_resample_missing_counters():
+    report = _report([(0.1, 1, 100)])
+
+    with pytest.raises(ValueError, match="ip_packet_count_src_dst"):
+        ipanalysis_resample_reports(report, counters=["ip_packet_count_src_dst"])
+    with pytest.raises(ValueError):
+        ipanalysis_resample_reports(report.drop("ip_bytes_src_dst"))
+    with pytest.raises(ValueError):
+        ipanalysis_resample_reports(report, top_n=1, rank_by=["ip_bytes_dst_src"])
@@ -0,0 +1,80 @@
+import polars as pl
+import pytest
+
+from rs_mrt_dau_utilities.ip_analysis.ip_analysis import (
+    ipanalysis_init_dataframes,
+    ipanalysis_update_dataframes,
+)
+from rs_mrt_dau_utilities.ip_analysis.storage import (
+    IpanalysisWriter,
+    ipanalysis_write_dataframes,
+    scan_ipanalysis,
+)
+
+
+def make_report(secs, flow_id, tcp=None):
+    flow = {"flow_id": flow_id, "ip": {"bytes_src_dst": 100 * flow_id}}
+    if tcp is not None:
+        flow["tcp"] = tcp
+    return {"REPORT": {"flows_stat": [flow], "time": {"secs": secs, "nanos": 0}}}
+
+
+def make_dfs(*messages):
+    list_of_dfs = ipanalysis_init_dataframes()
+    for message in messages:
+        ipanalysis_update_dataframes(list_of_dfs, message)
+    return list_of_dfs
+
+
+def test_write_and_scan_partitions(tmp_path):
+    # 2024-01-01 10:00:00 and 11:00:00 UTC
+    dfs = make_dfs(make_report(1704103200, 1), make_report(1704106800, 2))
+    ipanalysis_write_dataframes(dfs, tmp_path, capture="cap1")
+
+    assert sorted(p.name for p in (tmp_path / "report" / "capture=cap1").iterdir()) == [
+        "hour=2024-01-01T10",
+        "hour=2024-01-01T11",
+    ]
+    scans = scan_ipanalysis(tmp_path)
+    assert set(scans.keys()) == {"report"}
+    result = scans["report"].sort("time").collect()
+    assert result["flow_id"].to_list() == [1, 2]
+    assert result["capture"].to_list() == ["cap1", "cap1"]
+    assert result["hour"].to_list() == ["2024-01-01T10", "2024-01-01T11"]
+
+
+def test_append_with_different_columns(tmp_path):
+    with IpanalysisWriter(tmp_path, capture="cap1", row_group_size=2) as writer:
+        writer.append(make_dfs(make_report(1704103200, 1)))
+        writer.append(make_dfs(make_report(1704103201, 2, tcp={"window_scale": 8})))
+    # appending to an existing dataset adds new files
+    ipanalysis_write_dataframes(
+        make_dfs(make_report(1704103202, 3)), tmp_path, capture="cap2"
+    )
+
+    report = scan_ipanalysis(tmp_path)["report"]
+    result = report.sort("time").collect()
+    assert result["flow_id"].to_list() == [1, 2, 3]
+    assert result["tcp_window_scale"].to_list() == [None, 8, None]
+
+    filtered = report.filter(pl.col("capture") == "cap2").select("flow_id").collect()
+    assert filtered["flow_id"].to_list() == [3]
+
+
+def test_row_group_flush(tmp_path):
+    writer = IpanalysisWriter(tmp_path, capture="cap1", format="ipc", row_group_size=2)
+    writer.append(make_dfs(make_report(1704103200, 1)))
+    # buffered, nothing written yet
+    assert scan_ipanalysis(tmp_path) == {}
+    writer.append(make_dfs(make_report(1704103201, 2)))
+    assert scan_ipanalysis(tmp_path)["report"].collect().height == 2
+    writer.append(make_dfs(make_report(1704103202, 3)))
+    writer.close()
+    assert scan_ipanalysis(tmp_path)["report"].collect().height == 3
+
+
+def test_invalid_arguments(tmp_path):
+    with pytest.raises(ValueError):
+        IpanalysisWriter(tmp_path, capture="cap1", format="csv")
+    with pytest.raises(ValueError):
+        IpanalysisWriter(tmp_path, capture="a/b")
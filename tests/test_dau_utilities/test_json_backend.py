@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from rs_mrt_dau_utilities import json_backend
+from rs_mrt_dau_utilities.json_backend import get_json_backend, set_json_backend
+
+
+@pytest.fixture
+def default_backend():
+    yield
+    set_json_backend("auto")
+
+
+def test_get_json_backend():
+    assert get_json_backend("stdlib").loads('{"a": 1}') == {"a": 1}
+    assert get_json_backend("auto").name in ("msgspec", "orjson", "stdlib")
+    backend = get_json_backend("stdlib")
+    assert get_json_backend(backend) is backend
+
+    with pytest.raises(ValueError):
+        get_json_backend("simdjson")
+
+
+@pytest.mark.parametrize("name", ["stdlib", "orjson", "msgspec"])
+def test_decode_error_is_json_decode_error(name):
+    if name != "stdlib":
+        pytest.importorskip(name)
+    backend = get_json_backend(name)
+    assert backend.loads(b'{"hash": 18446744073709551615}') == {
+        "hash": 18446744073709551615
+    }
+    with pytest.raises(json.JSONDecodeError):
+        backend.loads('{"FLOW_CLOSED": {"time"')
+
+
+def test_set_json_backend(default_backend):
+    assert set_json_backend("stdlib").name == "stdlib"
+    assert get_json_backend().name == "stdlib"
+    assert json_backend.get_json_backend(None).loads("[1]") == [1]
@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+
+# the heavy libraries (plotting) and the acquisition loop must only be imported on first use
+_CHECK_IMPORTS = """
+import json, sys
+import rs_mrt_dau_utilities.delay_meas
+import rs_mrt_dau_utilities.ip_analysis
+import rs_mrt_dau_utilities.cli
+heavy = ("altair", "fast_json_normalize", "pandas", "rs_mrt_dau_utilities.ip_analysis.acquisition")
+print(json.dumps([m for m in heavy if m in sys.modules]))
+"""
+
+
+def test_import_does_not_load_heavy_libraries():
+    output = subprocess.run(
+        [sys.executable, "-c", _CHECK_IMPORTS],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert json.loads(output) == []
+
+
+def test_plot_all_is_loaded_on_first_use():
+    import rs_mrt_dau_utilities.delay_meas as delay
+    from rs_mrt_dau_utilities.delay_meas import plot
+
+    assert delay.plot_all is plot.plot_all
+    assert "plot_all" in delay.__all__
+
+
+def test_ipanalysis_acquire_is_loaded_on_first_use():
+    from rs_mrt_dau_utilities import ip_analysis
+    from rs_mrt_dau_utilities.ip_analysis import acquisition
+
+    assert ip_analysis.ipanalysis_acquire is acquisition.ipanalysis_acquire
+    assert "ipanalysis_acquire" in ip_analysis.__all__
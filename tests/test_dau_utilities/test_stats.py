@@ -0,0 +1,94 @@
+import base64
+import gzip
+import json
+
+from rs_mrt_dau_utilities.delay_meas.delay_meas import extract_delay_from_log
+from rs_mrt_dau_utilities.ip_analysis.ip_analysis import (
+    ipanalysis_init_dataframes,
+    ipanalysis_parse_scpi_result,
+    ipanalysis_update_dataframes,
+)
+from rs_mrt_dau_utilities.stats import PipelineStats
+
+
+def _scpi_result(lines: list[str]) -> bytes:
+    block = base64.b64encode(gzip.compress("\n".join(lines).encode("utf-8")))
+    length = str(len(block))
+    return f'"2024-07-15 14:07:53",#{len(length)}{length}'.encode("ascii") + block
+
+
+def test_pipeline_stats_record_and_callback():
+    deltas = []
+    stats = PipelineStats(callback=lambda stage, delta: deltas.append((stage, delta)))
+    stats.record("a.b", 0.5, bytes_in=10, rows=2)
+    stats.record("a.b", 0.25, bytes_in=5, rows=1, malformed=1)
+
+    assert stats.stages["a.b"].calls == 2
+    assert stats.stages["a.b"].wall_time_s == 0.75
+    assert stats.stages["a.b"].bytes_in == 15
+    assert stats.stages["a.b"].rows == 3
+    assert stats.stages["a.b"].malformed == 1
+    assert [stage for stage, _ in deltas] == ["a.b", "a.b"]
+    assert deltas[1][1].rows == 1
+
+    df = stats.to_dataframe()
+    assert df.columns == [
+        "stage",
+        "calls",
+        "wall_time_s",
+        "bytes_in",
+        "bytes_out",
+        "rows",
+        "malformed",
+    ]
+    assert df.height == 1
+
+    stats.reset()
+    assert stats.stages == {}
+    assert stats.to_dataframe().height == 0
+
+
+def test_ipanalysis_stats():
+    message = {"FLOW_CLOSED": {"time": {"secs": 1, "nanos": 0}, "flow_id": 1}}
+    scpi_result = _scpi_result([json.dumps(message), "{not json"])
+    stats = PipelineStats()
+
+    sequences = ipanalysis_parse_scpi_result(scpi_result, stats=stats)
+    list_of_dfs = ipanalysis_init_dataframes()
+    for msg in sequences[0]["json_messages"]:
+        ipanalysis_update_dataframes(list_of_dfs, msg, stats=stats)
+
+    assert stats.stages["ipanalysis_parse_scpi_result.regex"].rows == 1
+    assert stats.stages["ipanalysis_parse_json_result.json"].rows == 1
+    assert stats.stages["ipanalysis_parse_json_result.json"].malformed == 1
+    gzip_stats = stats.stages["ipanalysis_parse_json_result.gzip"]
+    assert gzip_stats.bytes_out > 0
+    assert stats.stages["ipanalysis_update_dataframes.concat"].rows == 1
+
+
+def test_delay_stats(tmp_path):
+    meas = [
+        {
+            "timestamp": {"secs": 1748433393, "nanos": 100},
+            "origin": "Upc",
+            "meas_id": "1",
+        },
+        {"timestamp": {"secs": 1748433393, "nanos": 900}, "origin": "Ims"},
+    ]
+    data = base64.b64encode(
+        gzip.compress(json.dumps({"hash": 1, "meas": meas}).encode("utf-8"))
+    ).decode("ascii")
+    log_file = tmp_path / "centralservice.log"
+    log_file.write_text(
+        "2025-05-28T11:56:33.000000+00:00  INFO centralservice::delay_meas_core: Start msg from FSW received\n"
+        f"2025-05-28T11:56:33.500000+00:00 INFO centralservice::delay_meas_core: mime=application/json, data={data}\n"
+        "2025-05-28T11:56:34.000000+00:00  INFO centralservice::delay_meas_core: Stop msg from FSW received\n"
+    )
+    stats = PipelineStats()
+
+    measurements = extract_delay_from_log(str(log_file), stats=stats)
+
+    assert list(measurements) == ["1_1"]
+    assert stats.stages["delay_parse_log.json"].rows == 2
+    assert stats.stages["delay_get_start_stop_segment.filter"].rows == 2
+    assert "delay_get_segment.pivot" in stats.stages
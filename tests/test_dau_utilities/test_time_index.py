@@ -0,0 +1,86 @@
+import datetime
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from rs_mrt_dau_utilities.ip_analysis import ipanalysis_split_windows
+from rs_mrt_dau_utilities.time_index import TimeIndex
+
+START = datetime.datetime(2024, 7, 15, 14, 7, 53, tzinfo=datetime.UTC)
+
+
+def _frame(seconds: list[int | None]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "time": [
+                None if s is None else START + datetime.timedelta(seconds=s)
+                for s in seconds
+            ],
+            "value": list(range(len(seconds))),
+        }
+    ).with_columns(pl.col("time").dt.cast_time_unit("ns"))
+
+
+@pytest.mark.parametrize("closed", ["both", "left", "right", "none"])
+def test_slice_matches_is_between(closed):
+    df = _frame([5, 1, 3, 3, None, 8, 1, 6])
+    index = TimeIndex(df)
+
+    for start, end in [(1, 3), (3, 6), (0, 10), (4, 4), (3, 3), (9, 12), (6, 2)]:
+        start_time = START + datetime.timedelta(seconds=start)
+        end_time = START + datetime.timedelta(seconds=end)
+        expected = df.filter(
+            pl.col("time").is_between(start_time, end_time, closed=closed)
+        )
+        result = index.slice(start_time, end_time, closed=closed)
+        assert_frame_equal(result, expected.sort("time", maintain_order=True))
+
+
+def test_slice_open_bounds_and_integer_times():
+    df = pl.DataFrame({"timestamp": [10, 20, 30, 40], "hash": [1, 2, 3, 4]})
+    index = TimeIndex(df, "timestamp")
+
+    assert index.slice(None, 20)["hash"].to_list() == [1, 2]
+    assert index.slice(30, None)["hash"].to_list() == [3, 4]
+    assert index.slice()["hash"].to_list() == [1, 2, 3, 4]
+    assert index.offsets(15, 35) == (1, 2)
+
+
+def test_slices_vectorized():
+    df = _frame([0, 1, 2, 3, 4, 5])
+    index = TimeIndex(df)
+    windows = [
+        (START, START + datetime.timedelta(seconds=1)),
+        (START + datetime.timedelta(seconds=4), None),
+    ]
+
+    first, second = index.slices(windows)
+
+    assert first["value"].to_list() == [0, 1]
+    assert second["value"].to_list() == [4, 5]
+    assert index.slices([]) == []
+    with pytest.raises(ValueError):
+        index.slices(windows, closed="open")
+
+
+def test_ipanalysis_split_windows():
+    list_of_dfs = {
+        "report": _frame([3, 0, 12, 11]),
+        "flow_started": _frame([0, 10]),
+        "upd_ssl": pl.DataFrame(),
+    }
+    windows = [
+        (START, START + datetime.timedelta(seconds=5)),
+        (
+            START + datetime.timedelta(seconds=10),
+            START + datetime.timedelta(seconds=15),
+        ),
+    ]
+
+    first, second = ipanalysis_split_windows(list_of_dfs, windows)
+
+    assert first["report"]["value"].to_list() == [1, 0]
+    assert second["report"]["value"].to_list() == [3, 2]
+    assert first["flow_started"].height == second["flow_started"].height == 1
+    assert first["upd_ssl"].is_empty()
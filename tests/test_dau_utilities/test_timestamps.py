@@ -0,0 +1,19 @@
+import datetime
+
+from rs_mrt_dau_utilities.timestamps import EPOCH, from_epoch_ns, to_epoch_ns
+
+
+def test_epoch_ns_round_trip():
+    time = datetime.datetime(2024, 7, 15, 14, 7, 53, 123456, tzinfo=datetime.UTC)
+
+    assert to_epoch_ns(time) == 1721052473123456000
+    assert from_epoch_ns(1721052473123456789) == time
+    assert to_epoch_ns(EPOCH) == 0
+
+
+def test_epoch_ns_naive_and_other_timezone():
+    paris = datetime.timezone(datetime.timedelta(hours=2))
+    time = datetime.datetime(2024, 7, 15, 16, 7, 53, tzinfo=paris)
+
+    # naive datetimes are UTC
+    assert to_epoch_ns(time) == to_epoch_ns(datetime.datetime(2024, 7, 15, 14, 7, 53))